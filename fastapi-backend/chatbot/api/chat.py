@@ -9,6 +9,7 @@ from chatbot.services.llm_service import get_llm_service
 from chatbot.services.vector_service import get_vector_service
 from chatbot.services.chat_service import ChatService
 from chatbot.utils.performance_optimizations import ResponseCache
+from chatbot.utils.shared_cache import content_digest
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -50,7 +51,7 @@ async def chat_endpoint(
         chat_service = await get_chat_service()
 
         # Check cache first
-        cache_key = f"{message.user_id}:{hash(message.message)}:{message.use_rag}:{message.group_id or ''}"
+        cache_key = f"{message.user_id}:{content_digest(message.message)}:{message.use_rag}:{message.group_id or ''}"
         cached_response = await cache.get(cache_key)
         
         if cached_response:
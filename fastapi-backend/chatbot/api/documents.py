@@ -1,15 +1,15 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
-import tempfile
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
+from fastapi.routing import APIRoute
+import asyncio
+import hashlib
 import os
 from pathlib import Path
+from typing import Callable, List
 
-from chatbot.models.api_models import DocumentInfo, FileType
-from chatbot.services.vector_service import get_vector_service
+from chatbot.core.config import settings
+from chatbot.models.api_models import FileType, IngestJobInfo
+from chatbot.services.ingest_jobs import FINISHED, IngestQueueFull, get_ingest_queue
 
-router = APIRouter(
-    prefix="/knowledge-base",  # Add this prefix here
-    tags=["RAG"]
-)
 
 _EXT_TO_FILETYPE = {
     ".pdf": FileType.PDF,
@@ -21,9 +21,96 @@ _EXT_TO_FILETYPE = {
     ".pptx": FileType.PPTX,
 }
 
-@router.post("/upload", response_model=DocumentInfo)
+UPLOAD_READ_CHUNK = 1024 * 1024  # bytes copied per read while spooling an upload
+UPLOAD_FORM_OVERHEAD = 64 * 1024  # multipart boundaries, part headers and the filename
+
+
+def _too_large() -> HTTPException:
+    limit_mb = settings.max_file_size / (1024 * 1024)
+    return HTTPException(status_code=413, detail=f"File too large (limit {limit_mb:.0f} MB)")
+
+
+class _BodyLimitRoute(APIRoute):
+    """
+    Rejects request bodies over max_file_size (plus multipart overhead) before the
+    form is parsed: Starlette would otherwise spool the whole body to disk before
+    the endpoint runs. A declared Content-Length is checked up front; chunked
+    bodies are counted while they are received. What gets through is at most
+    UPLOAD_FORM_OVERHEAD bytes over the limit, and _spool_upload enforces the
+    exact file size.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request):
+            limit = settings.max_file_size + UPLOAD_FORM_OVERHEAD
+            length = request.headers.get("content-length", "")
+            if length.isdigit() and int(length) > limit:
+                raise _too_large()
+            received = 0
+
+            async def receive():
+                nonlocal received
+                message = await request.receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                    if received > limit:
+                        raise _too_large()
+                return message
+
+            return await handler(Request(request.scope, receive))
+
+        return limited_handler
+
+
+router = APIRouter(
+    prefix="/knowledge-base",  # Add this prefix here
+    tags=["RAG"],
+    route_class=_BodyLimitRoute,
+)
+
+
+def _write_chunk(out, digest, chunk: bytes):
+    digest.update(chunk)
+    out.write(chunk)
+
+
+async def _spool_upload(file: UploadFile, destination: str):
+    """
+    Copy the upload to `destination` chunk by chunk, enforcing max_file_size. Returns (size, sha256).
+    Disk writes and hashing run in a worker thread so large uploads don't stall the event loop.
+    """
+    if file.size is not None and file.size > settings.max_file_size:
+        raise _too_large()
+    loop = asyncio.get_event_loop()
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        out = await loop.run_in_executor(None, open, destination, "wb")
+        try:
+            while True:
+                chunk = await file.read(UPLOAD_READ_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.max_file_size:
+                    raise _too_large()
+                await loop.run_in_executor(None, _write_chunk, out, digest, chunk)
+        finally:
+            await loop.run_in_executor(None, out.close)
+    except BaseException:
+        try:
+            os.unlink(destination)
+        except FileNotFoundError:
+            pass
+        raise
+    return size, digest.hexdigest()
+
+
+@router.post("/upload", response_model=IngestJobInfo, status_code=202)
 async def upload_document(file: UploadFile = File(...), group_id: str = Query(default="__default__")):
-    """Upload and process document for RAG (per-group)"""
+    """Queue a document for RAG ingestion (per-group); poll /jobs/{job_id} for progress"""
 
     # Validate file type
     file_extension = Path(file.filename).suffix.lower()
@@ -32,29 +119,46 @@ async def upload_document(file: UploadFile = File(...), group_id: str = Query(de
 
     file_type = _EXT_TO_FILETYPE[file_extension]
 
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_file_path = tmp_file.name
+    # Save the upload where the ingestion queue picks it up
+    ingest_queue = await get_ingest_queue()
+    file_path = ingest_queue.new_upload_path(file_extension)
+    file_size, file_digest = await _spool_upload(file, file_path)
 
     try:
-        # Process document
-        vector_service = await get_vector_service()
-        result = await vector_service.add_document(tmp_file_path, file.filename, file_type, group_id)
-
-        return DocumentInfo(
-            filename=result["filename"],
-            file_type=file_type,
-            chunk_count=result["chunk_count"],
-            status=result["status"],
-        )
-
+        job = await ingest_queue.submit(group_id, file.filename, file_type, file_path, file_size, file_digest)
+    except IngestQueueFull as e:
+        os.unlink(file_path)
+        raise HTTPException(status_code=503, detail=f"Too many uploads in progress, try again later ({e})")
     except Exception as e:
+        os.unlink(file_path)
         raise HTTPException(status_code=500, detail=f"Upload error: {e}")
-    finally:
-        # Clean up temporary file
-        try:
-            os.unlink(tmp_file_path)
-        except Exception:
-            pass
\ No newline at end of file
+    return IngestJobInfo(**job)
+
+
+@router.get("/jobs", response_model=List[IngestJobInfo])
+async def list_ingest_jobs(group_id: str = Query(default="__default__"), limit: int = Query(default=50, ge=1, le=200)):
+    """Most recent ingestion jobs of a group"""
+    ingest_queue = await get_ingest_queue()
+    return [IngestJobInfo(**job) for job in await ingest_queue.list(group_id, limit)]
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobInfo)
+async def get_ingest_job(job_id: str):
+    """Status and progress of an ingestion job"""
+    ingest_queue = await get_ingest_queue()
+    job = await ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return IngestJobInfo(**job)
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=IngestJobInfo)
+async def cancel_ingest_job(job_id: str):
+    """Cancel a queued or running ingestion job"""
+    ingest_queue = await get_ingest_queue()
+    job = await ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return IngestJobInfo(**await ingest_queue.cancel(job_id))
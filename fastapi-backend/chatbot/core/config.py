@@ -32,16 +32,109 @@ class Settings(BaseSettings):
 
     # LLM Configuration
     llm_model: str = "gpt-3.5-turbo"
-    embedding_model: str = "text-embedding-3-small"
+    embedding_model: str = "text-embedding-ada-002"  # used for ingestion and queries; changing it needs a re-ingest
     llm_temperature: float = 0.7
 
     # Performance Configuration
     max_workers: int = 3
+    openai_max_connections: int = 50  # cap on concurrent upstream HTTP connections
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry: float = 30.0  # seconds an idle connection is kept open
+    openai_timeout: float = 60.0
     max_file_size: int = 50 * 1024 * 1024  # 50MB
+    ingest_manifest_path: str = "./data/ingest_manifest.db"  # file digests of ingested documents
+    ingest_manifest_ttl: int = 365 * 24 * 3600
+    ingest_batch_size: int = 64  # chunks per embed + upsert call
+    ingest_queue_size: int = 4  # batches parsed ahead of the upserts
+    ingest_upsert_concurrency: int = 2
+    ingest_jobs_db_path: str = "./data/ingest_jobs.db"  # durable queue of upload jobs
+    ingest_upload_dir: str = "./data/uploads"  # uploaded files waiting for their job
+    ingest_workers: int = 2  # documents ingested concurrently
+    ingest_max_pending: int = 100  # queued jobs before uploads are refused
+    ingest_job_ttl: int = 7 * 24 * 3600  # seconds finished jobs stay queryable
+    ingest_heartbeat_interval: float = 5.0  # seconds between a worker's progress/heartbeat writes
+    ingest_owner_timeout: float = 60.0  # silence after which another worker requeues a running job
+    ingest_poll_interval: float = 2.0  # seconds idle workers wait before looking for new jobs
+
+    # Usage Limit Configuration
+    daily_group_limit: int = 10
+    usage_flush_interval: float = 2.0  # seconds between batched counter flushes
+    usage_max_drift: int = 3  # unflushed calls per group that force an early flush
+    usage_resync_interval: float = 30.0  # seconds before re-reading a group's remote counters
+
+    # Bot Message Outbox Configuration
+    outbox_max_queue: int = 1000
+    outbox_batch_size: int = 50
+    outbox_max_wait: float = 0.05  # seconds to wait for more messages before committing a batch
+    outbox_max_retries: int = 5
+
+    # WebSocket Bot Channel Configuration
+    ws_max_inflight: int = 4  # concurrent bot requests per connection
+    ws_send_queue_size: int = 256  # outgoing events buffered before producers wait
+
+    # Session Store Configuration
+    session_max_entries: int = 10000
+    session_idle_ttl: float = 6 * 3600  # seconds of inactivity before a session is dropped
+    session_max_bytes: int = 64 * 1024 * 1024
+
+    # Conversation Memory (prompt view of the history)
+    memory_recent_turns: int = 4  # turns always kept verbatim
+    memory_max_tokens: int = 1500  # cap on summary + verbatim history in a prompt
+    memory_summary_max_tokens: int = 250
+    memory_summarize_every_turns: int = 2  # fold older turns into the summary in batches of this size
+    explain_context_max_tokens: int = 800  # @explain conversation context in main.py
+
+    # Chat History Backend Configuration
+    history_backend: str = "memory"  # "memory" or "sqlite"
+    history_db_path: str = "./data/chat_history.db"
+    history_max_messages: int = 100  # most recent messages loaded per session
+    history_flush_interval: float = 0.05  # seconds appends are buffered before a write
+    history_read_batch_window: float = 0.002  # seconds concurrent loads wait to share a query
+
+    # RAG Chain Cache
+    rag_chain_cache_size: int = 32  # compiled chains kept (per model and pool slot)
+    contextualize_skip_standalone: bool = True  # no rewrite for questions without referential cues
+    contextualize_cache_size: int = 4096
+    contextualize_cache_ttl: int = 3600
+    contextualize_history_messages: int = 4  # recent messages that key a cached rewrite
+    # "serial": rewrite, then retrieve; "speculative": retrieve for the raw query while the rewrite runs
+    rag_retrieval_mode: str = "serial"
+    speculative_match_threshold: float = 0.8  # word overlap at which the raw query's results are kept
+    enable_context_packing: bool = True  # merge/dedupe retrieved chunks before the QA prompt
+    context_token_budget: int = 1500
+    context_dedupe_threshold: float = 0.9  # word overlap at which a chunk counts as a duplicate
+
+    # Vector Backend Configuration
+    vector_backend: str = "pinecone"  # "pinecone" or "local"
+    # "per_group": one index per group; "shared": one index (PINECONE_INDEX_NAME), a namespace per group.
+    # Move existing groups over with scripts/migrate_pinecone_to_shared_index.py
+    pinecone_index_mode: str = "per_group"
+    pinecone_handle_cache_size: int = 256  # per-group Index / vector store objects kept
+    pinecone_index_list_ttl: float = 60.0  # seconds a list_indexes() result is trusted
+    local_vector_dir: str = "./data/vectors"
+    local_ann_min_vectors: int = 20000  # groups this large get an approximate (IVF) index
+    local_ann_nprobe: int = 8
+
+    # Embedding Batching Configuration
+    enable_embedding_batching: bool = True
+    embedding_batch_max_wait: float = 0.005  # seconds to collect concurrent queries
+    embedding_batch_max_size: int = 64
 
     # Caching Configuration
     enable_caching: bool = True
     cache_ttl: int = 3600  # 1 hour
+    explain_cache_max_bytes: int = 16 * 1024 * 1024  # @explain response cache in main.py
+    shared_cache_path: str = "./data/shared_cache.db"  # cross-worker response cache
+    shared_cache_l1_size: int = 1000
+    enable_semantic_cache: bool = True
+    semantic_cache_threshold: float = 0.92  # min cosine similarity to reuse an answer
+    semantic_cache_max_entries: int = 500  # per group
+    semantic_cache_max_bytes: int = 32 * 1024 * 1024
+    enable_embedding_cache: bool = True  # query embeddings, keyed by (model, text digest)
+    embedding_cache_l1_size: int = 10000
+    embedding_cache_persist: bool = True
+    embedding_cache_dir: str = "./data/embeddings"
+    embedding_cache_max_bytes: int = 256 * 1024 * 1024  # per vector file; compacted to the newest half when exceeded
 
     # CORS Configuration
     cors_origins: List[str] = ["*"]
@@ -26,6 +26,7 @@ class Message(BaseModel):
     new_chat: bool = Field(default=False, description="Start a new chat session")
     use_rag: bool = Field(default=True, description="Enable RAG for this query")
     group_id: Optional[str] = Field(default=None, description="Group identifier for per-group context")
+    session_id: Optional[str] = Field(default=None, description="Conversation session within the group")
 
     @field_validator("user_id")
     def user_id_must_not_be_empty(cls, v):
@@ -65,6 +66,29 @@ class DocumentInfo(BaseModel):
     status: str
     file_size: Optional[int] = None
     upload_timestamp: Optional[str] = None
+    chunks_added: Optional[int] = None
+    chunks_removed: Optional[int] = None
+    warnings: List[str] = []
+
+
+class IngestJobInfo(BaseModel):
+    job_id: str
+    group_id: str
+    filename: str
+    file_type: FileType
+    status: str  # queued, running, succeeded, failed, cancelled
+    cancel_requested: bool = False
+    file_size: Optional[int] = None
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    vectors_upserted: int = 0
+    vectors_removed: int = 0
+    error: Optional[str] = None
+    result: Optional[DocumentInfo] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
 
 
 class DocumentUploadResponse(BaseModel):
@@ -168,14 +192,14 @@ class UsageStats(BaseModel):
     cache_hit_rate: Optional[float] = None
 
 
-# WebSocket Models (for future streaming support)
+# WebSocket Models (bot channel at /ws)
 class WSMessage(BaseModel):
-    type: str  # 'message', 'typing', 'error', etc.
+    type: str  # 'message', 'cancel', 'ping'
     data: Dict[str, Any]
     timestamp: str
 
 
 class WSResponse(BaseModel):
-    type: str
+    type: str  # 'typing', 'progress', 'token', 'done', 'error', 'pong'
     data: Dict[str, Any]
     timestamp: str
@@ -1,14 +1,24 @@
+import uuid
 import logging
-from typing import Dict, Any, List, Optional
-
-from langchain_community.chat_message_histories import ChatMessageHistory
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 
+from chatbot.core.config import settings
 from chatbot.models.api_models import Message
+from chatbot.services.session_store import AI, HUMAN, ConversationHistory
+from chatbot.services.history_backend import HistoryKey, create_history_backend
+from chatbot.services.conversation_memory import ConversationMemory
+from chatbot.services.query_contextualizer import QueryContextualizer
 from chatbot.services.llm_service import get_llm_service
 from chatbot.services.vector_service import get_vector_service
+from chatbot.utils.shared_cache import close_shared_response_cache, get_shared_response_cache
+from chatbot.utils.single_flight import FlightAbandoned, SingleFlight
+from chatbot.utils.semantic_cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
+# Session used when the caller doesn't pick one, so history survives restarts
+DEFAULT_SESSION_ID = "default"
+
 
 class ChatService:
     """
@@ -17,13 +27,158 @@ class ChatService:
     """
 
     def __init__(self):
-        self._user_histories: Dict[str, ChatMessageHistory] = {}
+        self.history_backend = create_history_backend()
+        self.response_cache = get_shared_response_cache()
+        # Identical standalone questions in flight at the same time share one answer
+        self.single_flight = SingleFlight()
+        # Paraphrases of an answered question ("midterm date?") reuse its answer
+        self.semantic_cache = SemanticCache(
+            threshold=settings.semantic_cache_threshold,
+            max_entries_per_group=settings.semantic_cache_max_entries,
+            max_bytes=settings.semantic_cache_max_bytes,
+        ) if settings.enable_semantic_cache else None
+        # Prompts see a rolling summary plus the newest turns, never the whole history
+        self.memory = ConversationMemory(
+            self.history_backend,
+            recent_turns=settings.memory_recent_turns,
+            max_tokens=settings.memory_max_tokens,
+            summary_max_tokens=settings.memory_summary_max_tokens,
+            summarize_every_turns=settings.memory_summarize_every_turns,
+            model=settings.llm_model,
+        )
+
+    @staticmethod
+    def _history_key(message: Message) -> HistoryKey:
+        if message.new_chat:
+            session_id = uuid.uuid4().hex
+        else:
+            session_id = message.session_id or DEFAULT_SESSION_ID
+        return (message.group_id or "", message.user_id, session_id)
+
+    async def get_session_history(self, group_id: str, user_id: str, session_id: str) -> ConversationHistory:
+        """Gets the chat history for a (group, user, session); empty if there is none."""
+        return await self.history_backend.load((group_id, user_id, session_id))
+
+    async def _record_turn(self, key: HistoryKey, history: ConversationHistory, user_message: str, ai_message: str, llm_service):
+        turn = [(HUMAN, user_message), (AI, ai_message)]
+        await self.history_backend.append(key, turn)
+        self.memory.maybe_summarize(key, history.records + turn, history.summary, llm_service.llm)
+
+    async def _response_cache_key(self, message: Message, history: ConversationHistory) -> Optional[str]:
+        """Shared-cache key for a standalone RAG question; None when the answer may depend on history"""
+        if not settings.enable_caching or not (message.use_rag and message.group_id):
+            return None
+        # Most questions arrive in a session with history; only follow-ups ("and the second one?") need it
+        if len(history) and not QueryContextualizer.is_standalone(message.message):
+            return None
+        return await self.response_cache.make_key(message.group_id, message.message)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "histories": self.history_backend.get_stats(),
+            "response_cache": self.response_cache.get_stats(),
+            "coalescing": self.single_flight.get_stats(),
+            "semantic_cache": self.semantic_cache.get_stats() if self.semantic_cache else None,
+            "memory": self.memory.get_stats(),
+        }
+
+    async def close(self):
+        await self.memory.close()
+        await self.history_backend.close()
+        close_shared_response_cache()
+
+    async def _prepare_chain(self, message: Message, llm_service, history: ConversationHistory,
+                             history_key: Optional[HistoryKey]):
+        """
+        Builds the chain for a message: the RAG chain when the group has a retriever,
+        otherwise the regular chat chain. Returns (chain, inputs, rag_enabled).
+        """
+        history_messages = self.memory.prompt_messages(history_key, history)
+        # Check if RAG is requested and a group_id is provided.
+        if message.use_rag and message.group_id:
+            vector_service = await get_vector_service()
+            retriever = await vector_service.get_retriever(message.group_id)
+
+            if retriever:
+                logger.info(f"RAG enabled for group '{message.group_id}'. Using modern RAG chain.")
+                rag_chain = await llm_service.create_rag_chain(retriever)
+                return rag_chain, {"input": message.message, "chat_history": history_messages}, True
+            logger.warning(f"RAG requested for group '{message.group_id}', but no retriever was found. Falling back to regular chat.")
+
+        # This runs if RAG was not enabled, or if the retriever failed to initialize.
+        logger.info("Using regular chat chain (no RAG).")
+        chain = await llm_service.create_regular_chain()
+        return chain, {"input": message.message, "history": history_messages}, False
+
+    @staticmethod
+    def _sources_from_context(ctx_docs) -> List[str]:
+        return list({
+            doc.metadata.get("source_file", "Unknown")
+            for doc in ctx_docs if hasattr(doc, "metadata")
+        })
+
+    async def _generate(self, message: Message, llm_service, history: ConversationHistory,
+                        history_key: Optional[HistoryKey]) -> Dict[str, Any]:
+        """Runs the chain once and returns the response, sources used and whether RAG was used."""
+        response_text = ""
+        sources_used: List[str] = []
+
+        chain, inputs, rag_enabled = await self._prepare_chain(message, llm_service, history, history_key)
+        result = await chain.ainvoke(inputs)
+
+        if rag_enabled and isinstance(result, dict):
+            # The 'result' dictionary contains 'answer' and 'context'.
+            response_text = result.get("answer", "")
+            ctx_docs = result.get("context", [])
+            if ctx_docs:
+                sources_used = self._sources_from_context(ctx_docs)
+                logger.info(f"RAG retrieved {len(ctx_docs)} docs → {sources_used}")
+            else:
+                logger.warning("RAG retrieved no context docs.")
+        else:
+            response_text = result if isinstance(result, str) else str(result)
+
+        return {"response": response_text, "sources_used": sources_used or None, "rag_enabled": rag_enabled}
+
+    async def _cached_answer(self, message: Message, llm_service, cache_key: str) -> Tuple[Optional[Dict[str, Any]], Optional[int], Optional[List[float]]]:
+        """Exact, then semantic cache lookup. Returns (answer or None, kb_version, query embedding) for `_store_answer`"""
+        cached = await self.response_cache.get(cache_key)
+        if cached:
+            return {**cached, "from_cache": True}, None, None
 
-    async def get_session_history(self, user_id: str) -> ChatMessageHistory:
-        """Gets or creates a chat history for a given user."""
-        if user_id not in self._user_histories:
-            self._user_histories[user_id] = ChatMessageHistory()
-        return self._user_histories[user_id]
+        kb_version, embedding = None, None
+        if self.semantic_cache is not None:
+            try:
+                kb_version = await self.response_cache.kb_version(message.group_id)
+                embedding = await llm_service.embed_query(message.message)
+                similar = self.semantic_cache.lookup(message.group_id, kb_version, embedding)
+                if similar:
+                    logger.info(f"Semantic cache hit for group '{message.group_id}' (similarity {similar['similarity']:.3f})")
+                    return {**similar, "from_cache": True}, kb_version, embedding
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup failed: {e}")
+                embedding = None
+        return None, kb_version, embedding
+
+    async def _store_answer(self, message: Message, cache_key: str, answer: Dict[str, Any],
+                            kb_version: Optional[int], embedding: Optional[List[float]]):
+        if not answer["rag_enabled"]:
+            return
+        await self.response_cache.set(cache_key, answer)
+        if embedding is not None:
+            self.semantic_cache.store(message.group_id, kb_version, embedding, answer)
+
+    async def _answer_standalone(self, message: Message, llm_service, cache_key: str,
+                                 history: ConversationHistory, history_key: HistoryKey) -> Dict[str, Any]:
+        """Cache lookup plus generation for a standalone question; the unit shared by coalesced callers."""
+        cached, kb_version, embedding = await self._cached_answer(message, llm_service, cache_key)
+        if cached:
+            return cached
+        # Generated like any other answer; a standalone question barely depends on the history,
+        # so other sessions may reuse it
+        answer = await self._generate(message, llm_service, history, history_key)
+        await self._store_answer(message, cache_key, answer, kb_version, embedding)
+        return answer
 
     async def process_message(self, message: Message) -> Dict[str, Any]:
         """
@@ -32,63 +187,95 @@ class ChatService:
         """
         try:
             llm_service = await get_llm_service()
-            history = await self.get_session_history(message.user_id)
-            
-            response_text = ""
-            sources_used: List[str] = []
-            rag_enabled = False
-
-            # --- Main RAG Logic ---
-            # Check if RAG is requested and a group_id is provided.
-            if message.use_rag and message.group_id:
-                vector_service = await get_vector_service()
-                retriever = await vector_service.get_retriever(message.group_id)
-
-                if retriever:
-                    logger.info(f"RAG enabled for group '{message.group_id}'. Using modern RAG chain.")
-                    rag_chain = await llm_service.create_rag_chain(retriever)
-                    
-                    # Invoke the full RAG chain. LangChain handles the retrieval internally.
-                    result = await rag_chain.ainvoke(
-                        {"input": message.message, "chat_history": history.messages}
+            history_key = self._history_key(message)
+            history = await self.get_session_history(*history_key)
+
+            cache_key = await self._response_cache_key(message, history)
+            if cache_key:
+                try:
+                    answer = await self.single_flight.do(
+                        cache_key,
+                        lambda: self._answer_standalone(message, llm_service, cache_key, history, history_key),
                     )
-                    
-                    # The 'result' dictionary contains 'answer' and 'context'.
-                    if isinstance(result, dict):
-                        response_text = result.get("answer", "")
-                        ctx_docs = result.get("context", [])
-                        if ctx_docs:
-                            sources_used = list({
-                                doc.metadata.get("source_file", "Unknown")
-                                for doc in ctx_docs if hasattr(doc, "metadata")
-                            })
-                            logger.info(f"RAG retrieved {len(ctx_docs)} docs → {sources_used}")
-                        else:
-                            logger.warning("RAG retrieved no context docs.")
-                    else:
-                        response_text = str(result)
-                    rag_enabled = True
-                else:
-                    logger.warning(f"RAG requested for group '{message.group_id}', but no retriever was found. Falling back to regular chat.")
-            
-            # --- Fallback to Regular Chat ---
-            # This runs if RAG was not enabled, or if the retriever failed to initialize.
-            if not rag_enabled:
-                logger.info("Using regular chat chain (no RAG).")
-                chain = await llm_service.create_regular_chain()
-                result = await chain.ainvoke({"input": message.message, "history": history.messages})
-                response_text = result if isinstance(result, str) else str(result)
+                except FlightAbandoned:
+                    # The stream answering it went away; answer it here instead
+                    answer = await self._answer_standalone(message, llm_service, cache_key, history, history_key)
+            else:
+                answer = await self._generate(message, llm_service, history, history_key)
 
             # Update the conversation history
-            history.add_user_message(message.message)
-            history.add_ai_message(response_text)
-
-            return {
-                "user_id": message.user_id,
-                "response": response_text,
-                "sources_used": sources_used or None,
-                "rag_enabled": rag_enabled,
-            }
+            await self._record_turn(history_key, history, message.message, answer["response"], llm_service)
+
+            return {"user_id": message.user_id, "session_id": history_key[2], **answer}
         except Exception as e:
             logger.error(f"Critical error in ChatService.process_message: {str(e)}", exc_info=True)
-            return {"error": str(e), "response": "Sorry, I encountered a critical error while processing your request."}
\ No newline at end of file
+            return {"error": str(e), "response": "Sorry, I encountered a critical error while processing your request."}
+
+    async def stream_message(self, message: Message) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of process_message. Yields {"token": str} events as the
+        answer is generated, then a final {"done": True, ...} event with the same
+        fields process_message returns.
+        """
+        flight = None
+        try:
+            llm_service = await get_llm_service()
+            history_key = self._history_key(message)
+            history = await self.get_session_history(*history_key)
+
+            cache_key = await self._response_cache_key(message, history)
+            answer = None
+            kb_version, embedding = None, None
+            if cache_key:
+                if self.single_flight.inflight(cache_key):
+                    # Someone is already answering this exact question: share their result
+                    try:
+                        answer = await self.single_flight.do(
+                            cache_key,
+                            lambda: self._answer_standalone(message, llm_service, cache_key, history, history_key),
+                        )
+                    except FlightAbandoned:
+                        answer = None
+                if answer is None:
+                    # Lead the flight so identical requests arriving while this streams wait for it
+                    flight = self.single_flight.lead(cache_key)
+                    answer, kb_version, embedding = await self._cached_answer(message, llm_service, cache_key)
+            if answer:
+                if flight is not None:
+                    flight.set_result(answer)
+                yield {"token": answer["response"]}
+                await self._record_turn(history_key, history, message.message, answer["response"], llm_service)
+                yield {"done": True, "user_id": message.user_id, "session_id": history_key[2], **answer}
+                return
+
+            chunks: List[str] = []
+            sources_used: List[str] = []
+
+            chain, inputs, rag_enabled = await self._prepare_chain(message, llm_service, history, history_key)
+            async for chunk in chain.astream(inputs):
+                if rag_enabled and isinstance(chunk, dict):
+                    # The retrieval chain streams 'context' once, then 'answer' pieces.
+                    if chunk.get("context"):
+                        sources_used = self._sources_from_context(chunk["context"])
+                    token = chunk.get("answer")
+                else:
+                    token = chunk if isinstance(chunk, str) else str(chunk)
+                if token:
+                    chunks.append(token)
+                    yield {"token": token}
+
+            answer = {"response": "".join(chunks), "sources_used": sources_used or None, "rag_enabled": rag_enabled}
+            if flight is not None:
+                flight.set_result(answer)
+            await self._record_turn(history_key, history, message.message, answer["response"], llm_service)
+            if cache_key:
+                await self._store_answer(message, cache_key, answer, kb_version, embedding)
+
+            yield {"done": True, "user_id": message.user_id, "session_id": history_key[2], **answer}
+        except Exception as e:
+            logger.error(f"Critical error in ChatService.stream_message: {str(e)}", exc_info=True)
+            yield {"done": True, "error": str(e), "response": "Sorry, I encountered a critical error while processing your request."}
+        finally:
+            # Failed or disconnected before finishing: waiting requests answer it themselves
+            if flight is not None and not flight.done():
+                flight.set_exception(FlightAbandoned())
@@ -0,0 +1,140 @@
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from chatbot.services.history_backend import HistoryBackend, HistoryKey
+from chatbot.services.session_store import HUMAN, ConversationHistory, Summary
+from chatbot.utils.context_packer import count_tokens, get_encoder
+from chatbot.utils.shared_cache import content_digest
+
+logger = logging.getLogger(__name__)
+
+Record = Tuple[str, str]  # (role, content)
+
+_SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        "Progressively summarize a conversation between a student and an assistant. "
+        "Extend the current summary with the new lines and return only the new summary. "
+        "Keep names, numbers, dates, course topics and open questions; drop pleasantries.",
+    ),
+    ("human", "Current summary:\n{summary}\n\nNew lines of conversation:\n{lines}\n\nNew summary:"),
+])
+
+
+def _pair_digest(records: Sequence[Record], index: int) -> str:
+    # The record plus its predecessor, so a repeated "ok" doesn't match the wrong place
+    previous = records[index - 1] if index else ("", "")
+    return content_digest(*previous, *records[index])
+
+
+class ConversationMemory:
+    """
+    Bounded view of a conversation for the prompts: messages not yet
+    summarized go in verbatim (newest first until `max_tokens`), everything
+    older is represented by a rolling summary. The summary is extended in the
+    background once `summarize_every_turns` turns have fallen out of the last
+    `recent_turns`, so no request waits on it. Summaries are stored in the
+    history backend next to the history, so every worker sees them.
+    """
+
+    def __init__(self, backend: HistoryBackend, recent_turns: int, max_tokens: int, summary_max_tokens: int,
+                 summarize_every_turns: int, model: Optional[str] = None):
+        self.backend = backend
+        self.recent_messages = 2 * recent_turns
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summarize_every = 2 * summarize_every_turns
+        self.model = model
+        self._tasks: Dict[HistoryKey, asyncio.Task] = {}
+        self.stats = {"prompts": 0, "with_summary": 0, "trimmed_messages": 0, "summaries": 0,
+                      "summary_errors": 0, "summary_ms_total": 0.0}
+
+    @staticmethod
+    def _unsummarized_start(summary: Optional[Summary], records: Sequence[Record]) -> int:
+        if summary is None:
+            return 0
+        for index in range(len(records) - 1, -1, -1):
+            if _pair_digest(records, index) == summary[1]:
+                return index + 1
+        # The summarized messages slid out of the stored window: all of it is newer
+        return 0
+
+    @staticmethod
+    def _to_message(record: Record) -> BaseMessage:
+        role, content = record
+        return HumanMessage(content=content) if role == HUMAN else AIMessage(content=content)
+
+    def prompt_messages(self, key: Optional[HistoryKey], history: ConversationHistory) -> List[BaseMessage]:
+        """
+        History messages for a prompt: the summary (if any) plus the newest messages within the
+        token cap. A None key (answers shared across sessions) never gets a summary.
+        """
+        self.stats["prompts"] += 1
+        records = history.records
+        summary = history.summary if key is not None else None
+        start = self._unsummarized_start(summary, records)
+
+        budget = self.max_tokens
+        prefix: List[BaseMessage] = []
+        if summary is not None:
+            summary_message = SystemMessage(content=f"Summary of the earlier conversation:\n{summary[0]}")
+            budget -= count_tokens(summary_message.content, self.model)
+            prefix.append(summary_message)
+            self.stats["with_summary"] += 1
+
+        kept: List[BaseMessage] = []
+        for record in reversed(records[start:]):
+            tokens = count_tokens(record[1], self.model)
+            if tokens > budget:
+                if not kept and budget > 0:
+                    # Keep the tail of an oversized latest message rather than nothing
+                    encoder = get_encoder(self.model)
+                    tail = encoder.decode(encoder.encode(record[1], disallowed_special=())[-budget:])
+                    kept.append(self._to_message((record[0], tail)))
+                break
+            kept.append(self._to_message(record))
+            budget -= tokens
+        self.stats["trimmed_messages"] += len(records) - start - len(kept)
+        return prefix + kept[::-1]
+
+    def maybe_summarize(self, key: HistoryKey, records: Sequence[Record], summary: Optional[Summary], llm):
+        """Fold messages older than the recent window into `summary`, off the request path"""
+        if key in self._tasks:
+            return
+        start = self._unsummarized_start(summary, records)
+        end = len(records) - self.recent_messages
+        if end - start < self.summarize_every:
+            return
+        task = asyncio.create_task(self._summarize(key, summary, list(records[:end]), start, llm))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _, key=key: self._tasks.pop(key, None))
+
+    async def _summarize(self, key: HistoryKey, summary: Optional[Summary], records: List[Record], start: int, llm):
+        start_time = time.perf_counter()
+        lines = "\n".join(
+            f"{'Student' if role == HUMAN else 'Assistant'}: {content}" for role, content in records[start:]
+        )
+        try:
+            chain = _SUMMARY_PROMPT | llm.bind(max_tokens=self.summary_max_tokens) | StrOutputParser()
+            text = await chain.ainvoke({"summary": summary[0] if summary else "(none)", "lines": lines})
+            await self.backend.save_summary(key, (text.strip(), _pair_digest(records, len(records) - 1)))
+        except Exception as e:
+            self.stats["summary_errors"] += 1
+            logger.warning(f"Conversation summary update failed: {e}")
+            return
+        self.stats["summaries"] += 1
+        self.stats["summary_ms_total"] += (time.perf_counter() - start_time) * 1000
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": len(self._tasks)}
+
+    async def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
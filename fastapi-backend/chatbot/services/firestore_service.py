@@ -0,0 +1,140 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+import firebase_admin
+from firebase_admin import credentials, firestore_async
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class FirestoreService:
+    """Async Firestore data-access layer, initialized once per process"""
+
+    def __init__(self):
+        self.db = None
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self.db is not None
+
+    async def initialize(self):
+        """Initialize the Firebase app and the async Firestore client"""
+        if self._initialized:
+            return
+
+        async with self._init_lock:
+            if self._initialized:
+                return
+            try:
+                if not firebase_admin._apps:
+                    # Get the JSON content from the environment variable for deployment
+                    firebase_creds_json_str = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
+                    if firebase_creds_json_str:
+                        firebase_creds_dict = json.loads(firebase_creds_json_str)
+                        cred = credentials.Certificate(firebase_creds_dict)
+                        firebase_admin.initialize_app(cred)
+                        logger.info("Firebase initialized successfully from environment variable.")
+                    else:
+                        # Fallback for local development
+                        local_key_path = "chat_serviceAccountKey.json"
+                        if os.path.exists(local_key_path):
+                            cred = credentials.Certificate(local_key_path)
+                            firebase_admin.initialize_app(cred)
+                            logger.info(f"Firebase initialized successfully from local file: {local_key_path}")
+                        else:
+                            raise ValueError("Firebase credentials not found in environment variable or local file.")
+
+                self.db = firestore_async.client()
+            except Exception as e:
+                logger.error(f"CRITICAL: Failed to initialize Firebase: {e}")
+                self.db = None
+            # Don't retry the credential checks on every request
+            self._initialized = True
+
+    def group_ref(self, group_id: str):
+        return self.db.collection("groups").document(group_id)
+
+    async def get_group(self, group_id: str) -> Dict[str, Any]:
+        """Read a group document, returning an empty dict if it doesn't exist"""
+        snap = await self.group_ref(group_id).get()
+        return snap.to_dict() or {}
+
+    async def merge_group(self, group_id: str, data: Dict[str, Any]):
+        """Merge fields into a group document"""
+        await self.group_ref(group_id).set(data, merge=True)
+
+    async def add_group_message(self, group_id: str, message_data: Dict[str, Any]):
+        """Append a message to a group's messages collection"""
+        await self.group_ref(group_id).collection("messages").add(message_data)
+
+    async def batch_add_group_messages(self, messages: List[Tuple[str, Dict[str, Any]]]):
+        """Append (group_id, message_data) pairs to group message collections in one commit"""
+        for i in range(0, len(messages), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for group_id, message_data in messages[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.set(self.group_ref(group_id).collection("messages").document(), message_data)
+            await batch.commit()
+
+    async def batch_merge_groups(self, updates: Dict[str, Dict[str, Any]]):
+        """Merge fields into several group documents with batched commits"""
+        items = list(updates.items())
+        for i in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for group_id, data in items[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.set(self.group_ref(group_id), data, merge=True)
+            await batch.commit()
+
+    async def add_group_usage(self, group_id: str, date_key: str, deltas: Dict[str, int]) -> Dict[str, Any]:
+        """
+        Add deltas to a group's daily aiUsage counters in one transaction, resetting
+        counters that belong to another day first. Returns the stored aiUsage.
+        """
+        ref = self.group_ref(group_id)
+
+        @firestore_async.async_transactional
+        async def update(transaction):
+            snap = await ref.get(transaction=transaction)
+            ai_usage = ((snap.to_dict() or {}).get("aiUsage") or {}) if snap.exists else {}
+            if ai_usage.get("dateKey") != date_key:
+                ai_usage = {}
+            stored = {"dateKey": date_key}
+            for field, delta in deltas.items():
+                stored[field] = int(ai_usage.get(field, 0) or 0) + delta
+            transaction.set(ref, {"aiUsage": stored}, merge=True)
+            return stored
+
+        return await update(self.db.transaction())
+
+    async def close(self):
+        if self.db is not None:
+            self.db.close()
+        self.db = None
+        self._initialized = False
+
+
+# Global service instance
+_firestore_service: Optional[FirestoreService] = None
+
+
+async def get_firestore_service() -> FirestoreService:
+    """Get or create the global Firestore service instance"""
+    global _firestore_service
+    if _firestore_service is None:
+        _firestore_service = FirestoreService()
+        await _firestore_service.initialize()
+    return _firestore_service
+
+
+async def close_firestore_service():
+    global _firestore_service
+    if _firestore_service is not None:
+        await _firestore_service.close()
+        _firestore_service = None
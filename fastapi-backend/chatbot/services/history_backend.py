@@ -0,0 +1,335 @@
+import asyncio
+import os
+import time
+import sqlite3
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from chatbot.core.config import settings
+from chatbot.services.session_store import ConversationHistory, SessionStore, Summary
+
+logger = logging.getLogger(__name__)
+
+HistoryKey = Tuple[str, str, str]  # (group_id, user_id, session_id)
+Record = Tuple[str, str]  # (role, content)
+
+
+class HistoryBackend(ABC):
+    """Storage for conversation histories (and their summaries) keyed by (group_id, user_id, session_id)"""
+
+    @abstractmethod
+    async def load(self, key: HistoryKey) -> ConversationHistory:
+        """Return the history for a key (empty if none exists), with its summary"""
+
+    async def load_many(self, keys: Sequence[HistoryKey]) -> Dict[HistoryKey, ConversationHistory]:
+        histories = await asyncio.gather(*(self.load(key) for key in keys))
+        return dict(zip(keys, histories))
+
+    @abstractmethod
+    async def append(self, key: HistoryKey, records: List[Record]):
+        """Append records to a history"""
+
+    @abstractmethod
+    async def save_summary(self, key: HistoryKey, summary: Summary):
+        """Store the rolling summary of a history, replacing the previous one"""
+
+    @abstractmethod
+    async def clear(self, key: HistoryKey):
+        """Delete a history and its summary"""
+
+    async def close(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InMemoryHistoryBackend(HistoryBackend):
+    """Per-process histories held in a bounded SessionStore"""
+
+    def __init__(self):
+        self._store = SessionStore(
+            max_entries=settings.session_max_entries,
+            idle_ttl=settings.session_idle_ttl,
+            max_bytes=settings.session_max_bytes,
+        )
+
+    async def load(self, key: HistoryKey) -> ConversationHistory:
+        history = self._store.get(key)
+        # Return a copy so callers can't bypass append()
+        return ConversationHistory(history.records, history.summary) if history else ConversationHistory()
+
+    async def append(self, key: HistoryKey, records: List[Record]):
+        history = self._store.get_or_create(key, ConversationHistory)
+        for role, content in records:
+            history.add_message(role, content)
+        self._store.touch(key)
+
+    async def save_summary(self, key: HistoryKey, summary: Summary):
+        # Evicted together with the history it summarizes
+        history = self._store.get(key)
+        if history is not None:
+            history.summary = summary
+
+    async def clear(self, key: HistoryKey):
+        self._store.pop(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._store.get_stats()}
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """
+    Histories persisted in a local SQLite database (WAL mode), shared by every
+    worker on the node. Concurrent loads are batched into one query, appends are
+    buffered and written by a background task, which also prunes each written
+    session to its newest `history_max_messages` records.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.max_messages = settings.history_max_messages
+        self.flush_interval = settings.history_flush_interval
+        self.read_batch_window = settings.history_read_batch_window
+        # A single thread owns the connection, which also serializes writes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending_writes: List[Tuple[HistoryKey, str, str, float]] = []
+        self._pending_reads: Dict[HistoryKey, List[asyncio.Future]] = {}
+        self._read_task: Optional[asyncio.Task] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._write_requested: Optional[asyncio.Event] = None
+        self._closing = False
+        self.stats = {"reads": 0, "read_batches": 0, "appends": 0, "write_batches": 0, "write_errors": 0,
+                      "pruned": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    group_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chat_messages_key "
+                "ON chat_messages (group_id, user_id, session_id, seq)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_summaries (
+                    group_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    last_digest TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (group_id, user_id, session_id)
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    # --- Reads ---
+
+    def _select_many(self, keys: List[HistoryKey]) -> Dict[HistoryKey, Tuple[List[Record], Optional[Summary]]]:
+        conn = self._connect()
+        placeholders = ", ".join(["(?, ?, ?)"] * len(keys))
+        params = [part for key in keys for part in key]
+        rows = conn.execute(
+            f"""
+            SELECT group_id, user_id, session_id, role, content FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY group_id, user_id, session_id ORDER BY seq DESC
+                ) AS rn
+                FROM chat_messages
+                WHERE (group_id, user_id, session_id) IN (VALUES {placeholders})
+            )
+            WHERE rn <= ?
+            ORDER BY seq
+            """,
+            params + [self.max_messages],
+        ).fetchall()
+        records: Dict[HistoryKey, List[Record]] = {key: [] for key in keys}
+        for group_id, user_id, session_id, role, content in rows:
+            records[(group_id, user_id, session_id)].append((role, content))
+        summaries: Dict[HistoryKey, Summary] = {}
+        for group_id, user_id, session_id, text, last_digest in conn.execute(
+            "SELECT group_id, user_id, session_id, text, last_digest FROM chat_summaries "
+            f"WHERE (group_id, user_id, session_id) IN (VALUES {placeholders})",
+            params,
+        ):
+            summaries[(group_id, user_id, session_id)] = (text, last_digest)
+        return {key: (records[key], summaries.get(key)) for key in keys}
+
+    def _with_pending(self, key: HistoryKey, loaded: Tuple[List[Record], Optional[Summary]]) -> ConversationHistory:
+        # Appends not yet written are still visible to this process
+        records, summary = loaded
+        pending = [(role, content) for pkey, role, content, _ in self._pending_writes if pkey == key]
+        return ConversationHistory((records + pending)[-self.max_messages:], summary)
+
+    async def _drain_reads(self):
+        await asyncio.sleep(self.read_batch_window)
+        batch, self._pending_reads = self._pending_reads, {}
+        self._read_task = None
+        try:
+            results = await self._run(self._select_many, list(batch))
+            self.stats["read_batches"] += 1
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(key, ([], None)))
+
+    async def load(self, key: HistoryKey) -> ConversationHistory:
+        self.stats["reads"] += 1
+        future = asyncio.get_event_loop().create_future()
+        self._pending_reads.setdefault(key, []).append(future)
+        if self._read_task is None:
+            self._read_task = asyncio.create_task(self._drain_reads())
+        loaded = await future
+        return self._with_pending(key, loaded)
+
+    async def load_many(self, keys: Sequence[HistoryKey]) -> Dict[HistoryKey, ConversationHistory]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        self.stats["reads"] += len(keys)
+        self.stats["read_batches"] += 1
+        results = await self._run(self._select_many, keys)
+        return {key: self._with_pending(key, results[key]) for key in keys}
+
+    # --- Writes ---
+
+    def _insert_many(self, rows: List[Tuple[HistoryKey, str, str, float]]) -> int:
+        """Insert rows, then prune the written sessions to their newest max_messages; returns rows pruned"""
+        conn = self._connect()
+        pruned = 0
+        with conn:
+            conn.executemany(
+                "INSERT INTO chat_messages (group_id, user_id, session_id, role, content, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(*key, role, content, created_at) for key, role, content, created_at in rows],
+            )
+            # Loads never read past max_messages (older turns live on in the summary)
+            for key in dict.fromkeys(key for key, _, _, _ in rows):
+                pruned += conn.execute(
+                    "DELETE FROM chat_messages WHERE group_id = ? AND user_id = ? AND session_id = ? AND seq <= ("
+                    "SELECT seq FROM chat_messages WHERE group_id = ? AND user_id = ? AND session_id = ? "
+                    "ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                    (*key, *key, self.max_messages),
+                ).rowcount
+        return pruned
+
+    async def flush(self):
+        if not self._pending_writes:
+            return
+        rows = list(self._pending_writes)
+        try:
+            pruned = await self._run(self._insert_many, rows)
+        except Exception as e:
+            self.stats["write_errors"] += 1
+            logger.error(f"Failed to persist {len(rows)} history records: {e}")
+            return
+        # Only drop what was written; appends made during the write stay pending
+        del self._pending_writes[:len(rows)]
+        self.stats["write_batches"] += 1
+        self.stats["pruned"] += pruned
+
+    async def _writer(self):
+        while not self._closing:
+            await self._write_requested.wait()
+            self._write_requested.clear()
+            if not self._closing:
+                # Give concurrent appends a moment to join this batch
+                await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def append(self, key: HistoryKey, records: List[Record]):
+        now = time.time()
+        self._pending_writes.extend((key, role, content, now) for role, content in records)
+        self.stats["appends"] += len(records)
+        if self._writer_task is None:
+            self._write_requested = asyncio.Event()
+            self._writer_task = asyncio.create_task(self._writer())
+        self._write_requested.set()
+
+    async def save_summary(self, key: HistoryKey, summary: Summary):
+        # Written at once: summaries are rare and other workers should see them on their next load
+        def _upsert():
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT INTO chat_summaries (group_id, user_id, session_id, text, last_digest, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (group_id, user_id, session_id) "
+                    "DO UPDATE SET text = excluded.text, last_digest = excluded.last_digest, "
+                    "updated_at = excluded.updated_at",
+                    (*key, *summary, time.time()),
+                )
+
+        await self._run(_upsert)
+
+    async def clear(self, key: HistoryKey):
+        self._pending_writes = [row for row in self._pending_writes if row[0] != key]
+
+        def _delete():
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "DELETE FROM chat_messages WHERE group_id = ? AND user_id = ? AND session_id = ?", key
+                )
+                conn.execute(
+                    "DELETE FROM chat_summaries WHERE group_id = ? AND user_id = ? AND session_id = ?", key
+                )
+
+        await self._run(_delete)
+
+    async def close(self):
+        self._closing = True
+        if self._writer_task is not None:
+            self._write_requested.set()
+            await self._writer_task
+            self._writer_task = None
+        await self.flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "sqlite", **self.stats, "pending_writes": len(self._pending_writes)}
+
+
+def create_history_backend() -> HistoryBackend:
+    """Build the history backend selected by settings.history_backend"""
+    if settings.history_backend == "sqlite":
+        logger.info(f"Using SQLite chat history backend at {settings.history_db_path}")
+        return SQLiteHistoryBackend(settings.history_db_path)
+    if settings.history_backend != "memory":
+        raise ValueError(f"Unknown history backend: {settings.history_backend}")
+    return InMemoryHistoryBackend()
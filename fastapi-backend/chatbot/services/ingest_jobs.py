@@ -0,0 +1,443 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from chatbot.core.config import settings
+from chatbot.models.api_models import FileType
+from chatbot.services.vector_service import INGEST_PROGRESS_KEYS, get_vector_service
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Columns added after the first release of the table
+_MIGRATIONS = {
+    "owner": "ALTER TABLE jobs ADD COLUMN owner TEXT",
+    "heartbeat_at": "ALTER TABLE jobs ADD COLUMN heartbeat_at REAL",
+    "cancel_requested": "ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0",
+}
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat() if timestamp else None
+
+
+class IngestJobQueue:
+    """
+    Durable queue of document uploads shared by every API worker on the host.
+    Jobs are rows in a local SQLite file next to the uploaded files; each
+    process runs `workers` tasks that claim the oldest queued row. A running
+    job is owned by one process, which refreshes its heartbeat (and progress)
+    every `heartbeat_interval` seconds and polls for cancel requests; jobs
+    whose owner has been silent for `owner_timeout` seconds are requeued.
+    Re-ingestion is incremental, so a requeued job only embeds what is
+    still missing.
+    """
+
+    def __init__(self, db_path: str, upload_dir: str, workers: int, max_pending: int, job_ttl: float,
+                 heartbeat_interval: float = 5.0, owner_timeout: float = 60.0, poll_interval: float = 2.0):
+        self.db_path = db_path
+        self.upload_dir = upload_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.owner_timeout = owner_timeout
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-jobs")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._progress: Dict[str, Dict[str, int]] = {}  # live counters of jobs this process runs
+        self._finished_events: Dict[str, asyncio.Event] = {}  # set once a running job's outcome is stored
+        self._finished = 0
+        self.stats = {"submitted": 0, "recovered": 0, "rejected": 0, "lost": 0,
+                      SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+
+    # --- storage (single SQLite thread) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Workers start together: check and migrate the schema under the write lock
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, group_id TEXT NOT NULL, filename TEXT NOT NULL, "
+                "file_type TEXT NOT NULL, file_path TEXT NOT NULL, file_size INTEGER, file_digest TEXT, "
+                "status TEXT NOT NULL, progress TEXT, error TEXT, result TEXT, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, statement in _MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_group ON jobs (group_id, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    def _fetch(self, job_id: str) -> Optional[sqlite3.Row]:
+        return self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    def _pending(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def _insert(self, job: Dict[str, Any]):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, group_id, filename, file_type, file_path, file_size, file_digest, "
+                "status, created_at) VALUES (:job_id, :group_id, :filename, :file_type, :file_path, :file_size, "
+                ":file_digest, :status, :created_at)",
+                job,
+            )
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """Takes ownership of the oldest queued job, if any"""
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            # BEGIN IMMEDIATE: two processes must not pick the same row
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, started_at = ?, heartbeat_at = ? WHERE job_id = ?",
+                (RUNNING, self.owner, now, now, row["job_id"]),
+            )
+        return self._fetch(row["job_id"])
+
+    def _beat(self, progress: Dict[str, Dict[str, int]]) -> Dict[str, str]:
+        """
+        Refreshes heartbeat and progress of this process's running jobs. Returns
+        {job_id: reason} for jobs to stop: "cancel" when a cancel was requested,
+        "lost" when the job was requeued or taken over meanwhile.
+        """
+        conn = self._connect()
+        now = time.time()
+        stop: Dict[str, str] = {}
+        with conn:
+            for job_id, counters in progress.items():
+                updated = conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ?, progress = ? WHERE job_id = ? AND owner = ? AND status = ?",
+                    (now, json.dumps(counters), job_id, self.owner, RUNNING),
+                ).rowcount
+                if not updated:
+                    stop[job_id] = "lost"
+            if progress:
+                placeholders = ",".join("?" * len(progress))
+                for row in conn.execute(
+                    f"SELECT job_id FROM jobs WHERE job_id IN ({placeholders}) AND owner = ? AND cancel_requested = 1",
+                    (*progress, self.owner),
+                ):
+                    stop.setdefault(row["job_id"], "cancel")
+        return stop
+
+    def _finish(self, job_id: str, status: str, progress: Optional[Dict[str, int]],
+                error: Optional[str] = None, result: Optional[Dict[str, Any]] = None) -> bool:
+        """Stores the outcome; False if this process no longer owns the job"""
+        conn = self._connect()
+        with conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, error = ?, result = ?, finished_at = ? "
+                "WHERE job_id = ? AND owner = ? AND status = ?",
+                (status, json.dumps(progress) if progress else None, error,
+                 json.dumps(result) if result else None, time.time(), job_id, self.owner, RUNNING),
+            ).rowcount
+            self._finished += 1
+            if self._finished % 100 == 0:
+                conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at <= ?",
+                             (time.time() - self.job_ttl,))
+        return bool(updated)
+
+    def _request_cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancels a queued job outright (returning its file path to delete) and flags a
+        running one for its owner, whichever process that is
+        """
+        conn = self._connect()
+        with conn:
+            cancelled = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            ).rowcount
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = ?", (job_id, RUNNING))
+        row = self._fetch(job_id)
+        return row["file_path"] if cancelled and row else None
+
+    def _requeue_stale(self) -> int:
+        """Requeues running jobs whose owner stopped sending heartbeats; drops expired finished jobs"""
+        conn = self._connect()
+        with conn:
+            requeued = conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL "
+                "WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?) AND cancel_requested = 0",
+                (QUEUED, RUNNING, time.time() - self.owner_timeout),
+            ).rowcount
+            # A job whose owner died after a cancel request is simply cancelled
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? "
+                "WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?) AND cancel_requested = 1",
+                (CANCELLED, time.time(), RUNNING, time.time() - self.owner_timeout),
+            )
+            conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at <= ?",
+                         (time.time() - self.job_ttl,))
+        return requeued
+
+    def _release(self) -> int:
+        """On shutdown: hand this process's running jobs back to the queue"""
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL WHERE status = ? AND owner = ?",
+                (QUEUED, RUNNING, self.owner),
+            ).rowcount
+
+    def _list(self, group_id: str, limit: int) -> List[sqlite3.Row]:
+        return self._connect().execute(
+            "SELECT * FROM jobs WHERE group_id = ? ORDER BY created_at DESC LIMIT ?", (group_id, limit)
+        ).fetchall()
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = {key: row[key] for key in ("job_id", "group_id", "filename", "file_type", "status", "file_size", "error")}
+        job["cancel_requested"] = bool(row["cancel_requested"])
+        progress = self._progress.get(row["job_id"]) or json.loads(row["progress"] or "{}")
+        job.update({key: progress.get(key, 0) for key in INGEST_PROGRESS_KEYS})
+        job["result"] = json.loads(row["result"]) if row["result"] else None
+        for key in ("created_at", "started_at", "finished_at"):
+            job[key] = _iso(row[key])
+        return job
+
+    # --- API ---
+
+    def new_upload_path(self, suffix: str) -> str:
+        """Where an upload should be spooled so the queue can take it over"""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        return os.path.join(self.upload_dir, f"{uuid.uuid4().hex}{suffix}")
+
+    async def submit(self, group_id: str, filename: str, file_type: FileType, file_path: str,
+                     file_size: Optional[int] = None, file_digest: Optional[str] = None) -> Dict[str, Any]:
+        """Queues an uploaded file for ingestion; the queue owns (and eventually deletes) `file_path`"""
+        pending = await self._run(self._pending)
+        if pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise IngestQueueFull(f"{pending} uploads are already waiting")
+        job = {
+            "job_id": uuid.uuid4().hex, "group_id": group_id, "filename": filename, "file_type": file_type.value,
+            "file_path": file_path, "file_size": file_size, "file_digest": file_digest, "status": QUEUED,
+            "created_at": time.time(),
+        }
+        await self._run(self._insert, job)
+        self._wakeup.set()
+        self.stats["submitted"] += 1
+        logger.info(f"Queued ingestion job {job['job_id']} for '{filename}' (group '{group_id}')")
+        return await self.get(job["job_id"])
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = await self._run(self._fetch, job_id)
+        return self._to_dict(row) if row else None
+
+    async def list(self, group_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        return [self._to_dict(row) for row in await self._run(self._list, group_id, limit)]
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancels a queued or running job; finished jobs are returned unchanged. A job running
+        in another process stops at its owner's next heartbeat (`cancel_requested` is set meanwhile).
+        """
+        file_path = await self._run(self._request_cancel, job_id)
+        if file_path:
+            self.stats[CANCELLED] += 1
+            self._remove_file(file_path)
+            logger.info(f"Cancelled queued ingestion job {job_id}")
+        task, finished = self._running.get(job_id), self._finished_events.get(job_id)
+        if task is not None:
+            task.cancel()
+            await finished.wait()
+        return await self.get(job_id)
+
+    # --- workers ---
+
+    @staticmethod
+    def _remove_file(file_path: str):
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+
+    async def _ingest(self, row: sqlite3.Row, progress: Dict[str, int]) -> Dict[str, Any]:
+        vector_service = await get_vector_service()
+        result = await vector_service.add_document(
+            row["file_path"], row["filename"], FileType(row["file_type"]), row["group_id"],
+            file_digest=row["file_digest"], progress=progress,
+        )
+        return {**result, "file_type": row["file_type"], "file_size": row["file_size"]}
+
+    async def _process(self, row: sqlite3.Row):
+        job_id = row["job_id"]
+        progress = self._progress[job_id] = dict.fromkeys(INGEST_PROGRESS_KEYS, 0)
+        finished = self._finished_events[job_id] = asyncio.Event()
+        task = self._running[job_id] = asyncio.create_task(self._ingest(row, progress))
+        try:
+            try:
+                # wait() rather than await: cancelling the job must not cancel this worker
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                # Shutdown: stop() hands the job back to the queue
+                task.cancel()
+                await asyncio.wait({task})
+                raise
+
+            if task.cancelled():
+                status, error, result = CANCELLED, None, None
+            elif task.exception() is not None:
+                status, error, result = FAILED, str(task.exception()), None
+            else:
+                status, error, result = SUCCEEDED, None, task.result()
+            if not await self._run(self._finish, job_id, status, progress, error, result):
+                # Requeued as stale (e.g. a long event-loop stall) and owned by someone else now
+                self.stats["lost"] += 1
+                logger.warning(f"Ingestion job {job_id} was taken over by another worker; dropping this run")
+                return
+            if status == CANCELLED:
+                logger.info(f"Cancelled ingestion job {job_id} after {progress['vectors_upserted']} vectors")
+            elif status == FAILED:
+                logger.error(f"Ingestion job {job_id} for '{row['filename']}' failed: {error}")
+            self.stats[status] += 1
+            self._remove_file(row["file_path"])
+        finally:
+            self._running.pop(job_id, None)
+            self._progress.pop(job_id, None)
+            self._finished_events.pop(job_id, None)
+            finished.set()
+
+    async def _worker(self):
+        while True:
+            try:
+                row = await self._run(self._claim_next)
+            except Exception as e:
+                logger.error(f"Ingestion worker could not claim a job: {e}")
+                row = None
+            if row is None:
+                # Local submits wake us at once; other processes' submits are found by polling
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._process(row)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Ingestion worker error on job {row['job_id']}: {e}")
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                stop = await self._run(self._beat, {job_id: dict(counters) for job_id, counters in self._progress.items()})
+                for job_id, reason in stop.items():
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        logger.info(f"Stopping ingestion job {job_id}: {reason}")
+                        task.cancel()
+                requeued = await self._run(self._requeue_stale)
+                if requeued:
+                    self.stats["recovered"] += requeued
+                    logger.info(f"Requeued {requeued} ingestion jobs whose worker stopped responding")
+                    self._wakeup.set()
+            except Exception as e:
+                logger.error(f"Ingestion heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def start(self):
+        if self._workers:
+            return
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stops the workers and hands unfinished jobs back to the queue for any other worker"""
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers, self._heartbeat = [], None
+        released = await self._run(self._release)
+        if released:
+            logger.info(f"Returned {released} unfinished ingestion jobs to the queue")
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "owner": self.owner, "running": len(self._running)}
+
+
+# Global ingestion queue instance
+_ingest_queue: Optional[IngestJobQueue] = None
+
+
+async def get_ingest_queue() -> IngestJobQueue:
+    """Get or create the global ingestion queue (its workers start with it)"""
+    global _ingest_queue
+    if _ingest_queue is None:
+        _ingest_queue = IngestJobQueue(
+            db_path=settings.ingest_jobs_db_path,
+            upload_dir=settings.ingest_upload_dir,
+            workers=settings.ingest_workers,
+            max_pending=settings.ingest_max_pending,
+            job_ttl=settings.ingest_job_ttl,
+            heartbeat_interval=settings.ingest_heartbeat_interval,
+            owner_timeout=settings.ingest_owner_timeout,
+            poll_interval=settings.ingest_poll_interval,
+        )
+        await _ingest_queue.start()
+    return _ingest_queue
+
+
+async def close_ingest_queue():
+    global _ingest_queue
+    if _ingest_queue is not None:
+        await _ingest_queue.stop()
+        _ingest_queue = None
+
+
+def get_ingest_stats() -> Dict[str, Any]:
+    return _ingest_queue.get_stats() if _ingest_queue is not None else {}
@@ -2,18 +2,21 @@ import asyncio
 import random
 import time
 import os
-from typing import List, Optional, Dict, Any
+from collections import Counter, OrderedDict
+from typing import List, Optional, Dict, Any, Set, Tuple
 from concurrent.futures import ThreadPoolExecutor
 import logging
 
 # LangChain / OpenAI wrappers you already used
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from openai import OpenAI
 from langchain_core.runnables import RunnablePassthrough, RunnableParallel, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableConfig
 
 # RateLimitError can live in different places depending on SDK version.
 # Import defensively and fallback to a sentinel exception type.
@@ -28,6 +31,9 @@ except Exception:
 
 from chatbot.core.config import settings
 from chatbot.models.api_models import RAGConfig
+from chatbot.utils.embedding_cache import cached_embeddings
+from chatbot.services.query_contextualizer import QueryContextualizer
+from chatbot.utils.context_packer import ContextPacker
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +79,10 @@ class LLMConnectionPool:
 
     async def get_llm(self) -> ChatOpenAI:
         """Get an LLM instance from the pool (round-robin)"""
+        return (await self.get_slot())[1]
+
+    async def get_slot(self) -> Tuple[int, ChatOpenAI]:
+        """Next (pool index, LLM) in round-robin order; the index is stable for the pool's lifetime"""
         if not self._initialized:
             await self.initialize()
 
@@ -80,7 +90,7 @@ class LLMConnectionPool:
             if not self._llm_pool:
                 raise ValueError("LLM pool is empty")
             self._current_index = (self._current_index + 1) % len(self._llm_pool)
-            return self._llm_pool[self._current_index]
+            return self._current_index, self._llm_pool[self._current_index]
 
     async def get_random_llm(self) -> ChatOpenAI:
         if not self._initialized:
@@ -88,14 +98,92 @@ class LLMConnectionPool:
         return random.choice(self._llm_pool)
 
 
+class BatchingEmbeddings(Embeddings):
+    """
+    Collects concurrent `aembed_query` calls for up to `max_wait` seconds or
+    `max_batch` texts and sends them as one `aembed_documents` request; each
+    caller gets its own vector back. Sync calls pass straight through.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_wait: float, max_batch: int):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batch_sizes: Counter = Counter()
+        self.stats = {"requests": 0, "batches": 0, "api_texts": 0, "errors": 0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.stats["requests"] += 1
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.stats["batches"] += 1
+        self.stats["api_texts"] += len(texts)
+        self.batch_sizes[len(batch)] += 1
+        try:
+            vectors = dict(zip(texts, await self.embeddings.aembed_documents(texts)))
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Embedding batch of {len(texts)} texts failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            # A caller may have been cancelled while waiting
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def get_stats(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        sizes = sorted(self.batch_sizes.elements())
+        return {
+            **self.stats,
+            "mean_batch_size": self.stats["requests"] / batches if batches else 0.0,
+            "p95_batch_size": sizes[int(len(sizes) * 0.95)] if sizes else 0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
+
+
 class EmbeddingService:
-    """Service for embeddings"""
+    """Service for embeddings; one instance per process, shared by retrieval and the semantic cache"""
 
     def __init__(self):
-        self._embeddings: Optional[OpenAIEmbeddings] = None
+        self._embeddings: Optional[Embeddings] = None
+        self._batcher: Optional[BatchingEmbeddings] = None
         self._init_lock = asyncio.Lock()
 
-    async def get_embeddings(self) -> OpenAIEmbeddings:
+    async def get_embeddings(self) -> Embeddings:
         # Ensure at least one API key is available
         api_keys = getattr(settings, 'api_keys', [os.getenv("OPENAI_API_KEY")])
         api_keys = [key for key in api_keys if key]
@@ -108,17 +196,35 @@ class EmbeddingService:
                 if self._embeddings is None:
                     # Use the first available API key
                     try:
-                        self._embeddings = OpenAIEmbeddings(openai_api_key=api_keys[0])
+                        embeddings = OpenAIEmbeddings(model=settings.embedding_model, openai_api_key=api_keys[0])
                     except TypeError:
                         # Some versions accept api_key param named differently; fallback
-                        self._embeddings = OpenAIEmbeddings(api_key=api_keys[0])
+                        embeddings = OpenAIEmbeddings(model=settings.embedding_model, api_key=api_keys[0])
+                    if settings.enable_embedding_batching:
+                        # Only cache misses reach the batcher
+                        self._batcher = BatchingEmbeddings(
+                            embeddings,
+                            max_wait=settings.embedding_batch_max_wait,
+                            max_batch=settings.embedding_batch_max_size,
+                        )
+                        embeddings = self._batcher
+                    self._embeddings = cached_embeddings(embeddings)
         return self._embeddings
 
+    def get_stats(self) -> Dict[str, Any]:
+        return {"batching": self._batcher.get_stats() if self._batcher else None}
+
     async def embed_query(self, query: str) -> List[float]:
         embeddings = await self.get_embeddings()
-        # Run in executor as some embedding calls can block
-        result = await asyncio.get_event_loop().run_in_executor(None, embeddings.embed_query, query)
-        return result
+        # Cached queries return without leaving the event loop
+        return await embeddings.aembed_query(query)
+
+
+def _bound_retriever(config: RunnableConfig):
+    retriever = config.get("configurable", {}).get("retriever")
+    if retriever is None:
+        raise ValueError("No retriever bound to the RAG chain (configurable.retriever).")
+    return retriever
 
 
 class LLMService:
@@ -126,9 +232,26 @@ class LLMService:
 
     def __init__(self):
         self.llm_pool = LLMConnectionPool(getattr(settings, 'max_workers', 3))
-        self.embedding_service = EmbeddingService()
+        self.embedding_service = _shared_embedding_service()
         self.executor = ThreadPoolExecutor(max_workers=getattr(settings, 'max_workers', 3))
         self.llm = self._initialize_llm()
+        # Compiled RAG chains keyed by (model, pool slot); the retriever is bound per call
+        self._rag_chains: "OrderedDict[Tuple, Runnable]" = OrderedDict()
+        self._regular_chain: Optional[Runnable] = None
+        self.chain_stats = {"hits": 0, "builds": 0, "evictions": 0, "build_ms_total": 0.0, "build_ms_max": 0.0}
+        self.contextualizer = QueryContextualizer(
+            cache_size=settings.contextualize_cache_size,
+            cache_ttl=settings.contextualize_cache_ttl,
+            history_messages=settings.contextualize_history_messages,
+            skip_standalone=settings.contextualize_skip_standalone,
+            match_threshold=settings.speculative_match_threshold,
+        )
+        self.context_packer = ContextPacker(
+            token_budget=settings.context_token_budget,
+            dedupe_threshold=settings.context_dedupe_threshold,
+        ) if settings.enable_context_packing else None
+        if settings.rag_retrieval_mode not in ("serial", "speculative"):
+            raise ValueError(f"Unknown RAG retrieval mode: {settings.rag_retrieval_mode}")
 
     def _initialize_llm(self):
         """Initializes the ChatOpenAI model."""
@@ -139,13 +262,39 @@ class LLMService:
 
     async def create_rag_chain(self, retriever, config: Optional[RAGConfig] = None):
         """
-        Creates a complete RAG chain with history awareness using modern LangChain methods.
-        This is the definitive fix.
+        Returns the RAG chain with history awareness bound to `retriever`.
+        The chain itself is compiled once per (model, pool slot) and cached;
+        binding the retriever is a cheap `with_config`. `config` does not
+        change the compiled chain: chunking and retrieval_k apply at ingest
+        and retriever creation, and temperature is fixed per pool LLM.
         """
         if not retriever:
             raise ValueError("No retriever available. Please upload documents first.")
 
-        llm = await self.llm_pool.get_llm()
+        # One chain per pool slot keeps the round-robin over API keys
+        slot, llm = await self.llm_pool.get_slot()
+        key = (getattr(llm, "model_name", None), slot)
+        chain = self._rag_chains.get(key)
+        if chain is None:
+            start_time = time.perf_counter()
+            chain = self._build_rag_chain(llm)
+            build_ms = (time.perf_counter() - start_time) * 1000
+            self.chain_stats["builds"] += 1
+            self.chain_stats["build_ms_total"] += build_ms
+            self.chain_stats["build_ms_max"] = max(self.chain_stats["build_ms_max"], build_ms)
+            self._rag_chains[key] = chain
+            while len(self._rag_chains) > settings.rag_chain_cache_size:
+                self._rag_chains.popitem(last=False)
+                self.chain_stats["evictions"] += 1
+            logger.info(f"Modern RAG chain compiled in {build_ms:.1f} ms.")
+        else:
+            self._rag_chains.move_to_end(key)
+            self.chain_stats["hits"] += 1
+
+        return chain.with_config(configurable={"retriever": retriever})
+
+    def _build_rag_chain(self, llm) -> Runnable:
+        """Compiles the RAG chain; the retriever is read from config["configurable"] at call time."""
 
         # 1. Create a chain to contextualize the user's question based on chat history.
         # This turns a follow-up question like "what about the first one?" into a standalone
@@ -164,9 +313,28 @@ class LLMService:
                 ("human", "{input}"),
             ]
         )
-        history_aware_retriever = create_history_aware_retriever(
-            llm, retriever, contextualize_q_prompt
-        )
+        rewrite_chain = contextualize_q_prompt | llm | StrOutputParser()
+        model = getattr(llm, "model_name", None)
+
+        async def retrieve_documents(inputs: Dict[str, Any], config: RunnableConfig):
+            # Only questions that lean on the history pay for the rewrite
+            retriever = _bound_retriever(config)
+            documents = await self.contextualizer.retrieve(
+                inputs["input"],
+                inputs.get("chat_history") or [],
+                rewrite=lambda: rewrite_chain.ainvoke(inputs, config),
+                retrieve=lambda query: retriever.ainvoke(query, config),
+                speculative=settings.rag_retrieval_mode == "speculative",
+            )
+            if self.context_packer is not None:
+                # Stitch overlapping chunks, drop repeats and fit the prompt's token budget
+                try:
+                    documents = self.context_packer.pack(documents, model)
+                except Exception as e:
+                    logger.warning(f"Context packing failed, using the raw chunks: {e}")
+            return documents
+
+        history_aware_retriever = RunnableLambda(retrieve_documents).with_config(run_name="chat_retriever_chain")
 
         # 2. Create the main prompt for answering the question using the retrieved context.
         # This prompt correctly includes the {context} placeholder.
@@ -191,19 +359,28 @@ class LLMService:
 
         # 4. Combine the history-aware retriever and the answering chain.
         # This is the final, complete RAG chain.
-        rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-
-        logger.info("Modern RAG chain created successfully.")
-        return rag_chain
+        return create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
     async def create_regular_chain(self):
         """Creates a regular conversational chain without RAG."""
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a helpful assistant."),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}"),
-        ])
-        return prompt | self.llm | StrOutputParser()
+        if self._regular_chain is None:
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", "You are a helpful assistant."),
+                MessagesPlaceholder(variable_name="history"),
+                ("human", "{input}"),
+            ])
+            self._regular_chain = prompt | self.llm | StrOutputParser()
+        return self._regular_chain
+
+    def get_chain_stats(self) -> Dict[str, Any]:
+        builds = self.chain_stats["builds"]
+        return {
+            **self.chain_stats,
+            "cached": len(self._rag_chains),
+            "build_ms_avg": self.chain_stats["build_ms_total"] / builds if builds else 0.0,
+            "contextualize": self.contextualizer.get_stats(),
+            "context_packing": self.context_packer.get_stats() if self.context_packer else None,
+        }
 
     async def invoke_with_retry(self, chain, input_data: Dict[str, Any], session_config: Dict[str, Any], max_retries: int = 3) -> Dict[str, Any]:
         """Invoke chain with retry logic for rate limiting"""
@@ -254,7 +431,7 @@ class LLMService:
             raise last_exception
         raise RuntimeError("Unknown error in invoke_with_retry")
 
-    async def get_embeddings(self) -> OpenAIEmbeddings:
+    async def get_embeddings(self) -> Embeddings:
         """Get embeddings instance"""
         return await self.embedding_service.get_embeddings()
 
@@ -292,8 +469,21 @@ class LLMService:
         logger.info("LLM service cleaned up")
 
 
-# Global service instance
+# Global service instances
 _llm_service: Optional[LLMService] = None
+_embedding_service: Optional[EmbeddingService] = None
+
+
+def _shared_embedding_service() -> EmbeddingService:
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService()
+    return _embedding_service
+
+
+async def get_embedding_service() -> EmbeddingService:
+    """Get the process-wide embedding service (cache + micro-batcher in front of the API)"""
+    return _shared_embedding_service()
 
 
 async def get_llm_service() -> LLMService:
@@ -302,4 +492,14 @@ async def get_llm_service() -> LLMService:
     if _llm_service is None:
         _llm_service = LLMService()
         await _llm_service.llm_pool.initialize()
-    return _llm_service
\ No newline at end of file
+    return _llm_service
+
+
+def get_embedding_stats() -> Dict[str, Any]:
+    """Embedding stats of the global embedding service (empty until it has been created)"""
+    return _embedding_service.get_stats() if _embedding_service else {}
+
+
+def get_chain_stats() -> Dict[str, Any]:
+    """RAG chain cache stats of the global LLM service (empty until it has been created)"""
+    return _llm_service.get_chain_stats() if _llm_service else {}
@@ -0,0 +1,178 @@
+import asyncio
+import time
+import random
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from firebase_admin import firestore as fa_firestore
+
+from chatbot.core.config import settings
+from chatbot.services.firestore_service import FirestoreService, get_firestore_service
+
+logger = logging.getLogger(__name__)
+
+
+class BotMessageOutbox:
+    """
+    Bounded queue of bot replies drained by a background worker.
+
+    The worker groups queued messages into Firestore batch commits, retries
+    failed commits with backoff and drains the queue on shutdown. `createAt` is
+    the commit's SERVER_TIMESTAMP, like user messages; a batch holding several
+    replies for one group is committed in rounds so each reply gets a later
+    timestamp than the previous one.
+    """
+
+    def __init__(self, firestore_service: FirestoreService):
+        self.db = firestore_service
+        self.batch_size = settings.outbox_batch_size
+        self.max_wait = settings.outbox_max_wait
+        self.max_retries = settings.outbox_max_retries
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.outbox_max_queue)
+        self._worker: Optional[asyncio.Task] = None
+        self._persist_latencies: deque = deque(maxlen=500)
+        self._batch_sizes: deque = deque(maxlen=500)
+        self.stats = {
+            "enqueued": 0,
+            "persisted": 0,
+            "overflow_direct_writes": 0,
+            "batches": 0,
+            "retries": 0,
+            "dropped": 0,
+        }
+
+    async def enqueue(self, group_id: str, message_data: Dict[str, Any]):
+        """Queue a message for persistence; writes inline only if the queue is full"""
+        if not self.db.available:
+            return
+        item = (group_id, message_data, time.monotonic())
+        try:
+            self.queue.put_nowait(item)
+            self.stats["enqueued"] += 1
+        except asyncio.QueueFull:
+            # Backpressure: under overload the caller pays for its own write
+            logger.warning("Bot message outbox full, writing message inline")
+            self.stats["overflow_direct_writes"] += 1
+            await self._commit([item])
+
+    async def _next_batch(self) -> List[Tuple[str, Dict[str, Any], float]]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _commit(self, batch: List[Tuple[str, Dict[str, Any], float]]):
+        """Commit a batch in rounds holding at most one message per group, in queue order"""
+        rounds: List[List[Tuple[str, Dict[str, Any], float]]] = []
+        depth: Dict[str, int] = {}
+        for item in batch:
+            index = depth.get(item[0], 0)
+            depth[item[0]] = index + 1
+            if index == len(rounds):
+                rounds.append([])
+            rounds[index].append(item)
+        for items in rounds:
+            await self._commit_round(items)
+
+    async def _commit_round(self, batch: List[Tuple[str, Dict[str, Any], float]]):
+        """Commit messages with exponential backoff; drops them after max_retries"""
+        messages = [
+            (group_id, {**message_data, "createAt": fa_firestore.SERVER_TIMESTAMP})
+            for group_id, message_data, _ in batch
+        ]
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.db.batch_add_group_messages(messages)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    self.stats["dropped"] += len(batch)
+                    logger.error(f"Dropping {len(batch)} bot messages after {attempt + 1} attempts: {e}")
+                    return
+                self.stats["retries"] += 1
+                delay = min(10.0, 0.2 * (2 ** attempt)) + random.uniform(0, 0.1)
+                logger.warning(f"Bot message batch commit failed, retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+        now = time.monotonic()
+        self._persist_latencies.extend((now - enqueued_at) * 1000 for _, _, enqueued_at in batch)
+        self._batch_sizes.append(len(batch))
+        self.stats["batches"] += 1
+        self.stats["persisted"] += len(batch)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Let the worker drain the queue, then stop it and flush anything left"""
+        if self._worker is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Bot message outbox not drained after {timeout}s, flushing inline")
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        remaining = []
+        while not self.queue.empty():
+            remaining.append(self.queue.get_nowait())
+            self.queue.task_done()
+        for i in range(0, len(remaining), self.batch_size):
+            await self._commit(remaining[i:i + self.batch_size])
+        if remaining:
+            logger.info(f"Flushed {len(remaining)} queued bot messages on shutdown")
+
+    def get_stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._persist_latencies)
+        sizes = list(self._batch_sizes)
+        return {
+            **self.stats,
+            "queue_depth": self.queue.qsize(),
+            "avg_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "max_batch_size": max(sizes) if sizes else 0,
+            "persist_latency_ms_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "persist_latency_ms_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
+
+
+# Global outbox instance
+_outbox: Optional[BotMessageOutbox] = None
+
+
+async def get_message_outbox() -> BotMessageOutbox:
+    """Get or create the global bot message outbox"""
+    global _outbox
+    if _outbox is None:
+        firestore_service = await get_firestore_service()
+        _outbox = BotMessageOutbox(firestore_service)
+        _outbox.start()
+    return _outbox
+
+
+async def close_message_outbox():
+    global _outbox
+    if _outbox is not None:
+        await _outbox.stop()
+        _outbox = None
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import logging
+from typing import List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from chatbot.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOpenAIClientPool:
+    """Process-wide pool of AsyncOpenAI clients sharing one keep-alive connection pool"""
+
+    def __init__(self):
+        self._clients: List[AsyncOpenAI] = []
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._init_lock = asyncio.Lock()
+        self._current_index = -1
+
+    async def initialize(self):
+        """Create the shared HTTP client and one AsyncOpenAI client per API key"""
+        if self._clients:
+            return
+
+        async with self._init_lock:
+            if self._clients:
+                return
+
+            api_keys = getattr(settings, 'api_keys', []) or [os.getenv("OPENAI_API_KEY")]
+            api_keys = [key for key in api_keys if key]
+            if not api_keys:
+                raise ValueError("OPENAI_API_KEY not set")
+
+            # One HTTP connection pool for every client so the cap applies process-wide
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.openai_max_connections,
+                    max_keepalive_connections=settings.openai_max_keepalive_connections,
+                    keepalive_expiry=settings.openai_keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(settings.openai_timeout, connect=10.0),
+            )
+            self._clients = [
+                AsyncOpenAI(api_key=api_key, http_client=self._http_client)
+                for api_key in api_keys
+            ]
+            logger.info(
+                f"AsyncOpenAI pool initialized with {len(self._clients)} client(s), "
+                f"max {settings.openai_max_connections} connections"
+            )
+
+    async def get_client(self) -> AsyncOpenAI:
+        """Get a client from the pool (round-robin over API keys)"""
+        if not self._clients:
+            await self.initialize()
+        self._current_index = (self._current_index + 1) % len(self._clients)
+        return self._clients[self._current_index]
+
+    async def close(self):
+        """Close pooled connections"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._clients = []
+        logger.info("AsyncOpenAI pool closed")
+
+
+# Global pool instance
+_client_pool: Optional[AsyncOpenAIClientPool] = None
+
+
+async def get_openai_client_pool() -> AsyncOpenAIClientPool:
+    """Get or create the global AsyncOpenAI client pool"""
+    global _client_pool
+    if _client_pool is None:
+        _client_pool = AsyncOpenAIClientPool()
+    return _client_pool
+
+
+async def close_openai_client_pool():
+    """Close the global pool if it was created"""
+    global _client_pool
+    if _client_pool is not None:
+        await _client_pool.close()
+        _client_pool = None
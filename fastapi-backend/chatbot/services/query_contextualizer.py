@@ -0,0 +1,136 @@
+import re
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from cachetools import TTLCache
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+
+from chatbot.utils.shared_cache import content_digest, normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Words that usually point back into the conversation ("what about the second one?")
+_REFERENTIAL_CUES = re.compile(
+    r"\b(it|its|they|them|their|theirs|this|that|these|those|he|him|his|she|her|hers|"
+    r"one|ones|former|latter|above|previous|earlier|same|also|again|more|else|another)\b"
+    r"|^(and|but|so|or|what about|how about|why not)\b"
+)
+# Queries this short are too terse to trust as standalone ("why?", "and the deadline?")
+_MIN_STANDALONE_WORDS = 4
+
+NO_HISTORY = "no_history"
+STANDALONE = "standalone"
+CACHED = "cached"
+REWRITTEN = "rewritten"
+FAILED = "failed"
+
+
+class QueryContextualizer:
+    """
+    Decides whether a follow-up question must be rewritten into a standalone
+    one before retrieval. The LLM rewrite is skipped when there is no history
+    or the query carries no referential cues, and rewrites are cached by
+    (digest of the recent history, query).
+
+    In speculative mode, retrieval for the raw query starts while the rewrite
+    is in flight; its results are used when the rewrite comes back (nearly)
+    unchanged, measured by word-set overlap against `match_threshold`.
+    """
+
+    def __init__(self, cache_size: int, cache_ttl: float, history_messages: int, skip_standalone: bool = True,
+                 match_threshold: float = 0.8):
+        self.history_messages = history_messages
+        self.skip_standalone = skip_standalone
+        self.match_threshold = match_threshold
+        self._rewrites = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.paths = {NO_HISTORY: 0, STANDALONE: 0, CACHED: 0, REWRITTEN: 0, FAILED: 0}
+        self.speculation = {"attempts": 0, "hits": 0, "misses": 0, "errors": 0}
+
+    @staticmethod
+    def is_standalone(query: str) -> bool:
+        normalized = normalize_query(query)
+        return len(normalized.split()) >= _MIN_STANDALONE_WORDS and not _REFERENTIAL_CUES.search(normalized)
+
+    def cache_key(self, query: str, history: Sequence[BaseMessage]) -> str:
+        recent = history[-self.history_messages:] if self.history_messages else []
+        return content_digest(*(f"{message.type}:{message.content}" for message in recent), normalize_query(query))
+
+    def classify(self, query: str, history: Sequence[BaseMessage]) -> Tuple[str, str]:
+        """Returns (path, query) when no LLM call is needed, or (REWRITTEN, cache key) when it is"""
+        if not history:
+            return NO_HISTORY, query
+        if self.skip_standalone and self.is_standalone(query):
+            return STANDALONE, query
+        key = self.cache_key(query, history)
+        cached = self._rewrites.get(key)
+        if cached is not None:
+            return CACHED, cached
+        return REWRITTEN, key
+
+    async def contextualize(self, query: str, history: Sequence[BaseMessage],
+                            rewrite: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """Returns (standalone query, path taken); `rewrite` is only awaited on a cache miss"""
+        path, value = self.classify(query, history)
+        if path != REWRITTEN:
+            self.paths[path] += 1
+            return value, path
+        try:
+            rewritten = (await rewrite()).strip() or query
+        except Exception as e:
+            # Retrieving with the raw question beats failing the whole answer
+            logger.warning(f"Question rewrite failed, using the raw query: {e}")
+            self.paths[FAILED] += 1
+            return query, FAILED
+        self._rewrites[value] = rewritten
+        self.paths[REWRITTEN] += 1
+        return rewritten, REWRITTEN
+
+    def queries_match(self, raw: str, rewritten: str) -> bool:
+        a, b = set(normalize_query(raw).split()), set(normalize_query(rewritten).split())
+        if not a or not b:
+            return a == b
+        return len(a & b) / len(a | b) >= self.match_threshold
+
+    async def retrieve(self, query: str, history: Sequence[BaseMessage], rewrite: Callable[[], Awaitable[str]],
+                       retrieve: Callable[[str], Awaitable[List[Document]]], speculative: bool = False) -> List[Document]:
+        """Contextualizes the query and retrieves for it, speculating on the raw query if asked to"""
+        if not speculative or self.classify(query, history)[0] != REWRITTEN:
+            standalone, _ = await self.contextualize(query, history, rewrite)
+            return await retrieve(standalone)
+
+        self.speculation["attempts"] += 1
+        guess = asyncio.ensure_future(retrieve(query))
+        # A discarded guess may still fail; don't let that surface as an unretrieved exception
+        guess.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            standalone, _ = await self.contextualize(query, history, rewrite)
+        except BaseException:
+            guess.cancel()
+            raise
+        if self.queries_match(query, standalone):
+            try:
+                documents = await guess
+                self.speculation["hits"] += 1
+                return documents
+            except Exception as e:
+                self.speculation["errors"] += 1
+                logger.warning(f"Speculative retrieval failed, retrying with the rewritten query: {e}")
+        else:
+            self.speculation["misses"] += 1
+            guess.cancel()
+        return await retrieve(standalone)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = sum(self.paths.values())
+        attempts = self.speculation["attempts"]
+        return {
+            **self.paths,
+            "llm_skip_rate": (total - self.paths[REWRITTEN] - self.paths[FAILED]) / total if total else 0.0,
+            "cached_rewrites": len(self._rewrites),
+            "speculation": {
+                **self.speculation,
+                "hit_rate": self.speculation["hits"] / attempts if attempts else 0.0,
+            },
+        }
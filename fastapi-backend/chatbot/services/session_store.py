@@ -0,0 +1,172 @@
+import sys
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+logger = logging.getLogger(__name__)
+
+HUMAN = "h"
+AI = "a"
+
+Summary = Tuple[str, str]  # (text, digest of the last summarized record pair)
+
+# Rough per-record overhead of a (role, content) tuple on top of the text itself
+_RECORD_OVERHEAD = 64
+
+
+class ConversationHistory:
+    """
+    Compact chat history stored as (role, content) records, plus the rolling
+    summary of older messages if one was written. LangChain message objects
+    are only built when `messages` is read.
+    """
+
+    __slots__ = ("records", "size_bytes", "summary")
+
+    def __init__(self, records: Optional[List[Tuple[str, str]]] = None, summary: Optional[Summary] = None):
+        self.records: List[Tuple[str, str]] = []
+        self.size_bytes = sys.getsizeof(self.records)
+        self.summary = summary
+        for role, content in records or []:
+            self.add_message(role, content)
+
+    def add_message(self, role: str, content: str):
+        self.records.append((role, content))
+        self.size_bytes += len(content.encode("utf-8")) + _RECORD_OVERHEAD
+
+    def add_user_message(self, message: str):
+        self.add_message(HUMAN, message)
+
+    def add_ai_message(self, message: str):
+        self.add_message(AI, message)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return [
+            HumanMessage(content=content) if role == HUMAN else AIMessage(content=content)
+            for role, content in self.records
+        ]
+
+    def clear(self):
+        self.records = []
+        self.size_bytes = sys.getsizeof(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+def _default_sizeof(value: Any) -> int:
+    return getattr(value, "size_bytes", None) or sys.getsizeof(value)
+
+
+class SessionStore:
+    """
+    In-memory key/value store with LRU + idle-TTL eviction and a byte budget.
+
+    Values that change size in place (e.g. a ConversationHistory being appended to)
+    should be re-measured with `touch(key)` after mutation.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        idle_ttl: float,
+        max_bytes: int,
+        sizeof: Callable[[Any], int] = _default_sizeof,
+    ):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()  # key -> [value, size, last_access]
+        self.total_bytes = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evicted_lru": 0,
+            "evicted_idle": 0,
+            "evicted_bytes": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def _expired(self, entry: list, now: float) -> bool:
+        return now - entry[2] > self.idle_ttl
+
+    def _remove(self, key: Hashable) -> Any:
+        value, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is None or self._expired(entry, now):
+            if entry is not None:
+                self._remove(key)
+                self.stats["evicted_idle"] += 1
+            self.stats["misses"] += 1
+            return default
+        entry[2] = now
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        if key in self._entries:
+            self._remove(key)
+        size = self._sizeof(value)
+        self._entries[key] = [value, size, time.monotonic()]
+        self.total_bytes += size
+        self._enforce_limits()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def touch(self, key: Hashable):
+        """Re-measure a value after in-place mutation and apply limits"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        size = self._sizeof(entry[0])
+        self.total_bytes += size - entry[1]
+        entry[1] = size
+        entry[2] = time.monotonic()
+        self._entries.move_to_end(key)
+        self._enforce_limits()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._entries:
+            return default
+        return self._remove(key)
+
+    def _enforce_limits(self):
+        now = time.monotonic()
+        # Entries are in access order, so idle ones are at the front
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if not self._expired(entry, now):
+                break
+            self._remove(key)
+            self.stats["evicted_idle"] += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evicted_lru"] += 1
+        # Never evict the most recently used entry just to satisfy the budget
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+            self.stats["evicted_bytes"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._entries), "bytes": self.total_bytes}
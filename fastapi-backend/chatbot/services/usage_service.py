@@ -0,0 +1,281 @@
+import asyncio
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from firebase_admin import firestore as fa_firestore
+
+from chatbot.core.config import settings
+from chatbot.services.firestore_service import FirestoreService, get_firestore_service
+
+logger = logging.getLogger(__name__)
+
+
+def _today_str() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class _GroupUsage:
+    """Local view of one group's daily counters"""
+
+    __slots__ = ("date_key", "explain_calls", "notes_calls", "pending_explain", "pending_notes",
+                 "remote_date_key", "synced_at", "last_used")
+
+    def __init__(self, date_key: str):
+        self.date_key = date_key
+        self.explain_calls = 0  # remote base + local pending
+        self.notes_calls = 0
+        self.pending_explain = 0  # not yet flushed to Firestore
+        self.pending_notes = 0
+        self.remote_date_key: Optional[str] = None
+        self.synced_at = 0.0
+        self.last_used = time.monotonic()
+
+    @property
+    def total(self) -> int:
+        return self.explain_calls + self.notes_calls
+
+    @property
+    def pending(self) -> int:
+        return self.pending_explain + self.pending_notes
+
+    def apply_remote(self, ai_usage: Dict[str, Any], today: str):
+        """Rebase local counters on the remote values, keeping unflushed deltas"""
+        self.remote_date_key = ai_usage.get("dateKey")
+        if self.remote_date_key == today:
+            remote_explain = int(ai_usage.get("explainCallsToday", 0) or 0)
+            remote_notes = int(ai_usage.get("notesCallsToday", 0) or 0)
+        else:
+            remote_explain = remote_notes = 0
+        self.explain_calls = remote_explain + self.pending_explain
+        self.notes_calls = remote_notes + self.pending_notes
+        self.synced_at = time.monotonic()
+
+
+class UsageCounterService:
+    """
+    In-process daily usage counters with write-behind to Firestore.
+
+    Quota decisions are made from local state; deltas are aggregated per group
+    and flushed in periodic batches using atomic increments. Unflushed calls per
+    group are bounded by `usage_max_drift`, remote counts from other workers are
+    picked up every `usage_resync_interval` seconds.
+    """
+
+    def __init__(self, firestore_service: FirestoreService, daily_limit: int):
+        self.db = firestore_service
+        self.daily_limit = daily_limit
+        self.flush_interval = settings.usage_flush_interval
+        self.max_drift = settings.usage_max_drift
+        self.resync_interval = settings.usage_resync_interval
+
+        self._groups: Dict[str, _GroupUsage] = {}
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "checks": 0,
+            "rejected": 0,
+            "remote_reads": 0,
+            "flushes": 0,
+            "groups_flushed": 0,
+            "flush_errors": 0,
+        }
+
+    async def _ensure_loaded(self, group_id: str, today: str) -> _GroupUsage:
+        state = self._groups.get(group_id)
+        if state is not None and state.date_key == today:
+            return state
+
+        lock = self._load_locks.setdefault(group_id, asyncio.Lock())
+        async with lock:
+            state = self._groups.get(group_id)
+            if state is not None and state.date_key == today:
+                return state
+            # Cold load or daily rollover: yesterday's unflushed calls no longer count,
+            # but other workers may already have counted calls for today
+            state = _GroupUsage(today)
+            if self.db.available:
+                data = await self.db.get_group(group_id)
+                self.stats["remote_reads"] += 1
+                state.apply_remote(data.get("aiUsage", {}) or {}, today)
+            self._groups[group_id] = state
+            return state
+
+    async def try_consume(self, group_id: str, keyword: str) -> bool:
+        """Count one bot call for the group; returns False if the daily limit is reached"""
+        self.stats["checks"] += 1
+        today = _today_str()
+        state = await self._ensure_loaded(group_id, today)
+
+        # No awaits between the check and the increment, so concurrent
+        # mentions on this worker can't race past the limit.
+        state.last_used = time.monotonic()
+        if state.total >= self.daily_limit:
+            self.stats["rejected"] += 1
+            return False
+
+        if keyword == "@explain":
+            state.explain_calls += 1
+            state.pending_explain += 1
+        else:
+            state.notes_calls += 1
+            state.pending_notes += 1
+
+        if state.pending >= self.max_drift:
+            self._flush_requested.set()
+        return True
+
+    async def flush(self):
+        """Write aggregated deltas for every group with pending calls"""
+        if not self.db.available:
+            return
+        async with self._flush_lock:
+            today = _today_str()
+            updates: Dict[str, Dict[str, Any]] = {}
+            flushed: Dict[str, tuple] = {}
+            rollovers: Dict[str, tuple] = {}
+            for group_id, state in self._groups.items():
+                if not state.pending or state.date_key != today:
+                    continue
+                explain, notes = state.pending_explain, state.pending_notes
+                if state.remote_date_key == today:
+                    ai_usage = {"dateKey": today}
+                    if explain:
+                        ai_usage["explainCallsToday"] = fa_firestore.Increment(explain)
+                    if notes:
+                        ai_usage["notesCallsToday"] = fa_firestore.Increment(notes)
+                    updates[group_id] = {"aiUsage": ai_usage}
+                    flushed[group_id] = (explain, notes)
+                else:
+                    # Remote counters may still belong to a previous day; another worker
+                    # may be resetting them too, so reset-then-add runs in a transaction
+                    rollovers[group_id] = (explain, notes)
+                state.pending_explain -= explain
+                state.pending_notes -= notes
+
+            if rollovers:
+                await self._flush_rollovers(rollovers, today)
+            if not updates:
+                if rollovers:
+                    self.stats["flushes"] += 1
+                return
+            try:
+                await self.db.batch_merge_groups(updates)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Usage counter flush failed for {len(updates)} groups: {e}")
+                for group_id, (explain, notes) in flushed.items():
+                    self._restore(group_id, today, explain, notes)
+                return
+
+            for group_id in flushed:
+                self._groups[group_id].remote_date_key = today
+            self.stats["flushes"] += 1
+            self.stats["groups_flushed"] += len(updates)
+
+    def _restore(self, group_id: str, today: str, explain: int, notes: int):
+        """Put unflushed deltas back so the next flush retries them (unless the day rolled over)"""
+        state = self._groups.get(group_id)
+        if state is not None and state.date_key == today:
+            state.pending_explain += explain
+            state.pending_notes += notes
+
+    async def _flush_rollovers(self, rollovers: Dict[str, tuple], today: str):
+        """Flush groups whose remote counters may be from another day, one transaction each"""
+
+        async def roll(group_id: str, explain: int, notes: int):
+            try:
+                ai_usage = await self.db.add_group_usage(
+                    group_id, today, {"explainCallsToday": explain, "notesCallsToday": notes}
+                )
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Usage counter rollover failed for group {group_id}: {e}")
+                self._restore(group_id, today, explain, notes)
+                return
+            state = self._groups.get(group_id)
+            if state is not None and state.date_key == today:
+                # The transaction read every worker's calls so far: rebase on them
+                state.apply_remote(ai_usage, today)
+            self.stats["groups_flushed"] += 1
+
+        await asyncio.gather(*(roll(group_id, *deltas) for group_id, deltas in rollovers.items()))
+
+    async def _resync_stale(self):
+        """Re-read counters of recently active groups so other workers' calls count"""
+        if not self.db.available:
+            return
+        now = time.monotonic()
+        today = _today_str()
+        for group_id, state in list(self._groups.items()):
+            if now - state.last_used > 24 * 3600:
+                self._groups.pop(group_id, None)
+                self._load_locks.pop(group_id, None)
+                continue
+            if state.date_key != today or now - state.synced_at < self.resync_interval:
+                continue
+            try:
+                data = await self.db.get_group(group_id)
+                self.stats["remote_reads"] += 1
+                state.apply_remote(data.get("aiUsage", {}) or {}, today)
+            except Exception as e:
+                logger.warning(f"Usage counter resync failed for group {group_id}: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+                await self._resync_stale()
+            except Exception as e:
+                logger.error(f"Usage counter background loop error: {e}")
+
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background loop and flush whatever is left"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "groups_tracked": len(self._groups),
+            "pending_calls": sum(state.pending for state in self._groups.values()),
+        }
+
+
+# Global service instance
+_usage_service: Optional[UsageCounterService] = None
+
+
+async def get_usage_service() -> UsageCounterService:
+    """Get or create the global usage counter service"""
+    global _usage_service
+    if _usage_service is None:
+        firestore_service = await get_firestore_service()
+        _usage_service = UsageCounterService(firestore_service, settings.daily_group_limit)
+        _usage_service.start()
+    return _usage_service
+
+
+async def close_usage_service():
+    global _usage_service
+    if _usage_service is not None:
+        await _usage_service.stop()
+        _usage_service = None
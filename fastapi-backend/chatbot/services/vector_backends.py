@@ -0,0 +1,738 @@
+import os
+import re
+import json
+import uuid
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from cachetools import LRUCache, TTLCache
+from pinecone import Pinecone, ServerlessSpec
+from langchain_pinecone import PineconeVectorStore
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain.schema import Document
+
+from chatbot.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ScoredDocument = Tuple[Document, float]
+MetadataPredicate = Callable[[Dict[str, Any]], bool]
+
+PINECONE_DELETE_BATCH = 1000  # max ids per delete request
+
+
+class VectorBackend(ABC):
+    """Per-group vector storage used by VectorStoreService"""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    @abstractmethod
+    async def add_texts(self, group_id: str, texts: List[str], metadatas: List[Dict[str, Any]],
+                        ids: Optional[List[str]] = None) -> int:
+        """Embed and store texts in the group; existing ids are overwritten. Returns the count stored"""
+
+    @abstractmethod
+    async def search(self, group_id: str, query: str, k: int) -> List[ScoredDocument]:
+        """Top-k documents of the group by cosine similarity, best first"""
+
+    @abstractmethod
+    def search_vector(self, group_id: str, embedding: List[float], k: int) -> List[ScoredDocument]:
+        """Like `search` for an already embedded query (blocking)"""
+
+    @abstractmethod
+    async def count(self, group_id: str) -> Optional[int]:
+        """Number of vectors stored for the group, or None if it has no index at all"""
+
+    @abstractmethod
+    async def clear(self, group_id: str) -> bool:
+        """Delete every vector of the group; returns False if there was nothing to clear"""
+
+    @abstractmethod
+    def get_retriever(self, group_id: str, k: int) -> BaseRetriever:
+        """LangChain retriever over the group"""
+
+    @abstractmethod
+    async def list_ids(self, group_id: str, prefix: str) -> Optional[List[str]]:
+        """Ids in the group starting with `prefix`, or None if the backend can't list them"""
+
+    @abstractmethod
+    async def delete(self, group_id: str, ids: List[str]):
+        """Delete vectors of the group by id"""
+
+    async def delete_legacy(self, group_id: str, source_file: str) -> bool:
+        """Delete the file's vectors from before chunks carried `chunk_digest`; False if it couldn't"""
+        return False
+
+    async def delete_other_versions(self, group_id: str, source_file: str, version: str) -> bool:
+        """Delete the file's vectors whose `file_version` isn't `version`; False if it couldn't"""
+        return False
+
+    async def initialize(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class BackendRetriever(BaseRetriever):
+    """Retriever over one group of a VectorBackend; async retrieval embeds through `aembed_query`"""
+
+    backend: Any
+    group_id: str
+    k: int
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector = self.backend.embeddings.embed_query(query)
+        return [doc for doc, _ in self.backend.search_vector(self.group_id, vector, self.k)]
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return [doc for doc, _ in await self.backend.search(self.group_id, query, self.k)]
+
+
+# --- Pinecone ---
+
+class PineconeBackend(VectorBackend):
+    """
+    Pinecone storage with each group's vectors in its own namespace. In
+    "per_group" mode every group also gets its own index; in "shared" mode
+    all groups live in one index, so new groups need no index creation.
+    """
+
+    def __init__(self, embeddings: Embeddings, api_key: str, index_mode: str = "per_group"):
+        super().__init__(embeddings)
+        if index_mode not in ("per_group", "shared"):
+            raise ValueError(f"Unknown Pinecone index mode: {index_mode}")
+        self.pc = Pinecone(api_key=api_key)
+        self.index_mode = index_mode
+        self._shared_index_ready = False
+        # Data-plane handles are reused instead of rebuilt per request
+        self._index_handles = LRUCache(maxsize=settings.pinecone_handle_cache_size)
+        self._vector_stores = LRUCache(maxsize=settings.pinecone_handle_cache_size)
+        # Control-plane list_indexes() result, refreshed every pinecone_index_list_ttl seconds
+        self._index_names = TTLCache(maxsize=1, ttl=settings.pinecone_index_list_ttl)
+        self.stats = {"list_indexes_calls": 0, "handle_hits": 0, "handle_misses": 0}
+
+    @staticmethod
+    def base_index_name() -> str:
+        return os.getenv("PINECONE_INDEX_NAME", "chatbot-rag")
+
+    def _get_index_name(self, group_id: str) -> str:
+        """Generate index name for a group"""
+        if self.index_mode == "shared":
+            return self.base_index_name()
+        safe_group_id = group_id.lower().replace("_", "-").replace(" ", "-")
+        return f"{self.base_index_name()}-{safe_group_id}"
+
+    async def _list_index_names(self) -> Set[str]:
+        names = self._index_names.get("names")
+        if names is None:
+            loop = asyncio.get_event_loop()
+            names = await loop.run_in_executor(None, lambda: {idx["name"] for idx in self.pc.list_indexes()})
+            self.stats["list_indexes_calls"] += 1
+            self._index_names["names"] = names
+        return names
+
+    def invalidate_index_names(self):
+        """Forget the cached index list (call after creating or deleting an index)"""
+        self._index_names.clear()
+
+    def _get_index(self, index_name: str):
+        index = self._index_handles.get(index_name)
+        if index is None:
+            self.stats["handle_misses"] += 1
+            index = self.pc.Index(index_name)
+            self._index_handles[index_name] = index
+        else:
+            self.stats["handle_hits"] += 1
+        return index
+
+    async def _ensure_index_exists(self, group_id: str) -> str:
+        """Ensure Pinecone index exists for the group"""
+        index_name = self._get_index_name(group_id)
+        if self.index_mode == "shared" and self._shared_index_ready:
+            return index_name
+        loop = asyncio.get_event_loop()
+        try:
+            existing_indexes = await self._list_index_names()
+            if index_name not in existing_indexes:
+                # Another worker may have created it since the list was cached
+                self.invalidate_index_names()
+                existing_indexes = await self._list_index_names()
+            if index_name not in existing_indexes:
+                logger.info(f"Creating new index: {index_name}")
+                await loop.run_in_executor(
+                    None,
+                    lambda: self.pc.create_index(
+                        name=index_name,
+                        dimension=1536,
+                        metric="cosine",
+                        spec=ServerlessSpec(
+                            cloud=os.getenv("PINECONE_CLOUD", "aws"),
+                            region=os.getenv("PINECONE_REGION", "us-east-1")
+                        )
+                    )
+                )
+                self.invalidate_index_names()
+                # Wait until the index is ready
+                while True:
+                    status = await loop.run_in_executor(
+                        None, lambda: self.pc.describe_index(index_name).status
+                    )
+                    if status.ready:
+                        logger.info(f"Index {index_name} is ready.")
+                        break
+                    logger.info(f"Waiting for index {index_name} to be ready...")
+                    await asyncio.sleep(5)
+            if self.index_mode == "shared":
+                self._shared_index_ready = True
+            return index_name
+        except Exception as e:
+            logger.error(f"Error ensuring index exists: {e}")
+            raise
+
+    async def initialize(self):
+        """In shared mode, make sure the shared index exists before the first upload needs it"""
+        if self.index_mode == "shared":
+            await self._ensure_index_exists("")
+
+    def _get_vector_store(self, group_id: str) -> PineconeVectorStore:
+        """Return a vector store bound to group namespace"""
+        vector_store = self._vector_stores.get(group_id)
+        if vector_store is None:
+            vector_store = PineconeVectorStore(
+                index=self._get_index(self._get_index_name(group_id)),
+                embedding=self.embeddings,
+                text_key="text",
+                namespace=group_id
+            )
+            self._vector_stores[group_id] = vector_store
+        return vector_store
+
+    async def add_texts(self, group_id: str, texts: List[str], metadatas: List[Dict[str, Any]],
+                        ids: Optional[List[str]] = None) -> int:
+        if not texts:
+            return 0
+        await self._ensure_index_exists(group_id)
+        vector_store = self._get_vector_store(group_id)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            None,
+            lambda: vector_store.add_texts(texts=texts, metadatas=metadatas, ids=ids, namespace=group_id)
+        )
+        return len(texts)
+
+    def search_vector(self, group_id: str, embedding: List[float], k: int) -> List[ScoredDocument]:
+        return self._get_vector_store(group_id).similarity_search_by_vector_with_score(
+            embedding, k=k, namespace=group_id
+        )
+
+    async def search(self, group_id: str, query: str, k: int) -> List[ScoredDocument]:
+        # Embed on the event loop so concurrent queries share the cache and the micro-batcher
+        embedding = await self.embeddings.aembed_query(query)
+        return await asyncio.get_event_loop().run_in_executor(None, self.search_vector, group_id, embedding, k)
+
+    async def count(self, group_id: str) -> Optional[int]:
+        index_name = self._get_index_name(group_id)
+        if not (self.index_mode == "shared" and self._shared_index_ready) and index_name not in await self._list_index_names():
+            return None
+
+        index = self._get_index(index_name)
+        loop = asyncio.get_event_loop()
+        stats = await loop.run_in_executor(None, index.describe_index_stats)
+        if stats.namespaces and group_id in stats.namespaces:
+            return stats.namespaces[group_id].vector_count
+        return 0
+
+    async def clear(self, group_id: str) -> bool:
+        index_name = self._get_index_name(group_id)
+        if self.index_mode == "shared":
+            # Deleting a namespace that doesn't exist is an error in a shared index
+            if not await self.count(group_id):
+                return False
+        elif index_name not in await self._list_index_names():
+            return False
+
+        index = self._get_index(index_name)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, lambda: index.delete(delete_all=True, namespace=group_id))
+        logger.info(f"Cleared knowledge base for group {group_id} in index {index_name}")
+        return True
+
+    def get_retriever(self, group_id: str, k: int) -> BaseRetriever:
+        return BackendRetriever(backend=self, group_id=group_id, k=k)
+
+    async def list_ids(self, group_id: str, prefix: str) -> Optional[List[str]]:
+        index_name = self._get_index_name(group_id)
+        if index_name not in await self._list_index_names():
+            return []
+        index = self._get_index(index_name)
+
+        def _list():
+            return [vector_id for page in index.list(prefix=prefix, namespace=group_id) for vector_id in page]
+
+        try:
+            return await asyncio.get_event_loop().run_in_executor(None, _list)
+        except Exception as e:
+            # Listing ids is only supported on serverless indexes
+            logger.warning(f"Could not list ids in index {index_name}: {e}")
+            return None
+
+    async def delete(self, group_id: str, ids: List[str]):
+        if not ids:
+            return
+        index = self._get_index(self._get_index_name(group_id))
+        loop = asyncio.get_event_loop()
+        for start in range(0, len(ids), PINECONE_DELETE_BATCH):
+            batch = ids[start:start + PINECONE_DELETE_BATCH]
+            await loop.run_in_executor(None, lambda: index.delete(ids=batch, namespace=group_id))
+
+    async def _delete_matching(self, group_id: str, filters: List[Dict[str, Any]], predicate: MetadataPredicate) -> bool:
+        """Delete by metadata filter; serverless indexes don't support that, so scan the namespace there"""
+        index_name = self._get_index_name(group_id)
+        if index_name not in await self._list_index_names():
+            return True
+        index = self._get_index(index_name)
+        loop = asyncio.get_event_loop()
+        try:
+            for metadata_filter in filters:
+                await loop.run_in_executor(None, lambda: index.delete(filter=metadata_filter, namespace=group_id))
+            return True
+        except Exception as e:
+            logger.info(f"Delete by metadata unavailable on index {index_name}, scanning namespace '{group_id}': {e}")
+
+        def _scan():
+            matches = []
+            for page in index.list(namespace=group_id):
+                fetched = index.fetch(ids=list(page), namespace=group_id)
+                matches.extend(vector_id for vector_id, vector in fetched.vectors.items()
+                               if predicate(vector.metadata or {}))
+            return matches
+
+        try:
+            ids = await loop.run_in_executor(None, _scan)
+        except Exception as e:
+            logger.warning(f"Could not scan namespace '{group_id}' of index {index_name}: {e}")
+            return False
+        await self.delete(group_id, ids)
+        return True
+
+    async def delete_legacy(self, group_id: str, source_file: str) -> bool:
+        return await self._delete_matching(
+            group_id,
+            [{"source_file": {"$eq": source_file}, "chunk_digest": {"$exists": False}}],
+            lambda metadata: metadata.get("source_file") == source_file and not metadata.get("chunk_digest"),
+        )
+
+    async def delete_other_versions(self, group_id: str, source_file: str, version: str) -> bool:
+        return await self._delete_matching(
+            group_id,
+            [{"source_file": {"$eq": source_file}, "file_version": {"$ne": version}},
+             {"source_file": {"$eq": source_file}, "file_version": {"$exists": False}}],
+            lambda metadata: metadata.get("source_file") == source_file and metadata.get("file_version") != version,
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "pinecone",
+            "index_mode": self.index_mode,
+            **self.stats,
+            "cached_handles": len(self._index_handles),
+            "cached_vector_stores": len(self._vector_stores),
+        }
+
+
+# --- Local (NumPy) ---
+
+_UNSAFE_FILENAME = re.compile(r"[^\w.-]")
+
+
+class _IVFIndex:
+    """
+    Inverted-file approximate index: vectors are bucketed under their nearest
+    k-means centroid and a query only scores the buckets of its `nprobe`
+    nearest centroids. Covers rows [0, rows) of the matrix it was built from.
+    """
+
+    def __init__(self, matrix: np.ndarray, iterations: int = 8, seed: int = 0):
+        self.rows = len(matrix)
+        n_lists = max(1, int(np.sqrt(self.rows)))
+        rng = np.random.default_rng(seed)
+        centroids = matrix[rng.choice(self.rows, n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = matrix[assignment == c]
+                if len(members):
+                    mean = members.mean(axis=0)
+                    norm = np.linalg.norm(mean)
+                    centroids[c] = mean / norm if norm else mean
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignment == c) for c in range(n_lists)]
+
+    def candidates(self, vector: np.ndarray, nprobe: int) -> np.ndarray:
+        nearest = np.argsort(-(self.centroids @ vector))[:nprobe]
+        if not len(nearest):
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.lists[c] for c in nearest])
+
+
+class _LocalGroup:
+    """Unit-normalized float32 vectors of one group plus their texts and metadata"""
+
+    def __init__(self, dim: int = 0):
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.count = 0
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.positions: Dict[str, int] = {}
+        self.ivf: Optional[_IVFIndex] = None
+        self.building = False
+        self.stamp: Optional[Tuple[int, int]] = None  # identity of the files this copy was loaded from
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self.matrix[:self.count]
+
+    def upsert(self, doc_id: str, vector: np.ndarray, text: str, metadata: Dict[str, Any]):
+        if self.matrix.shape[1] != len(vector):
+            if self.count:
+                raise ValueError(
+                    f"Group holds {self.matrix.shape[1]}-dimensional vectors but got {len(vector)}; "
+                    f"clear the group and re-ingest its documents after changing the embedding model"
+                )
+            self.matrix = np.zeros((0, len(vector)), dtype=np.float32)
+        position = self.positions.get(doc_id)
+        if position is not None:
+            self.matrix[position] = vector
+            self.texts[position] = text
+            self.metadatas[position] = metadata
+            # The approximate index may have bucketed the old vector
+            self.ivf = None
+            return
+        if self.count == len(self.matrix):
+            grown = np.zeros((max(16, 2 * self.count), len(vector)), dtype=np.float32)
+            grown[:self.count] = self.vectors
+            self.matrix = grown
+        self.matrix[self.count] = vector
+        self.positions[doc_id] = self.count
+        self.ids.append(doc_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+        self.count += 1
+
+    def remove(self, doc_ids: List[str]):
+        drop = {self.positions[doc_id] for doc_id in doc_ids if doc_id in self.positions}
+        if not drop:
+            return
+        keep = [i for i in range(self.count) if i not in drop]
+        self.matrix = self.matrix[keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.count = len(keep)
+        self.ivf = None
+
+
+class LocalVectorBackend(VectorBackend):
+    """
+    In-process vector store: per-group float32 matrices searched with an exact
+    vectorized top-k, switching to an IVF approximate index once a group has
+    `ann_min_vectors` vectors. Groups are persisted under `directory` and
+    loaded lazily.
+
+    Several API workers may share `directory`: writes take an exclusive flock
+    on the group's lock file and re-read the group first if another process
+    replaced it, and readers reload whenever the files on disk changed.
+    Without fcntl (Windows) this is only safe with a single worker.
+    """
+
+    def __init__(self, embeddings: Embeddings, directory: str, ann_min_vectors: int, ann_nprobe: int):
+        super().__init__(embeddings)
+        self.directory = directory
+        self.ann_min_vectors = ann_min_vectors
+        self.ann_nprobe = ann_nprobe
+        self._groups: Dict[str, _LocalGroup] = {}
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+        self._tasks = set()
+        self.stats = {"searches": 0, "ann_searches": 0, "index_builds": 0, "reloads": 0}
+        if fcntl is None:
+            logger.warning("fcntl is unavailable: run a single worker with the local vector backend")
+
+    def _paths(self, group_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, _UNSAFE_FILENAME.sub("_", group_id))
+        return f"{base}.npy", f"{base}.json"
+
+    def _stamp(self, group_id: str) -> Optional[Tuple[int, int]]:
+        """Identity of the group's files on disk; every save replaces them with new inodes"""
+        try:
+            stat = os.stat(self._paths(group_id)[1])
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _lock_file(self, group_id: str, exclusive: bool):
+        """Blocking flock on the group's lock file; returns the handle to pass to _unlock_file"""
+        if fcntl is None:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, _UNSAFE_FILENAME.sub("_", group_id))
+        handle = open(f"{base}.lock", "a+")
+        fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return handle
+
+    @staticmethod
+    def _unlock_file(handle):
+        if handle is not None:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+
+    def _read(self, group_id: str, stamp: Optional[Tuple[int, int]]) -> _LocalGroup:
+        group = _LocalGroup()
+        group.stamp = stamp
+        if stamp is None:
+            return group
+        matrix_path, docs_path = self._paths(group_id)
+        try:
+            matrix = np.load(matrix_path)
+            with open(docs_path, encoding="utf-8") as f:
+                docs = json.load(f)
+            group.matrix = matrix.astype(np.float32, copy=False)
+            group.count = len(matrix)
+            group.ids, group.texts, group.metadatas = docs["ids"], docs["texts"], docs["metadatas"]
+            group.positions = {doc_id: i for i, doc_id in enumerate(group.ids)}
+        except Exception as e:
+            logger.error(f"Failed to load local vectors for group '{group_id}': {e}")
+            group = _LocalGroup()
+            group.stamp = stamp
+        return group
+
+    def _load(self, group_id: str, locked: bool = False) -> _LocalGroup:
+        """
+        The cached group, re-read if another process saved it since. `locked` means the
+        caller already holds the group's exclusive file lock.
+        """
+        group = self._groups.get(group_id)
+        write_lock = self._write_locks.get(group_id)
+        # While this process is mid-write its copy is the newest one, and a shared
+        # lock would wait on our own exclusive one
+        writing = not locked and write_lock is not None and write_lock.locked()
+        if group is not None and writing:
+            return group
+        stamp = self._stamp(group_id)
+        if group is not None and group.stamp == stamp:
+            return group
+        handle = None if locked or writing else self._lock_file(group_id, exclusive=False)
+        try:
+            # Files only change under the exclusive lock, so this stamp matches what we read
+            group = self._read(group_id, self._stamp(group_id))
+        finally:
+            self._unlock_file(handle)
+        if group_id in self._groups:
+            self.stats["reloads"] += 1
+        self._groups[group_id] = group
+        return group
+
+    @asynccontextmanager
+    async def _writing(self, group_id: str):
+        """Serializes read-modify-write of a group across tasks and processes; yields the fresh group"""
+        write_lock = self._write_locks.setdefault(group_id, asyncio.Lock())
+        async with write_lock:
+            loop = asyncio.get_event_loop()
+            handle = await loop.run_in_executor(None, self._lock_file, group_id, True)
+            try:
+                yield await loop.run_in_executor(None, self._load, group_id, True)
+            finally:
+                await loop.run_in_executor(None, self._unlock_file, handle)
+
+    def _save(self, group_id: str, matrix: np.ndarray, docs: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        os.makedirs(self.directory, exist_ok=True)
+        matrix_path, docs_path = self._paths(group_id)
+        # Write side files first, then swap them in; the docs file goes last and stamps the save
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, matrix)
+        with open(docs_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(docs, f)
+        os.replace(matrix_path + ".tmp", matrix_path)
+        os.replace(docs_path + ".tmp", docs_path)
+        return self._stamp(group_id)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        array = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(array, axis=-1, keepdims=True)
+        return array / np.where(norms == 0, 1, norms)
+
+    async def add_texts(self, group_id: str, texts: List[str], metadatas: List[Dict[str, Any]],
+                        ids: Optional[List[str]] = None) -> int:
+        if not texts:
+            return 0
+        vectors = self._normalize(await self.embeddings.aembed_documents(texts))
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        async with self._writing(group_id) as group:
+            for doc_id, vector, text, metadata in zip(ids, vectors, texts, metadatas):
+                group.upsert(doc_id, vector, text, dict(metadata))
+            await self._persist(group_id, group)
+        return len(texts)
+
+    async def _persist(self, group_id: str, group: _LocalGroup):
+        snapshot = group.vectors.copy()
+        docs = {"ids": list(group.ids), "texts": list(group.texts), "metadatas": list(group.metadatas)}
+        group.stamp = await asyncio.get_event_loop().run_in_executor(None, self._save, group_id, snapshot, docs)
+
+    async def _load_async(self, group_id: str) -> _LocalGroup:
+        """_load off the event loop: it may stat, flock and np.load the group's files"""
+        return await asyncio.get_event_loop().run_in_executor(None, self._load, group_id)
+
+    async def list_ids(self, group_id: str, prefix: str) -> Optional[List[str]]:
+        group = await self._load_async(group_id)
+        return [doc_id for doc_id in group.ids if doc_id.startswith(prefix)]
+
+    async def delete(self, group_id: str, ids: List[str]):
+        if not ids:
+            return
+        async with self._writing(group_id) as group:
+            group.remove(ids)
+            await self._persist(group_id, group)
+
+    async def _delete_matching(self, group_id: str, predicate: MetadataPredicate) -> bool:
+        async with self._writing(group_id) as group:
+            ids = [doc_id for doc_id, metadata in zip(group.ids, group.metadatas) if predicate(metadata)]
+            if ids:
+                group.remove(ids)
+                await self._persist(group_id, group)
+        return True
+
+    async def delete_legacy(self, group_id: str, source_file: str) -> bool:
+        return await self._delete_matching(
+            group_id, lambda metadata: metadata.get("source_file") == source_file and not metadata.get("chunk_digest")
+        )
+
+    async def delete_other_versions(self, group_id: str, source_file: str, version: str) -> bool:
+        return await self._delete_matching(
+            group_id,
+            lambda metadata: metadata.get("source_file") == source_file and metadata.get("file_version") != version,
+        )
+
+    def _maybe_build_index(self, group_id: str, group: _LocalGroup):
+        """Start a background IVF build when the group is large and the index is missing or stale"""
+        if group.count < self.ann_min_vectors or group.building:
+            return
+        if group.ivf is not None and group.count - group.ivf.rows < group.ivf.rows // 10:
+            return
+        group.building = True
+
+        async def build():
+            try:
+                snapshot = group.vectors.copy()
+                ivf = await asyncio.get_event_loop().run_in_executor(None, _IVFIndex, snapshot)
+                if self._groups.get(group_id) is group:
+                    group.ivf = ivf
+                    self.stats["index_builds"] += 1
+            except Exception as e:
+                logger.error(f"Failed to build approximate index for group '{group_id}': {e}")
+            finally:
+                group.building = False
+
+        task = asyncio.create_task(build())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def search_vector(self, group_id: str, embedding, k: int) -> List[ScoredDocument]:
+        group = self._load(group_id)
+        if k <= 0 or not group.count:
+            return []
+        self.stats["searches"] += 1
+        vector = self._normalize(embedding)
+        ivf = group.ivf
+        if ivf is not None:
+            # Probe the indexed prefix, score rows added since the build exactly
+            self.stats["ann_searches"] += 1
+            rows = np.concatenate([ivf.candidates(vector, self.ann_nprobe), np.arange(ivf.rows, group.count)])
+            scores = group.matrix[rows] @ vector
+        else:
+            rows = None
+            scores = group.vectors @ vector
+        if not len(scores):
+            # Every probed list was empty and nothing was added since the build
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for i in top:
+            position = int(rows[i]) if rows is not None else int(i)
+            doc = Document(page_content=group.texts[position], metadata=dict(group.metadatas[position]))
+            results.append((doc, float(scores[i])))
+        return results
+
+    async def search(self, group_id: str, query: str, k: int) -> List[ScoredDocument]:
+        embedding = await self.embeddings.aembed_query(query)
+        group = await self._load_async(group_id)
+        if group.count >= self.ann_min_vectors:
+            self._maybe_build_index(group_id, group)
+        return await asyncio.get_event_loop().run_in_executor(None, self.search_vector, group_id, embedding, k)
+
+    async def count(self, group_id: str) -> Optional[int]:
+        group = await self._load_async(group_id)
+        matrix_path, _ = self._paths(group_id)
+        if not group.count and not os.path.exists(matrix_path):
+            return None
+        return group.count
+
+    async def clear(self, group_id: str) -> bool:
+        existed = (await self.count(group_id)) is not None
+        async with self._writing(group_id):
+            for path in self._paths(group_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._groups.pop(group_id, None)
+        return existed
+
+    def get_retriever(self, group_id: str, k: int) -> BaseRetriever:
+        return BackendRetriever(backend=self, group_id=group_id, k=k)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "local",
+            **self.stats,
+            "groups_loaded": len(self._groups),
+            "vectors_loaded": sum(group.count for group in self._groups.values()),
+        }
+
+
+def create_vector_backend(embeddings: Embeddings) -> VectorBackend:
+    """Build the vector backend selected by settings.vector_backend"""
+    if settings.vector_backend == "local":
+        logger.info(f"Using local vector backend at {settings.local_vector_dir}")
+        return LocalVectorBackend(
+            embeddings,
+            settings.local_vector_dir,
+            ann_min_vectors=settings.local_ann_min_vectors,
+            ann_nprobe=settings.local_ann_nprobe,
+        )
+    if settings.vector_backend != "pinecone":
+        raise ValueError(f"Unknown vector backend: {settings.vector_backend}")
+    api_key = os.getenv("PINECONE_API_KEY")
+    if not api_key:
+        raise ValueError("PINECONE_API_KEY not found in environment variables")
+    return PineconeBackend(embeddings, api_key, index_mode=settings.pinecone_index_mode)
@@ -1,13 +1,12 @@
-import os
+import json
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import asyncio
 
-# Pinecone imports (new SDK)
-from pinecone import Pinecone, ServerlessSpec
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
 
 # LangChain imports
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -19,21 +18,56 @@ from langchain_community.document_loaders import (
     UnstructuredPowerPointLoader
 )
 from langchain.schema import Document
-from langchain.vectorstores.base import VectorStore
 
 # Your models
 from chatbot.models.api_models import FileType, KnowledgeBaseInfo, SearchQuery, SearchResponse
 from chatbot.core.config import settings
+from chatbot.utils.shared_cache import SQLiteKVStore, content_digest, get_shared_response_cache
+from chatbot.services.llm_service import get_embedding_service
+from chatbot.services.vector_backends import VectorBackend, create_vector_backend
 
 logger = logging.getLogger(__name__)
 
 
+# Counters add_document reports while it runs; chunks_embedded counts chunks handed to
+# the embed + upsert step, vectors_upserted the ones the backend has stored
+INGEST_PROGRESS_KEYS = ("pages_parsed", "chunks_total", "chunks_embedded", "vectors_upserted", "vectors_removed")
+
+
+def _file_digest(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_id_prefix(group_id: str, filename: str) -> str:
+    """Common prefix of every chunk id of one file in one group"""
+    return content_digest("file", group_id, filename)[:16] + "#"
+
+
+def chunk_digest(text: str) -> str:
+    return content_digest("chunk", text)[:32]
+
+
+def chunk_id(group_id: str, filename: str, text: str, previous_text: Optional[str] = None) -> str:
+    """
+    Deterministic chunk id from the chunk and the chunk before it: unchanged content keeps its vector,
+    and a stored `prev_chunk_digest` can never go stale (a new predecessor means a new id)
+    """
+    previous = chunk_digest(previous_text) if previous_text is not None else ""
+    return chunk_id_prefix(group_id, filename) + content_digest("chunk", previous, text)[:32]
+
+
 class VectorStoreService:
-    """Vector store service using Pinecone with group-based isolation"""
+    """Vector store service with group-based isolation over a pluggable backend (Pinecone or local)"""
 
     def __init__(self):
-        self.pc: Optional[Pinecone] = None
-        self.embeddings: Optional[OpenAIEmbeddings] = None
+        self.backend: Optional[VectorBackend] = None
+        self.embeddings: Optional[Embeddings] = None
+        # (group, file) -> digest of the last ingested version, to skip unchanged re-uploads
+        self.manifest = SQLiteKVStore(settings.ingest_manifest_path)
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
@@ -41,145 +75,197 @@ class VectorStoreService:
         )
 
     async def initialize(self):
-        """Initialize Pinecone client and embeddings once for the app"""
-        if self.pc and self.embeddings:
+        """Initialize the vector backend and embeddings once for the app"""
+        if self.backend and self.embeddings:
             return
         try:
-            api_key = os.getenv("PINECONE_API_KEY")
-            if not api_key:
-                raise ValueError("PINECONE_API_KEY not found in environment variables")
-            self.pc = Pinecone(api_key=api_key)
-
-            openai_api_key = os.getenv("OPENAI_API_KEY")
-            if not openai_api_key:
-                raise ValueError("OPENAI_API_KEY not found in environment variables")
-            self.embeddings = OpenAIEmbeddings(
-                openai_api_key=openai_api_key,
-                model="text-embedding-ada-002"
-            )
+            # Same instance as the semantic cache: queries hit the embedding cache, then the micro-batcher
+            embedding_service = await get_embedding_service()
+            self.embeddings = await embedding_service.get_embeddings()
+            backend = create_vector_backend(self.embeddings)
+            await backend.initialize()
+            self.backend = backend
             logger.info("✅ Vector store service initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize vector store service: {e}")
             raise
 
-    def _get_index_name(self, group_id: str) -> str:
-        """Generate index name for a group"""
-        safe_group_id = group_id.lower().replace("_", "-").replace(" ", "-")
-        base_name = os.getenv("PINECONE_INDEX_NAME", "chatbot-rag")
-        return f"{base_name}-{safe_group_id}"
-
-    async def _ensure_index_exists(self, group_id: str) -> str:
-        """Ensure Pinecone index exists for the group"""
-        index_name = self._get_index_name(group_id)
+    def _get_loader(self, file_path: str, file_type: FileType):
+        """Document loader for the file type"""
+        if file_type == FileType.PDF:
+            return PyPDFLoader(file_path)
+        elif file_type == FileType.TXT:
+            return TextLoader(file_path, encoding="utf-8")
+        elif file_type == FileType.CSV:
+            return CSVLoader(file_path)
+        elif file_type in [FileType.DOC, FileType.DOCX]:
+            return Docx2txtLoader(file_path)
+        elif file_type in [FileType.PPT, FileType.PPTX]:
+            return UnstructuredPowerPointLoader(file_path)
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+    async def _iter_pages(self, file_path: str, file_type: FileType) -> AsyncIterator[Document]:
+        """Yields pages one at a time; parsing runs in a worker thread"""
         loop = asyncio.get_event_loop()
         try:
-            existing_indexes = await loop.run_in_executor(
-                None, lambda: [idx["name"] for idx in self.pc.list_indexes()]
-            )
-            if index_name not in existing_indexes:
-                logger.info(f"Creating new index: {index_name}")
-                await loop.run_in_executor(
-                    None,
-                    lambda: self.pc.create_index(
-                        name=index_name,
-                        dimension=1536,
-                        metric="cosine",
-                        spec=ServerlessSpec(
-                            cloud=os.getenv("PINECONE_CLOUD", "aws"),
-                            region=os.getenv("PINECONE_REGION", "us-east-1")
-                        )
-                    )
-                )
-                # Wait until the index is ready
-                while True:
-                    status = await loop.run_in_executor(
-                        None, lambda: self.pc.describe_index(index_name).status
-                    )
-                    if status.ready:
-                        logger.info(f"Index {index_name} is ready.")
-                        break
-                    logger.info(f"Waiting for index {index_name} to be ready...")
-                    await asyncio.sleep(5)
-            return index_name
-        except Exception as e:
-            logger.error(f"Error ensuring index exists: {e}")
-            raise
-
-    def _load_document(self, file_path: str, file_type: FileType) -> List[Document]:
-        """Load document based on file type"""
-        try:
-            if file_type == FileType.PDF:
-                loader = PyPDFLoader(file_path)
-            elif file_type == FileType.TXT:
-                loader = TextLoader(file_path, encoding="utf-8")
-            elif file_type == FileType.CSV:
-                loader = CSVLoader(file_path)
-            elif file_type in [FileType.DOC, FileType.DOCX]:
-                loader = Docx2txtLoader(file_path)
-            elif file_type in [FileType.PPT, FileType.PPTX]:
-                loader = UnstructuredPowerPointLoader(file_path)
-            else:
-                raise ValueError(f"Unsupported file type: {file_type}")
-            return loader.load()
+            pages = iter(await loop.run_in_executor(None, lambda: self._get_loader(file_path, file_type).lazy_load()))
+            while True:
+                page = await loop.run_in_executor(None, next, pages, None)
+                if page is None:
+                    return
+                yield page
         except Exception as e:
             logger.error(f"Error loading document {file_path}: {e}")
             raise
 
-    def _get_vector_store(self, group_id: str) -> PineconeVectorStore:
-        """Return a vector store bound to group namespace"""
-        index_name = self._get_index_name(group_id)
-        index = self.pc.Index(index_name)
-        return PineconeVectorStore(
-            index=index,
-            embedding=self.embeddings,
-            text_key="text",
-            namespace=group_id
-        )
+    async def _iter_chunk_batches(self, file_path: str, file_type: FileType, filename: str, group_id: str,
+                                  chunk_ids: Dict[str, Document], existing: set, file_version: str,
+                                  progress: Dict[str, int]) -> AsyncIterator[List[Tuple[str, Document]]]:
+        """
+        Splits pages as they are parsed and yields batches of chunks the group doesn't have yet.
+        Every chunk id seen is recorded in `chunk_ids` (in document order).
+        """
+        batch: List[Tuple[str, Document]] = []
+        previous_text: Optional[str] = None
+        async for page in self._iter_pages(file_path, file_type):
+            progress["pages_parsed"] += 1
+            for chunk in self.text_splitter.split_documents([page]):
+                doc_id = chunk_id(group_id, filename, chunk.page_content, previous_text)
+                if doc_id in chunk_ids:
+                    previous_text = chunk.page_content
+                    continue  # repeated boilerplate runs collapse onto one id
+                chunk.metadata.update({
+                    "source_file": filename,
+                    # Position when first ingested; kept chunks aren't rewritten, so adjacency uses the digests
+                    "chunk_index": len(chunk_ids),
+                    "chunk_digest": chunk_digest(chunk.page_content),
+                    "prev_chunk_digest": chunk_digest(previous_text) if previous_text is not None else "",
+                    "file_version": file_version,
+                    "group_id": group_id
+                })
+                previous_text = chunk.page_content
+                chunk_ids[doc_id] = chunk
+                progress["chunks_total"] = len(chunk_ids)
+                if doc_id not in existing:
+                    batch.append((doc_id, chunk))
+                if len(batch) >= settings.ingest_batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    async def _upsert_batches(self, group_id: str, batches: AsyncIterator[List[Tuple[str, Document]]],
+                              progress: Dict[str, int]) -> int:
+        """
+        Embeds and upserts batches on `ingest_upsert_concurrency` workers while the next
+        batches are parsed; the bounded queue keeps parsing at most a few batches ahead.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ingest_queue_size)
+        upserted = 0
+
+        async def worker():
+            nonlocal upserted
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                progress["chunks_embedded"] += len(batch)
+                await self.backend.add_texts(
+                    group_id,
+                    texts=[chunk.page_content for _, chunk in batch],
+                    metadatas=[chunk.metadata for _, chunk in batch],
+                    ids=[doc_id for doc_id, _ in batch],
+                )
+                upserted += len(batch)
+                progress["vectors_upserted"] = upserted
 
-    async def add_document(self, file_path: str, filename: str, file_type: FileType, group_id: str) -> Dict[str, Any]:
-        """Add document to vector store"""
+        workers = [asyncio.create_task(worker()) for _ in range(settings.ingest_upsert_concurrency)]
+        try:
+            async for batch in batches:
+                put = asyncio.ensure_future(queue.put(batch))
+                # Workers only finish early by failing; don't wait on a queue nobody drains
+                done, _ = await asyncio.wait({put, *workers}, return_when=asyncio.FIRST_COMPLETED)
+                if put not in done:
+                    put.cancel()
+                    for task in done:
+                        task.result()
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        return upserted
+
+    async def add_document(self, file_path: str, filename: str, file_type: FileType, group_id: str,
+                           file_digest: Optional[str] = None,
+                           progress: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Add document to vector store; pass `file_digest` (sha256 hex) if the caller already computed it.
+        `progress` is updated in place with the counters in INGEST_PROGRESS_KEYS as the pipeline runs.
+        """
+        if progress is None:
+            progress = {}
+        progress.update(dict.fromkeys(INGEST_PROGRESS_KEYS, 0))
         logger.info(f"Starting document addition for group '{group_id}', file '{filename}'")
         await self.initialize()
-        await self._ensure_index_exists(group_id)
-        vector_store = self._get_vector_store(group_id)
-
-        documents = self._load_document(file_path, file_type)
-        chunks = self.text_splitter.split_documents(documents)
-        for i, chunk in enumerate(chunks):
-            chunk.metadata.update({
-                "source_file": filename,
-                "chunk_index": i,
-                "group_id": group_id
-            })
-
-        logger.info(f"Adding {len(chunks)} chunks to Pinecone index in namespace '{group_id}'")
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: vector_store.add_texts(
-                texts=[chunk.page_content for chunk in chunks],
-                metadatas=[chunk.metadata for chunk in chunks],
-                namespace=group_id
-            )
+
+        manifest_key = f"{group_id}\x1f{filename}"
+        if file_digest is None:
+            file_digest = await loop.run_in_executor(None, _file_digest, file_path)
+        previous = await self.manifest.get(manifest_key)
+        if previous and json.loads(previous)["digest"] == file_digest:
+            logger.info(f"'{filename}' is unchanged for group {group_id}; skipping ingestion")
+            return {"filename": filename, "chunk_count": json.loads(previous)["chunk_count"], "status": "unchanged",
+                    "group_id": group_id, "chunks_added": 0, "chunks_removed": 0}
+
+        warnings: List[str] = []
+        file_version = file_digest[:16]
+        # Only embed what the group doesn't already have, and drop what the new version no longer has
+        listed = await self.backend.list_ids(group_id, chunk_id_prefix(group_id, filename))
+        existing = set(listed or [])
+        chunk_ids: Dict[str, Document] = {}
+        added = await self._upsert_batches(
+            group_id,
+            self._iter_chunk_batches(file_path, file_type, filename, group_id, chunk_ids, existing, file_version, progress),
+            progress,
         )
-        logger.info(f"✅ Successfully added {len(chunks)} chunks from {filename} to group {group_id}")
-        return {"filename": filename, "chunk_count": len(chunks), "status": "success", "group_id": group_id}
+        if listed is None:
+            # Ids can't be listed (pod-based Pinecone index): everything was re-upserted with this
+            # file_version, so drop whatever the file has under any other version
+            removed: Optional[int] = None
+            if not await self.backend.delete_other_versions(group_id, filename, file_version):
+                warnings.append("Older chunks of this file could not be removed")
+        else:
+            removed_ids = sorted(existing - chunk_ids.keys())
+            await self.backend.delete(group_id, removed_ids)
+            removed = len(removed_ids)
+            if previous is None and not await self.backend.delete_legacy(group_id, filename):
+                # First ingest under content ids: copies uploaded before them have random ids
+                warnings.append("Chunks from uploads before content ids could not be removed")
+        progress["vectors_removed"] = removed or 0
+        for warning in warnings:
+            logger.warning(f"{warning} ('{filename}', group '{group_id}')")
+
+        logger.info(f"Ingested '{filename}' for group '{group_id}': {added} new, "
+                    f"{len(chunk_ids) - added} unchanged, {removed if removed is not None else 'unknown'} removed chunks")
+        await self.manifest.set(
+            manifest_key, json.dumps({"digest": file_digest, "chunk_count": len(chunk_ids)}), settings.ingest_manifest_ttl
+        )
+        logger.info(f"✅ Successfully ingested {filename} ({len(chunk_ids)} chunks) for group {group_id}")
+        if added or removed is None or removed:
+            # New content invalidates cached answers for the group
+            await get_shared_response_cache().bump_kb_version(group_id)
+        return {"filename": filename, "chunk_count": len(chunk_ids), "status": "success", "group_id": group_id,
+                "chunks_added": added, "chunks_removed": removed, "warnings": warnings}
 
     async def search_knowledge_base(self, search_query: SearchQuery, group_id: str) -> SearchResponse:
         """Search the knowledge base"""
         logger.info(f"KB search for group '{group_id}' with query '{search_query.query}'")
         await self.initialize()
-        vector_store = self._get_vector_store(group_id)
 
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(
-            None,
-            lambda: vector_store.similarity_search_with_score(
-                search_query.query,
-                k=search_query.top_k,
-                namespace=group_id
-            )
-        )
+        results = await self.backend.search(group_id, search_query.query, search_query.top_k)
         search_results = [
             {"content": doc.page_content, "metadata": doc.metadata, "score": float(score)}
             for doc, score in results
@@ -189,22 +275,11 @@ class VectorStoreService:
     async def get_knowledge_base_info(self, group_id: str) -> KnowledgeBaseInfo:
         """Get information about the knowledge base"""
         await self.initialize()
-        index_name = self._get_index_name(group_id)
-        loop = asyncio.get_event_loop()
-        existing_indexes = await loop.run_in_executor(
-            None, lambda: [idx["name"] for idx in self.pc.list_indexes()]
-        )
+        vector_count = await self.backend.count(group_id)
 
-        if index_name not in existing_indexes:
+        if vector_count is None:
             return KnowledgeBaseInfo(total_documents=0, total_chunks=0, status="index_not_found")
 
-        index = self.pc.Index(index_name)
-        stats = await loop.run_in_executor(None, index.describe_index_stats)
-
-        vector_count = 0
-        if stats.namespaces and group_id in stats.namespaces:
-            vector_count = stats.namespaces[group_id].vector_count
-
         estimated_docs = 1 if vector_count > 0 else 0
 
         return KnowledgeBaseInfo(
@@ -213,34 +288,24 @@ class VectorStoreService:
             status="active" if vector_count > 0 else "empty"
         )
 
-    async def get_retriever(self, group_id: str) -> Optional[VectorStore]:
+    async def get_retriever(self, group_id: str) -> Optional[BaseRetriever]:
         """Get a retriever for the specified group_id"""
         if not group_id:
             logger.warning("get_retriever called with no group_id.")
             return None
         try:
-            vector_store = self._get_vector_store(group_id)
-            return vector_store.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": settings.retrieval_k, "namespace": group_id}
-            )
+            await self.initialize()
+            return self.backend.get_retriever(group_id, settings.retrieval_k)
         except Exception as e:
             logger.error(f"Failed to get retriever for group '{group_id}': {e}")
             return None
 
     async def clear_knowledge_base(self, group_id: Optional[str]) -> Dict[str, Any]:
-        """Clear all vectors from a namespace within an index"""
+        """Clear all vectors of a group"""
         await self.initialize()
-        index_name = self._get_index_name(group_id)
-        loop = asyncio.get_event_loop()
-        existing_indexes = await loop.run_in_executor(
-            None, lambda: [idx["name"] for idx in self.pc.list_indexes()]
-        )
-
-        if index_name in existing_indexes:
-            index = self.pc.Index(index_name)
-            await loop.run_in_executor(None, lambda: index.delete(delete_all=True, namespace=group_id))
-            logger.info(f"Cleared knowledge base for group {group_id} in index {index_name}")
+        if await self.backend.clear(group_id):
+            await get_shared_response_cache().bump_kb_version(group_id)
+        await self.manifest.delete_prefix(f"{group_id}\x1f")
 
         return {"status": "success", "message": f"Knowledge base for group {group_id} cleared."}
 
@@ -254,6 +319,14 @@ class VectorStoreService:
             logger.error(f"Error getting relevant context: {e}")
             return []
 
+    def get_stats(self) -> Dict[str, Any]:
+        return self.backend.get_stats() if self.backend else {}
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+        self.manifest.close()
+
 
 # Global service instance
 _vector_service: Optional[VectorStoreService] = None
@@ -265,3 +338,8 @@ async def get_vector_service() -> VectorStoreService:
         _vector_service = VectorStoreService()
         await _vector_service.initialize()
     return _vector_service
+
+
+def get_vector_stats() -> Dict[str, Any]:
+    """Backend stats of the global vector service (empty until it has been created)"""
+    return _vector_service.get_stats() if _vector_service else {}
@@ -0,0 +1,208 @@
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from chatbot.utils.shared_cache import normalize_query
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a character-based estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Longest shared edge looked for between neighbouring chunks (the splitter overlaps them by ~200 chars)
+_MAX_OVERLAP_CHARS = 500
+_MIN_OVERLAP_CHARS = 20
+
+
+class _ApproximateEncoder:
+    """Stand-in when tiktoken or its vocabulary is unavailable: one token per 4 characters"""
+
+    def encode(self, text: str, disallowed_special=()) -> List[str]:
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=16)
+def get_encoder(model: Optional[str] = None):
+    """tiktoken encoder for a model, built once per process"""
+    if tiktoken is None:
+        logger.warning("tiktoken is not installed, estimating token counts")
+        return _ApproximateEncoder()
+    try:
+        if model:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The vocabulary is downloaded on first use; offline hosts estimate instead
+        logger.warning(f"Could not load a tiktoken encoder for {model!r}, estimating token counts: {e}")
+        return _ApproximateEncoder()
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return len(get_encoder(model).encode(text, disallowed_special=()))
+
+
+def _chunk_index(doc: Document) -> Optional[int]:
+    """The chunk's position in its file; Pinecone returns numeric metadata as floats (3.0)"""
+    value = doc.metadata.get("chunk_index")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if isinstance(value, float):
+        if not value.is_integer():
+            return None
+        value = int(value)
+    return value
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`"""
+    for size in range(min(len(left), len(right), _MAX_OVERLAP_CHARS), _MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextPacker:
+    """
+    Turns retrieved chunks into the context for the QA prompt: adjacent chunks
+    of the same `source_file` are stitched together without their shared
+    overlap, near-duplicates are dropped, and what remains fills `token_budget`
+    in retrieval order (best first). Adjacency follows the content links
+    (`prev_chunk_digest` -> `chunk_digest`) set at ingestion, falling back to
+    `chunk_index` for chunks ingested before those existed.
+    """
+
+    def __init__(self, token_budget: int, dedupe_threshold: float = 0.9):
+        self.token_budget = token_budget
+        self.dedupe_threshold = dedupe_threshold
+        self.stats = {"calls": 0, "docs_in": 0, "docs_out": 0, "merged": 0, "deduped": 0,
+                      "truncated": 0, "tokens_in": 0, "tokens_out": 0}
+
+    @staticmethod
+    def _linked_runs(chunks: List[Tuple[int, Document]]) -> List[List[Tuple[int, Document]]]:
+        """Chains chunks whose `prev_chunk_digest` is another retrieved chunk's `chunk_digest`"""
+        unique: Dict[Tuple[str, str], Tuple[int, Document]] = {}
+        for rank, doc in chunks:
+            # The same chunk retrieved twice
+            unique.setdefault((doc.metadata.get("prev_chunk_digest", ""), doc.metadata["chunk_digest"]), (rank, doc))
+        items = list(unique.values())
+        digests = {doc.metadata["chunk_digest"] for _, doc in items}
+        successors: Dict[str, Tuple[int, Document]] = {}
+        for item in items:
+            successors.setdefault(item[1].metadata.get("prev_chunk_digest", ""), item)
+
+        runs, visited = [], set()
+        heads = [item for item in items if item[1].metadata.get("prev_chunk_digest", "") not in digests]
+        for head in heads + items:  # a repeated text can form a loop with no head
+            run, item = [], head
+            while item is not None and id(item[1]) not in visited:
+                visited.add(id(item[1]))
+                run.append(item)
+                item = successors.get(item[1].metadata["chunk_digest"])
+            if run:
+                runs.append(run)
+        return runs
+
+    @staticmethod
+    def _indexed_runs(chunks: List[Tuple[int, Document]]) -> List[List[Tuple[int, Document]]]:
+        """Runs of consecutive `chunk_index` values, for chunks ingested without digests"""
+        runs: List[List[Tuple[int, Document]]] = []
+        last_index = None
+        for rank, doc in sorted(chunks, key=lambda item: _chunk_index(item[1])):
+            index = _chunk_index(doc)
+            if index == last_index:
+                continue  # the same chunk retrieved twice
+            if last_index is not None and index == last_index + 1:
+                runs[-1].append((rank, doc))
+            else:
+                runs.append([(rank, doc)])
+            last_index = index
+        return runs
+
+    def _stitch(self, run: List[Tuple[int, Document]]) -> Tuple[int, Document]:
+        """One document for a run, without the text neighbouring chunks share"""
+        first = run[0][1]
+        text = first.page_content
+        for _, doc in run[1:]:
+            text += doc.page_content[_overlap(text, doc.page_content):]
+        metadata = dict(first.metadata)
+        if _chunk_index(first) is not None:
+            metadata["chunk_index"] = _chunk_index(first)
+        if len(run) > 1:
+            metadata["merged_chunks"] = len(run)
+            self.stats["merged"] += len(run) - 1
+        return min(rank for rank, _ in run), Document(page_content=text, metadata=metadata)
+
+    def _merge_adjacent(self, documents: List[Document]) -> List[Tuple[int, Document]]:
+        """Returns (best rank, document) pairs with runs of consecutive chunks merged"""
+        linked: Dict[Any, List[Tuple[int, Document]]] = {}
+        indexed: Dict[Any, List[Tuple[int, Document]]] = {}
+        merged: List[Tuple[int, Document]] = []
+        for rank, doc in enumerate(documents):
+            source = doc.metadata.get("source_file")
+            if source is not None and doc.metadata.get("chunk_digest"):
+                linked.setdefault(source, []).append((rank, doc))
+            elif source is not None and _chunk_index(doc) is not None:
+                indexed.setdefault(source, []).append((rank, doc))
+            else:
+                merged.append((rank, doc))
+
+        for chunks in linked.values():
+            merged.extend(self._stitch(run) for run in self._linked_runs(chunks))
+        for chunks in indexed.values():
+            merged.extend(self._stitch(run) for run in self._indexed_runs(chunks))
+        merged.sort(key=lambda item: item[0])
+        return merged
+
+    def _is_duplicate(self, words: set, kept: List[set]) -> bool:
+        for other in kept:
+            if words and other and len(words & other) / len(words | other) >= self.dedupe_threshold:
+                return True
+        return False
+
+    def pack(self, documents: List[Document], model: Optional[str] = None) -> List[Document]:
+        if not documents:
+            return documents
+        encoder = get_encoder(model)
+        self.stats["calls"] += 1
+        self.stats["docs_in"] += len(documents)
+        self.stats["tokens_in"] += sum(len(encoder.encode(doc.page_content, disallowed_special=())) for doc in documents)
+
+        packed: List[Document] = []
+        kept_words: List[set] = []
+        remaining = self.token_budget
+        for _, doc in self._merge_adjacent(documents):
+            words = set(normalize_query(doc.page_content).split())
+            if self._is_duplicate(words, kept_words):
+                self.stats["deduped"] += 1
+                continue
+            tokens = encoder.encode(doc.page_content, disallowed_special=())
+            if len(tokens) > remaining:
+                if packed:
+                    continue  # a smaller, lower-ranked chunk may still fit
+                # Always keep something of the best match
+                doc = Document(page_content=encoder.decode(tokens[:remaining]), metadata=doc.metadata)
+                tokens = tokens[:remaining]
+                self.stats["truncated"] += 1
+            packed.append(doc)
+            kept_words.append(words)
+            remaining -= len(tokens)
+            if remaining <= 0:
+                break
+
+        self.stats["docs_out"] += len(packed)
+        self.stats["tokens_out"] += self.token_budget - remaining
+        return packed
+
+    def get_stats(self) -> Dict[str, Any]:
+        tokens_in = self.stats["tokens_in"]
+        return {**self.stats, "token_reduction": 1 - self.stats["tokens_out"] / tokens_in if tokens_in else 0.0}
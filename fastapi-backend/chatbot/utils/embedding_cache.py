@@ -0,0 +1,332 @@
+import os
+import re
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from chatbot.core.config import settings
+from chatbot.utils.shared_cache import content_digest
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE_FILENAME = re.compile(r"[^\w.-]")
+
+
+class EmbeddingDiskStore:
+    """
+    Query embeddings persisted on disk: one append-only float32 vector file per
+    (model, dimension), read through a memory map, plus a SQLite index mapping
+    each key to its row. Safe to share between worker processes.
+
+    A vector file growing past `max_bytes` is compacted: the newest rows that
+    fit in half the budget are copied to a file of the next generation and the
+    old one is deleted. Index rows name their generation, so a worker holding a
+    map of a retired file never reads it with the new row numbers. Appends and
+    compactions hold a flock on a per-(model, dimension) lock file that is never
+    deleted, and a vector file is only opened for writing while its generation
+    is the current one. Without fcntl (Windows) only a single worker is safe.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._maps: Dict[Tuple[str, int, int], np.memmap] = {}
+        self._files: Dict[Tuple[str, int], Tuple[int, Any]] = {}  # (model, dim) -> (gen, append handle)
+        self.compactions = 0
+        if fcntl is None:
+            logger.warning("fcntl is unavailable: run a single worker with the embedding disk cache")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.directory, "index.db"), check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Workers start together: check and migrate the schema under the write lock
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, row INTEGER NOT NULL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}
+            if "gen" not in columns:
+                conn.execute("ALTER TABLE embeddings ADD COLUMN gen INTEGER NOT NULL DEFAULT 0")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "model TEXT NOT NULL, dim INTEGER NOT NULL, gen INTEGER NOT NULL, PRIMARY KEY (model, dim))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_file ON embeddings (model, dim, gen, row)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _vector_path(self, model: str, dim: int, gen: int = 0) -> str:
+        suffix = f".{gen}" if gen else ""
+        return os.path.join(self.directory, f"{_UNSAFE_FILENAME.sub('_', model)}.{dim}{suffix}.f32")
+
+    def _lock_path(self, model: str, dim: int) -> str:
+        return os.path.join(self.directory, f"{_UNSAFE_FILENAME.sub('_', model)}.{dim}.lock")
+
+    def _append_handle(self, model: str, dim: int, gen: int):
+        """The open vector file of the current generation (caller holds the file lock)"""
+        current = self._files.get((model, dim))
+        if current is not None and current[0] == gen:
+            return current[1]
+        if current is not None:
+            current[1].close()  # retired by a compaction
+        handle = open(self._vector_path(model, dim, gen), "ab")
+        self._files[(model, dim)] = (gen, handle)
+        return handle
+
+    def _generation(self, model: str, dim: int) -> int:
+        found = self._connect().execute("SELECT gen FROM files WHERE model = ? AND dim = ?", (model, dim)).fetchone()
+        return found[0] if found else 0
+
+    def _rows(self, model: str, dim: int, gen: int, row: int) -> Optional[np.memmap]:
+        """Memory map of the model's vector file, remapped when it has grown past `row`"""
+        rows = self._maps.get((model, dim, gen))
+        if rows is None or row >= len(rows):
+            path = self._vector_path(model, dim, gen)
+            count = os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+            if row >= count:
+                return None
+            # Maps of older generations are never read again
+            for stale in [k for k in self._maps if k[:2] == (model, dim) and k[2] != gen]:
+                del self._maps[stale]
+            rows = np.memmap(path, dtype=np.float32, mode="r", shape=(count, dim))
+            self._maps[(model, dim, gen)] = rows
+        return rows
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            found = self._connect().execute(
+                "SELECT model, dim, gen, row FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if found is None:
+                return None
+            model, dim, gen, row = found
+            rows = self._rows(model, dim, gen, row)
+            return np.array(rows[row]) if rows is not None else None
+
+    def put(self, key: str, model: str, vector: np.ndarray):
+        dim = len(vector)
+        row_bytes = dim * 4
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = self._connect()
+            with open(self._lock_path(model, dim), "ab") as lock:
+                # Other workers append to (and compact) the same file
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    gen = self._generation(model, dim)
+                    f = self._append_handle(model, dim, gen)
+                    size = f.seek(0, os.SEEK_END)
+                    row = -(-size // row_bytes)  # skip past a torn row left by a crash
+                    if row * row_bytes != size:
+                        f.truncate(row * row_bytes)
+                    f.write(vector.astype(np.float32).tobytes())
+                    f.flush()
+                    with conn:
+                        conn.execute(
+                            "INSERT OR IGNORE INTO embeddings (key, model, dim, gen, row) VALUES (?, ?, ?, ?, ?)",
+                            (key, model, dim, gen, row),
+                        )
+                    if self.max_bytes and (row + 1) * row_bytes > self.max_bytes:
+                        self._compact(model, dim, gen)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _compact(self, model: str, dim: int, gen: int):
+        """Keep the newest rows that fit in half of max_bytes (caller holds the file lock)"""
+        row_bytes = dim * 4
+        keep = max(1, self.max_bytes // 2 // row_bytes)
+        conn = self._connect()
+        kept = conn.execute(
+            "SELECT key, row FROM embeddings WHERE model = ? AND dim = ? AND gen = ? ORDER BY row DESC LIMIT ?",
+            (model, dim, gen, keep),
+        ).fetchall()
+        old_path = self._vector_path(model, dim, gen)
+        new_path = self._vector_path(model, dim, gen + 1)
+        count = os.path.getsize(old_path) // row_bytes
+        kept = [(key, row) for key, row in reversed(kept) if row < count]
+        with open(new_path + ".tmp", "wb") as out:
+            if kept:
+                source = np.memmap(old_path, dtype=np.float32, mode="r", shape=(count, dim))
+                out.write(np.ascontiguousarray(source[[row for _, row in kept]]).tobytes())
+                del source
+        os.replace(new_path + ".tmp", new_path)
+        with conn:
+            conn.execute("DELETE FROM embeddings WHERE model = ? AND dim = ? AND gen = ?", (model, dim, gen))
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, dim, gen, row) VALUES (?, ?, ?, ?, ?)",
+                [(key, model, dim, gen + 1, i) for i, (key, _) in enumerate(kept)],
+            )
+            conn.execute(
+                "INSERT INTO files (model, dim, gen) VALUES (?, ?, ?) "
+                "ON CONFLICT (model, dim) DO UPDATE SET gen = excluded.gen",
+                (model, dim, gen + 1),
+            )
+        self._files.pop((model, dim))[1].close()
+        os.unlink(old_path)
+        self._maps.pop((model, dim, gen), None)
+        self.compactions += 1
+        logger.info(f"Compacted embedding cache for {model} ({dim}d): kept {len(kept)} of {count} vectors")
+
+    def close(self):
+        with self._lock:
+            self._maps.clear()
+            for _, handle in self._files.values():
+                handle.close()
+            self._files.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed by (model, text digest): an
+    in-process LRU of float32 arrays (L1) over an EmbeddingDiskStore (L2),
+    so popular queries skip the embedding API even after a restart.
+    """
+
+    def __init__(self, directory: Optional[str], l1_size: int, max_disk_bytes: int = 0):
+        self.l1_size = l1_size
+        self.disk = EmbeddingDiskStore(directory, max_disk_bytes) if directory else None
+        self._l1: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "stores": 0, "disk_errors": 0}
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return content_digest("embedding", model, text)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._l1[key] = vector
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def get_local(self, model: str, text: str) -> Optional[np.ndarray]:
+        """L1 lookup only; cheap enough to call on the event loop"""
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._l1.get(key)
+            if vector is not None:
+                self._l1.move_to_end(key)
+                self.stats["l1_hits"] += 1
+        return vector
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        vector = self.get_local(model, text)
+        if vector is not None:
+            return vector
+        key = self.make_key(model, text)
+        if self.disk is not None:
+            try:
+                vector = self.disk.get(key)
+            except Exception as e:
+                self.stats["disk_errors"] += 1
+                logger.warning(f"Embedding disk cache read failed: {e}")
+            if vector is not None:
+                self._remember(key, vector)
+                self.stats["l2_hits"] += 1
+                return vector
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, model: str, text: str, embedding: List[float]) -> np.ndarray:
+        key = self.make_key(model, text)
+        vector = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, vector)
+        self.stats["stores"] += 1
+        if self.disk is not None:
+            try:
+                self.disk.put(key, model, vector)
+            except Exception as e:
+                self.stats["disk_errors"] += 1
+                logger.warning(f"Embedding disk cache write failed: {e}")
+        return vector
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["l1_hits"] + self.stats["l2_hits"] + self.stats["misses"]
+        hits = self.stats["l1_hits"] + self.stats["l2_hits"]
+        stats = {**self.stats, "hit_rate": hits / lookups if lookups else 0.0, "l1_entries": len(self._l1)}
+        if self.disk is not None:
+            stats["disk_compactions"] = self.disk.compactions
+        return stats
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves `embed_query` from an EmbeddingCache.
+    Document embeddings (ingestion) pass straight through to the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: "EmbeddingCache"):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(self.model, text)
+        if vector is None:
+            vector = self.cache.put(self.model, text, self.embeddings.embed_query(text))
+        return vector.tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_local(self.model, text)
+        if vector is not None:
+            return vector.tolist()
+        loop = asyncio.get_event_loop()
+        vector = await loop.run_in_executor(None, self.cache.get, self.model, text)
+        if vector is None:
+            embedding = await self.embeddings.aembed_query(text)
+            vector = await loop.run_in_executor(None, self.cache.put, self.model, text, embedding)
+        return vector.tolist()
+
+
+# Global cache instance
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get or create the process-wide query embedding cache"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            settings.embedding_cache_dir if settings.embedding_cache_persist else None,
+            l1_size=settings.embedding_cache_l1_size,
+            max_disk_bytes=settings.embedding_cache_max_bytes,
+        )
+    return _embedding_cache
+
+
+def cached_embeddings(embeddings: Embeddings) -> Embeddings:
+    """Wrap an embeddings model with the shared query cache when caching is enabled"""
+    if not settings.enable_embedding_cache:
+        return embeddings
+    return CachedEmbeddings(embeddings, get_embedding_cache())
@@ -5,32 +5,61 @@ from concurrent.futures import ThreadPoolExecutor
 import time
 from functools import lru_cache
 from typing import Dict, Any, Optional
+import json
 import psutil
 import gc
 from cachetools import TTLCache
 from langchain.schema import BaseMessage
+from chatbot.utils.shared_cache import content_digest
 import logging
 logger = logging.getLogger(__name__)
 
 # 1. Response Caching Implementation
+def _json_sizeof(value) -> int:
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
 class ResponseCache:
-    """Thread-safe response cache with TTL"""
+    """Thread-safe response cache with TTL, optionally bounded by total size in bytes"""
     
-    def __init__(self, max_size: int = 1000, ttl: int = 3600):
-        self.cache = TTLCache(maxsize=max_size, ttl=ttl)
+    def __init__(self, max_size: int = 1000, ttl: int = 3600, max_bytes: Optional[int] = None):
+        if max_bytes:
+            self.cache = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=_json_sizeof)
+        else:
+            self.cache = TTLCache(maxsize=max_size, ttl=ttl)
         self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
     
     async def get(self, key: str) -> Optional[Dict[str, Any]]:
         async with self._lock:
-            return self.cache.get(key)
+            value = self.cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
     
     async def set(self, key: str, value: Dict[str, Any]):
         async with self._lock:
-            self.cache[key] = value
+            try:
+                self.cache[key] = value
+            except ValueError:
+                # Single value larger than the whole byte budget
+                pass
     
     def cache_key(self, user_id: str, message: str, use_rag: bool) -> str:
         """Generate cache key for request"""
-        return f"{user_id}:{hash(message)}:{use_rag}"
+        return f"{user_id}:{content_digest(message)}:{use_rag}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.cache),
+            "size": self.cache.currsize,
+        }
 
 # 2. Batch Document Processing
 async def process_documents_batch(documents: list, batch_size: int = 5):
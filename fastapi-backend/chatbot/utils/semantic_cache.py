@@ -0,0 +1,157 @@
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _GroupCache:
+    """Unit-normalized query embeddings of one group, one row per cached answer"""
+
+    def __init__(self, dim: int, kb_version: int, capacity: int = 16):
+        self.kb_version = kb_version
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.answers: List[Dict[str, Any]] = []
+        self.sizes: List[int] = []
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        # Allocated capacity, not just the used rows: the arrays grow by doubling
+        return self.matrix.nbytes + self.last_used.nbytes + sum(self.sizes)
+
+    def add(self, vector: np.ndarray, answer: Dict[str, Any], size: int, tick: int):
+        if self.count == len(self.matrix):
+            self.matrix = np.vstack([self.matrix, np.zeros_like(self.matrix)])
+            self.last_used = np.concatenate([self.last_used, np.zeros_like(self.last_used)])
+        self.matrix[self.count] = vector
+        self.last_used[self.count] = tick
+        self.answers.append(answer)
+        self.sizes.append(size)
+        self.count += 1
+
+    def remove_lru(self) -> int:
+        """Drop the least recently used row (swap-remove); returns bytes freed"""
+        before = self.nbytes
+        idx = int(np.argmin(self.last_used[:self.count]))
+        last = self.count - 1
+        if idx != last:
+            self.matrix[idx] = self.matrix[last]
+            self.last_used[idx] = self.last_used[last]
+            self.answers[idx] = self.answers[last]
+            self.sizes[idx] = self.sizes[last]
+        self.answers.pop()
+        self.sizes.pop()
+        self.count -= 1
+        capacity = len(self.matrix)
+        if capacity > 16 and self.count <= capacity // 4:
+            # Give memory back once the group has shrunk well below its capacity
+            self.matrix = self.matrix[:capacity // 2].copy()
+            self.last_used = self.last_used[:capacity // 2].copy()
+        return before - self.nbytes
+
+
+class SemanticCache:
+    """
+    Per-group cache of answers keyed by query embedding. A lookup returns the
+    answer of the most similar cached query when its cosine similarity is at
+    least `threshold`. Each group is scored with one matrix-vector product.
+
+    Entries are evicted LRU within a group (`max_entries_per_group`) and across
+    groups (`max_bytes`); a group is dropped when its knowledge-base version changes.
+    """
+
+    def __init__(self, threshold: float, max_entries_per_group: int, max_bytes: int):
+        self.threshold = threshold
+        self.max_entries_per_group = max_entries_per_group
+        self.max_bytes = max_bytes
+        self._groups: "OrderedDict[str, _GroupCache]" = OrderedDict()
+        self._tick = 0
+        self.stats = {"lookups": 0, "hits": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _group(self, group_id: str, kb_version: int) -> Optional[_GroupCache]:
+        group = self._groups.get(group_id)
+        if group is not None and group.kb_version != kb_version:
+            self.invalidate(group_id)
+            return None
+        return group
+
+    def lookup(self, group_id: str, kb_version: int, embedding: Sequence[float]) -> Optional[Dict[str, Any]]:
+        self.stats["lookups"] += 1
+        group = self._group(group_id, kb_version)
+        if group is None or not group.count:
+            return None
+
+        vector = self._normalize(embedding)
+        scores = group.matrix[:group.count] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        self._tick += 1
+        group.last_used[best] = self._tick
+        self._groups.move_to_end(group_id)
+        self.stats["hits"] += 1
+        return {**group.answers[best], "similarity": float(scores[best])}
+
+    def store(self, group_id: str, kb_version: int, embedding: Sequence[float], answer: Dict[str, Any]):
+        vector = self._normalize(embedding)
+        group = self._group(group_id, kb_version)
+        if group is None:
+            group = _GroupCache(len(vector), kb_version)
+            self._groups[group_id] = group
+        elif group.matrix.shape[1] != len(vector):
+            # Embedding model changed under us; start the group over
+            self.invalidate(group_id)
+            group = _GroupCache(len(vector), kb_version)
+            self._groups[group_id] = group
+
+        if group.count >= self.max_entries_per_group:
+            group.remove_lru()
+            self.stats["evictions"] += 1
+
+        self._tick += 1
+        size = len(json.dumps(answer, default=str).encode("utf-8"))
+        group.add(vector, answer, size, self._tick)
+        self._groups.move_to_end(group_id)
+        self.stats["stores"] += 1
+        self._enforce_budget()
+
+    def invalidate(self, group_id: str):
+        if self._groups.pop(group_id, None) is not None:
+            self.stats["invalidations"] += 1
+
+    @property
+    def nbytes(self) -> int:
+        return sum(group.nbytes for group in self._groups.values())
+
+    def _enforce_budget(self):
+        total = self.nbytes
+        while total > self.max_bytes and self._groups:
+            group_id, group = next(iter(self._groups.items()))
+            if group.count <= 1:
+                total -= group.nbytes
+                del self._groups[group_id]
+            else:
+                total -= group.remove_lru()
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "groups": len(self._groups),
+            "entries": sum(group.count for group in self._groups.values()),
+            "bytes": self.nbytes,
+        }
@@ -0,0 +1,218 @@
+# Cross-process caching helpers shared by every uvicorn worker on a node
+
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+from chatbot.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivially different queries match"""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def content_digest(*parts: Any) -> str:
+    """Stable digest of the given parts (unlike hash(), identical across processes and restarts)"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class SQLiteKVStore:
+    """Small key/value store with expiry in a local SQLite file (WAL mode)"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kv-sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kb_versions (group_id TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: str, ttl: float):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                conn.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+
+    def _delete(self, key: str):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _delete_prefix(self, prefix: str):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def _get_version(self, group_id: str) -> int:
+        row = self._connect().execute(
+            "SELECT version FROM kb_versions WHERE group_id = ?", (group_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self, group_id: str) -> int:
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO kb_versions (group_id, version) VALUES (?, 1) "
+                "ON CONFLICT(group_id) DO UPDATE SET version = version + 1",
+                (group_id,),
+            )
+        return self._get_version(group_id)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self._run(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        await self._run(self._delete, key)
+
+    async def delete_prefix(self, prefix: str):
+        await self._run(self._delete_prefix, prefix)
+
+    async def get_version(self, group_id: str) -> int:
+        return await self._run(self._get_version, group_id)
+
+    async def bump_version(self, group_id: str) -> int:
+        return await self._run(self._bump_version, group_id)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+
+class SharedResponseCache:
+    """
+    Two-tier response cache: an in-process TTLCache (L1) in front of a SQLite
+    store (L2) that every worker on the node reads and writes. Keys are stable
+    digests of (group, normalized query, knowledge-base version), so uploading
+    or clearing documents naturally invalidates a group's answers.
+    """
+
+    def __init__(self, db_path: str, ttl: int, l1_size: int, version_ttl: float = 1.0):
+        self.ttl = ttl
+        self.store = SQLiteKVStore(db_path)
+        self.l1 = TTLCache(maxsize=l1_size, ttl=ttl)
+        # KB versions are re-read at most every version_ttl seconds per group
+        self._versions = TTLCache(maxsize=10000, ttl=version_ttl)
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "sets": 0}
+
+    async def kb_version(self, group_id: str) -> int:
+        version = self._versions.get(group_id)
+        if version is None:
+            version = await self.store.get_version(group_id)
+            self._versions[group_id] = version
+        return version
+
+    async def bump_kb_version(self, group_id: str) -> int:
+        version = await self.store.bump_version(group_id)
+        self._versions[group_id] = version
+        return version
+
+    async def make_key(self, group_id: str, query: str) -> str:
+        version = await self.kb_version(group_id)
+        return content_digest("rag", group_id, normalize_query(query), version)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.l1.get(key)
+        if value is not None:
+            self.stats["l1_hits"] += 1
+            return dict(value)
+        raw = await self.store.get(key)
+        if raw is None:
+            self.stats["misses"] += 1
+            return None
+        value = json.loads(raw)
+        self.l1[key] = value
+        self.stats["l2_hits"] += 1
+        return dict(value)
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        self.l1[key] = value
+        await self.store.set(key, json.dumps(value, default=str), self.ttl)
+        self.stats["sets"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["l1_hits"] + self.stats["l2_hits"] + self.stats["misses"]
+        hits = self.stats["l1_hits"] + self.stats["l2_hits"]
+        return {**self.stats, "hit_rate": hits / lookups if lookups else 0.0, "l1_entries": len(self.l1)}
+
+    def close(self):
+        self.store.close()
+
+
+# Global cache instance
+_shared_cache: Optional[SharedResponseCache] = None
+
+
+def get_shared_response_cache() -> SharedResponseCache:
+    """Get or create the process-wide handle on the shared response cache"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SharedResponseCache(
+            settings.shared_cache_path,
+            ttl=settings.cache_ttl,
+            l1_size=settings.shared_cache_l1_size,
+        )
+    return _shared_cache
+
+
+def close_shared_response_cache():
+    """Close the process-wide cache handle if it was created"""
+    global _shared_cache
+    if _shared_cache is not None:
+        _shared_cache.close()
+        _shared_cache = None
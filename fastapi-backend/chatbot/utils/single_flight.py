@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FlightAbandoned(Exception):
+    """The caller leading a flight went away before producing a result"""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller starts the work,
+    callers arriving while it is in flight await the same result.
+
+    The work runs in its own task, so a cancelled caller doesn't cancel it for the others.
+    A caller that produces the result itself (e.g. while streaming it) registers with
+    `lead` instead and resolves the returned future.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    def inflight(self, key: Hashable) -> Optional[asyncio.Future]:
+        """Return the in-flight task for a key, if any"""
+        return self._inflight.get(key)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["executions"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key, task=task: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    def lead(self, key: Hashable) -> Optional[asyncio.Future]:
+        """
+        Registers the caller as the one computing `key` and returns the future to resolve
+        with the result (or FlightAbandoned); None if a call is already in flight.
+        """
+        if key in self._inflight:
+            return None
+        self.stats["calls"] += 1
+        self.stats["executions"] += 1
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda _, key=key, future=future: self._forget(key, future))
+        return future
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "inflight": len(self._inflight),
+            "coalescing_rate": self.stats["coalesced"] / calls if calls else 0.0,
+        }
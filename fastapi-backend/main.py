@@ -1,23 +1,36 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Tuple
-from openai import OpenAI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator, List, Optional, Dict, Tuple
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI
 import os
 import re
+import json
+import asyncio
+import time
 import logging
-from datetime import datetime, timezone
+from datetime import datetime
+from collections import deque
 import uvicorn
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
 from dotenv import load_dotenv
-from firebase_admin import firestore as fa_firestore
 
 # RAG chatbot imports
-from chatbot.models.api_models import Message as RAGMessage
+from chatbot.models.api_models import Message as RAGMessage, WSMessage, WSResponse
 from chatbot.services.chat_service import ChatService as RAGChatService
+from chatbot.services.openai_client import get_openai_client_pool, close_openai_client_pool
+from chatbot.services.firestore_service import get_firestore_service, close_firestore_service
+from chatbot.services.usage_service import get_usage_service, close_usage_service
+from chatbot.services.message_outbox import get_message_outbox, close_message_outbox
+from chatbot.services.ingest_jobs import get_ingest_queue, close_ingest_queue, get_ingest_stats
+from chatbot.services.session_store import SessionStore
+from chatbot.services.llm_service import get_chain_stats, get_embedding_stats
+from chatbot.services.vector_service import get_vector_stats
 from chatbot.utils.performance_optimizations import ResponseCache
+from chatbot.utils.shared_cache import content_digest
+from chatbot.utils.context_packer import count_tokens
+from chatbot.utils.embedding_cache import get_embedding_cache
 from chatbot.api.documents import router as documents_router
 from chatbot.api.knowledge_base import router as kb_router
 from chatbot.core.config import settings
@@ -27,11 +40,29 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await get_firestore_service()
+    await get_usage_service()
+    await get_message_outbox()
+    await get_ingest_queue()
+    yield
+    await close_ingest_queue()
+    # After the ingest queue: running jobs still bump knowledge-base versions in the shared cache
+    if app.state.rag_service is not None:
+        await app.state.rag_service.close()
+    get_embedding_cache().close()
+    await close_usage_service()
+    await close_message_outbox()
+    await close_openai_client_pool()
+    await close_firestore_service()
+
 # Initialize FastAPI
 app = FastAPI(
     title="Linkline Chat Bot API",
     description="AI Bot integration for university chat app",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --- CORS ---
@@ -45,93 +76,34 @@ if settings.cors_origins:
     )
 
 # Shared state
-app.state.response_cache = ResponseCache(max_size=1000, ttl=3600)
+app.state.response_cache = ResponseCache(max_size=1000, ttl=settings.cache_ttl, max_bytes=settings.explain_cache_max_bytes)
 app.state.rag_service = None
-app.state.chat_sessions: Dict[Tuple[str, str], str] = {}  # (group_id, user_id) -> session_id
+app.state.chat_sessions = SessionStore(  # (group_id, user_id) -> session_id
+    max_entries=settings.session_max_entries,
+    idle_ttl=settings.session_idle_ttl,
+    max_bytes=settings.session_max_bytes,
+)
+app.state.stream_ttft_ms = deque(maxlen=500)  # time-to-first-token of recent streams
 
 # OpenAI config
-def get_openai_client():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not set")
-    return OpenAI(api_key=api_key)
-
-# Firebase config
-def get_firestore_client():
-    try:
-        if not firebase_admin._apps:
-            # Get the JSON content from the environment variable for deployment
-            firebase_creds_json_str = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
-            if firebase_creds_json_str:
-                firebase_creds_dict = json.loads(firebase_creds_json_str)
-                cred = credentials.Certificate(firebase_creds_dict)
-                firebase_admin.initialize_app(cred)
-                logger.info("Firebase initialized successfully from environment variable.")
-            else:
-                # Fallback for local development (optional, but good practice)
-                local_key_path = "chat_serviceAccountKey.json"
-                if os.path.exists(local_key_path):
-                    cred = credentials.Certificate(local_key_path)
-                    firebase_admin.initialize_app(cred)
-                    logger.info(f"Firebase initialized successfully from local file: {local_key_path}")
-                else:
-                    raise ValueError("Firebase credentials not found in environment variable or local file.")
-
-        db = firestore.client()
-    except Exception as e:
-        logger.error(f"CRITICAL: Failed to initialize Firebase: {e}")
-        db = None # Ensure db is defined even on failure
-    return db
-
+async def get_openai_client() -> AsyncOpenAI:
+    pool = await get_openai_client_pool()
+    return await pool.get_client()
 
 # Usage Limits
-DAILY_GROUP_LIMIT = 10
-
-def _today_str():
-    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+DAILY_GROUP_LIMIT = settings.daily_group_limit
 
 async def check_and_increment_usage(group_id: str, keyword: str) -> None:
-    db = get_firestore_client()
-    if not db or not group_id:
+    if not group_id:
         return
-    today = _today_str()
-    doc_ref = db.collection("groups").document(group_id)
     try:
-        snap = doc_ref.get()
-        data = snap.to_dict() or {}
-        ai_usage = data.get("aiUsage", {}) or {}
-        date_key = ai_usage.get("dateKey")
-        explain_calls = int(ai_usage.get("explainCallsToday", 0) or 0)
-        notes_calls = int(ai_usage.get("notesCallsToday", 0) or 0)
-
-        if date_key != today:
-            explain_calls = notes_calls = 0
-            date_key = today
-
-        total_calls = explain_calls + notes_calls
-        if total_calls >= DAILY_GROUP_LIMIT:
-            raise HTTPException(status_code=429, detail="Daily AI limit reached")
-
-        if keyword == "@explain":
-            explain_calls += 1
-        else:
-            notes_calls += 1
-
-        doc_ref.set(
-            {
-                "aiUsage": {
-                    "dateKey": date_key,
-                    "explainCallsToday": explain_calls,
-                    "notesCallsToday": notes_calls,
-                }
-            },
-            merge=True,
-        )
-    except HTTPException:
-        raise
+        usage_service = await get_usage_service()
+        allowed = await usage_service.try_consume(group_id, keyword)
     except Exception as e:
-        print(f"Usage limit check error: {str(e)}")
+        logger.error(f"Usage limit check error: {e}")
         return
+    if not allowed:
+        raise HTTPException(status_code=429, detail="Daily AI limit reached")
 
 # Pydantic models
 class ChatMessage(BaseModel):
@@ -174,6 +146,21 @@ def _get_rag_chat_service() -> RAGChatService:
         app.state.rag_service = RAGChatService()
     return app.state.rag_service
 
+def _build_rag_message(group_id: str, user_id: str, query: str) -> Tuple[Tuple[str, str], RAGMessage]:
+    session_key = (group_id, user_id)
+    session_id = app.state.chat_sessions.get(session_key)
+    # Without a known session ChatService falls back to the user's default one,
+    # so conversations continue across restarts and workers.
+    rag_message = RAGMessage(
+        user_id=user_id,
+        message=query,
+        new_chat=False,
+        use_rag=True,
+        group_id=group_id,
+        session_id=session_id
+    )
+    return session_key, rag_message
+
 def detect_bot_mention(message: str) -> Optional[str]:
     for keyword in BOT_KEYWORDS.keys():
         if keyword in message.lower():
@@ -184,52 +171,112 @@ def extract_query_from_mention(message: str, keyword: str) -> str:
     query = message.replace(keyword, "").strip()
     return re.sub(r"\s+", " ", query) or "Hello! What would you like me to help with?"
 
-async def get_openai_response(query: str, system_prompt: str, context: list = None) -> str:
+EXPLAIN_MODEL = "gpt-3.5-turbo"
+
+def _build_explain_messages(query: str, system_prompt: str, context: list = None) -> List[Dict[str, str]]:
+    messages = [{"role": "system", "content": system_prompt}]
+    if context:
+        # Newest messages first, until the token budget is spent
+        lines = []
+        budget = settings.explain_context_max_tokens
+        for msg in reversed(context[-10:]):
+            role = "User" if msg.get("user_id") != "bot" else "Assistant"
+            line = f"{role}: {msg.get('message','')}\n"
+            budget -= count_tokens(line, EXPLAIN_MODEL)
+            if budget < 0:
+                break
+            lines.append(line)
+        if lines:
+            messages.append({"role": "system", "content": "Conversation context:\n" + "".join(reversed(lines))})
+    messages.append({"role": "user", "content": query})
+    return messages
+
+# Cache-Control style values for the `cache_control` query flag
+NO_CACHE = "no-cache"  # don't read the cache, still store the fresh answer
+NO_STORE = "no-store"  # bypass the cache entirely
+
+def _explain_cache_key(messages: List[Dict[str, str]]) -> str:
+    # messages already hold the system prompt, the truncated context window and the query
+    return "explain:" + content_digest(EXPLAIN_MODEL, json.dumps(messages, sort_keys=True))
+
+async def _get_cached_explanation(cache_key: str, cache_control: Optional[str]) -> Optional[str]:
+    if not settings.enable_caching or cache_control in (NO_CACHE, NO_STORE):
+        return None
+    cached = await app.state.response_cache.get(cache_key)
+    return cached["response"] if cached else None
+
+async def _store_explanation(cache_key: str, response_text: str, cache_control: Optional[str]):
+    if settings.enable_caching and cache_control != NO_STORE and response_text:
+        await app.state.response_cache.set(cache_key, {"response": response_text})
+
+async def get_openai_response(query: str, system_prompt: str, context: list = None, cache_control: Optional[str] = None) -> str:
     try:
-        client = get_openai_client()
-        messages = [{"role": "system", "content": system_prompt}]
-        if context:
-            ctx_msg = "Conversation context:\n"
-            for msg in context[-10:]:
-                role = "User" if msg.get("user_id") != "bot" else "Assistant"
-                ctx_msg += f"{role}: {msg.get('message','')}\n"
-            messages.append({"role": "system", "content": ctx_msg})
-        messages.append({"role": "user", "content": query})
-
-        resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        messages = _build_explain_messages(query, system_prompt, context)
+        cache_key = _explain_cache_key(messages)
+        cached = await _get_cached_explanation(cache_key, cache_control)
+        if cached is not None:
+            return cached
+
+        client = await get_openai_client()
+        resp = await client.chat.completions.create(
+            model=EXPLAIN_MODEL,
             messages=messages,
             max_tokens=400,
             temperature=0.7,
         )
-        return resp.choices[0].message.content.strip()
+        response_text = resp.choices[0].message.content.strip()
+        await _store_explanation(cache_key, response_text, cache_control)
+        return response_text
     except Exception as e:
         return f"Error fetching response: {str(e)}"
 
+async def stream_openai_response(query: str, system_prompt: str, context: list = None, cache_control: Optional[str] = None) -> AsyncIterator[str]:
+    messages = _build_explain_messages(query, system_prompt, context)
+    cache_key = _explain_cache_key(messages)
+    cached = await _get_cached_explanation(cache_key, cache_control)
+    if cached is not None:
+        yield cached
+        return
+
+    client = await get_openai_client()
+    stream = await client.chat.completions.create(
+        model=EXPLAIN_MODEL,
+        messages=messages,
+        max_tokens=400,
+        temperature=0.7,
+        stream=True,
+    )
+    chunks = []
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            chunks.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    await _store_explanation(cache_key, "".join(chunks).strip(), cache_control)
+
 async def store_bot_message_in_firestore(bot_response: BotResponse):
     try:
-        db = get_firestore_client()
-        if not db:
-            return
+        outbox = await get_message_outbox()
         message_data = {
             "text": bot_response.response,
             "name": bot_response.bot_name,
             "avatar": None,
-            "createAt": fa_firestore.SERVER_TIMESTAMP,
             "id": "bot",
             "type": "aiResponse",
             "mentions": [],
         }
-        db.collection("groups").document(bot_response.group_id).collection("messages").add(message_data)
+        await outbox.enqueue(bot_response.group_id, message_data)
     except Exception as e:
-        print(f"Firestore store error: {str(e)}")
+        logger.error(f"Firestore store error: {e}")
 
 # --- Routers ---
 app.include_router(documents_router, prefix="/rag", tags=["rag-documents"])
 app.include_router(kb_router, prefix="/rag", tags=["rag-knowledge-base"])
 
 @app.post("/chat", response_model=BotResponse)
-async def explain_bot(message_data: ChatMessage):
+async def explain_bot(
+    message_data: ChatMessage,
+    cache_control: Optional[str] = Query(default=None, description="'no-cache' or 'no-store' to bypass the @explain cache"),
+):
     try:
         keyword = detect_bot_mention(message_data.message)
         if not keyword:
@@ -240,25 +287,16 @@ async def explain_bot(message_data: ChatMessage):
         query = extract_query_from_mention(message_data.message, keyword)
 
         if keyword == "@explain":
-            response_text = await get_openai_response(query, bot_config["system_prompt"], message_data.context)
+            response_text = await get_openai_response(query, bot_config["system_prompt"], message_data.context, cache_control)
         else:
-            session_key = (message_data.group_id, message_data.user_id)
-            session_id = app.state.chat_sessions.get(session_key)
-            rag_message = RAGMessage(
-                user_id=message_data.user_id,
-                message=query,
-                new_chat=session_id is None,
-                use_rag=True,
-                group_id=message_data.group_id,
-                session_id=session_id
-            )
+            session_key, rag_message = _build_rag_message(message_data.group_id, message_data.user_id, query)
             chat_service = _get_rag_chat_service()
             response_data = await chat_service.process_message(rag_message)
 
             response_text = response_data.get("response", "Sorry, I couldn't generate a response.")
             # update session
             if "session_id" in response_data:
-                app.state.chat_sessions[session_key] = response_data["session_id"]
+                app.state.chat_sessions.set(session_key, response_data["session_id"])
 
         bot_response = BotResponse(
             response=response_text,
@@ -273,23 +311,173 @@ async def explain_bot(message_data: ChatMessage):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_bot_events(message_data: ChatMessage, keyword: str, cache_control: Optional[str] = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Yields (event, data) pairs for one bot reply: "start", one "token" per chunk,
+    then "done" with the full BotResponse. The reply is persisted once the stream completes.
+    """
+    bot_config = BOT_KEYWORDS[keyword]
+    query = extract_query_from_mention(message_data.message, keyword)
+    started = time.perf_counter()
+    first_token = True
+    chunks: List[str] = []
+    yield "start", {"bot_name": bot_config["name"], "group_id": message_data.group_id}
+
+    if keyword == "@explain":
+        try:
+            async for token in stream_openai_response(query, bot_config["system_prompt"], message_data.context, cache_control):
+                if first_token:
+                    app.state.stream_ttft_ms.append((time.perf_counter() - started) * 1000)
+                    first_token = False
+                chunks.append(token)
+                yield "token", {"text": token}
+            response_text = "".join(chunks).strip()
+        except Exception as e:
+            response_text = f"Error fetching response: {str(e)}"
+    else:
+        session_key, rag_message = _build_rag_message(message_data.group_id, message_data.user_id, query)
+        chat_service = _get_rag_chat_service()
+        response_data = {}
+        async for event in chat_service.stream_message(rag_message):
+            if "token" in event:
+                if first_token:
+                    app.state.stream_ttft_ms.append((time.perf_counter() - started) * 1000)
+                    first_token = False
+                yield "token", {"text": event["token"]}
+            else:
+                response_data = event
+        response_text = response_data.get("response") or "Sorry, I couldn't generate a response."
+        if "session_id" in response_data:
+            app.state.chat_sessions.set(session_key, response_data["session_id"])
+
+    bot_response = BotResponse(
+        response=response_text,
+        bot_name=bot_config["name"],
+        timestamp=datetime.now(),
+        group_id=message_data.group_id,
+        user_id=message_data.user_id,
+        username=message_data.username,
+    )
+    await store_bot_message_in_firestore(bot_response)
+    yield "done", bot_response.model_dump(mode="json")
+
+@app.post("/chat/stream")
+async def explain_bot_stream(
+    message_data: ChatMessage,
+    cache_control: Optional[str] = Query(default=None, description="'no-cache' or 'no-store' to bypass the @explain cache"),
+):
+    """Server-Sent Events variant of /chat that streams tokens as they are generated"""
+    keyword = detect_bot_mention(message_data.message)
+    if not keyword:
+        raise HTTPException(status_code=400, detail="No supported bot mention")
+    await check_and_increment_usage(message_data.group_id, keyword)
+
+    async def event_stream():
+        try:
+            async for event, data in stream_bot_events(message_data, keyword, cache_control):
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}", exc_info=True)
+            yield _sse("error", {"detail": f"Chat error: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _ws_event(event_type: str, data: dict) -> dict:
+    return WSResponse(type=event_type, data=data, timestamp=datetime.now().isoformat()).model_dump(mode="json")
+
+@app.websocket("/ws")
+async def bot_websocket(websocket: WebSocket):
+    """
+    Persistent bot channel for one client session. Clients send WSMessage frames
+    ("message" with a ChatMessage payload plus request_id, "cancel", "ping");
+    replies for concurrent requests are multiplexed by request_id as WSResponse frames.
+    """
+    await websocket.accept()
+    # Producers block on a full queue, so a slow client throttles its own token streams
+    outgoing: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+    inflight = asyncio.Semaphore(settings.ws_max_inflight)
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def send_loop():
+        while True:
+            await websocket.send_json(await outgoing.get())
+
+    async def handle_request(request_id: str, message_data: ChatMessage):
+        try:
+            keyword = detect_bot_mention(message_data.message)
+            if not keyword:
+                raise HTTPException(status_code=400, detail="No supported bot mention")
+            if inflight.locked():
+                await outgoing.put(_ws_event("progress", {"request_id": request_id, "stage": "queued"}))
+            async with inflight:
+                await check_and_increment_usage(message_data.group_id, keyword)
+                await outgoing.put(_ws_event("typing", {"request_id": request_id, "bot_name": BOT_KEYWORDS[keyword]["name"]}))
+                async for event, data in stream_bot_events(message_data, keyword):
+                    if event == "start":
+                        await outgoing.put(_ws_event("progress", {"request_id": request_id, "stage": "generating"}))
+                    else:
+                        await outgoing.put(_ws_event(event, {"request_id": request_id, **data}))
+        except HTTPException as e:
+            await outgoing.put(_ws_event("error", {"request_id": request_id, "status_code": e.status_code, "detail": e.detail}))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket bot request error: {e}", exc_info=True)
+            await outgoing.put(_ws_event("error", {"request_id": request_id, "status_code": 500, "detail": f"Chat error: {str(e)}"}))
+        finally:
+            tasks.pop(request_id, None)
+
+    sender = asyncio.create_task(send_loop())
+    try:
+        while True:
+            try:
+                frame = WSMessage.model_validate(await websocket.receive_json())
+            except (ValidationError, ValueError) as e:
+                await outgoing.put(_ws_event("error", {"status_code": 422, "detail": str(e)}))
+                continue
+
+            request_id = str(frame.data.get("request_id", ""))
+            if frame.type == "ping":
+                await outgoing.put(_ws_event("pong", {}))
+            elif frame.type == "cancel":
+                task = tasks.get(request_id)
+                if task:
+                    task.cancel()
+                    await outgoing.put(_ws_event("progress", {"request_id": request_id, "stage": "cancelled"}))
+            elif frame.type == "message":
+                if not request_id or request_id in tasks:
+                    await outgoing.put(_ws_event("error", {"request_id": request_id, "status_code": 400, "detail": "request_id must be unique per connection"}))
+                    continue
+                try:
+                    message_data = ChatMessage.model_validate(frame.data)
+                except ValidationError as e:
+                    await outgoing.put(_ws_event("error", {"request_id": request_id, "status_code": 422, "detail": str(e)}))
+                    continue
+                tasks[request_id] = asyncio.create_task(handle_request(request_id, message_data))
+            else:
+                await outgoing.put(_ws_event("error", {"request_id": request_id, "status_code": 400, "detail": f"Unknown message type: {frame.type}"}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in list(tasks.values()):
+            task.cancel()
+        sender.cancel()
+
 @app.post("/rag")
 async def rag_bot(request: RAGRequest):
     try:
-        session_key = (request.group_id, request.user_id)
-        session_id = app.state.chat_sessions.get(session_key)
-        rag_message = RAGMessage(
-            user_id=request.user_id,
-            message=request.query,
-            new_chat=session_id is None,
-            use_rag=True,
-            group_id=request.group_id,
-            session_id=session_id
-        )
+        session_key, rag_message = _build_rag_message(request.group_id, request.user_id, request.query)
         chat_service = _get_rag_chat_service()
         response_data = await chat_service.process_message(rag_message)
         if "session_id" in response_data:
-            app.state.chat_sessions[session_key] = response_data["session_id"]
+            app.state.chat_sessions.set(session_key, response_data["session_id"])
 
         return {
             "response": response_data.get("response"),
@@ -308,6 +496,30 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
+@app.get("/stats")
+async def stats():
+    usage_service = await get_usage_service()
+    outbox = await get_message_outbox()
+    ttft = sorted(app.state.stream_ttft_ms)
+    return {
+        "usage": usage_service.get_stats(),
+        "outbox": outbox.get_stats(),
+        "explain_cache": app.state.response_cache.get_stats(),
+        "embeddings": {"cache": get_embedding_cache().get_stats(), **get_embedding_stats()},
+        "vectors": get_vector_stats(),
+        "ingest_jobs": get_ingest_stats(),
+        "rag_chains": get_chain_stats(),
+        "sessions": {
+            "chat_sessions": app.state.chat_sessions.get_stats(),
+            **(app.state.rag_service.get_stats() if app.state.rag_service else {}),
+        },
+        "stream": {
+            "samples": len(ttft),
+            "ttft_ms_p50": ttft[len(ttft) // 2] if ttft else 0.0,
+            "ttft_ms_p95": ttft[int(len(ttft) * 0.95)] if ttft else 0.0,
+        },
+    }
+
 if __name__ == "__main__":
     import uvicorn, os
     port = int(os.environ.get("PORT", 8000))  # Railway provides PORT
@@ -0,0 +1,156 @@
+"""
+Concurrent /chat throughput benchmark for the @explain path.
+
+Fires N "@explain" requests at a running API with a fixed concurrency and
+reports requests/second and latency percentiles. Every request uses its own
+group so the per-group daily limit (daily_group_limit) never answers 429.
+
+    python scripts/bench_chat_throughput.py --url http://localhost:8000 -n 200 -c 50
+
+With --fake-upstream the script starts a stub OpenAI-compatible server that
+answers every completion after --upstream-latency seconds, then launches the
+API against it (OPENAI_BASE_URL), so before/after numbers can be taken
+offline by running it on two checkouts.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _fake_upstream_app(latency: float):
+    from fastapi import FastAPI
+
+    upstream = FastAPI()
+
+    @upstream.post("/v1/chat/completions")
+    async def completions():
+        await asyncio.sleep(latency)
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-3.5-turbo",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "benchmark reply"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    return upstream
+
+
+async def _wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run_benchmark(url: str, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=120.0, limits=limits) as client:
+        async def one(i: int):
+            nonlocal errors
+            payload = {
+                "message": f"@explain recursion #{i}",
+                "group_id": f"bench-group-{i}",
+                "user_id": f"bench-user-{i % concurrency}",
+                "username": "bench",
+            }
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    resp = await client.post("/chat", json=payload)
+                    if resp.status_code != 200:
+                        errors += 1
+                        statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "error_statuses": statuses,
+        "elapsed_s": elapsed,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("--fake-upstream", action="store_true", help="start a stub OpenAI server and the API locally")
+    parser.add_argument("--upstream-latency", type=float, default=0.5)
+    parser.add_argument("--upstream-port", type=int, default=8765)
+    parser.add_argument("--api-port", type=int, default=8000)
+    args = parser.parse_args()
+
+    procs = []
+    url = args.url
+    try:
+        if args.fake_upstream:
+            import uvicorn
+            import threading
+
+            config = uvicorn.Config(
+                _fake_upstream_app(args.upstream_latency),
+                host="127.0.0.1", port=args.upstream_port, log_level="warning",
+            )
+            threading.Thread(target=uvicorn.Server(config).run, daemon=True).start()
+
+            env = dict(os.environ)
+            env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.upstream_port}/v1"
+            env.setdefault("OPENAI_API_KEY", "sk-bench")
+            procs.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                 "--port", str(args.api_port), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=env,
+            ))
+            url = f"http://127.0.0.1:{args.api_port}"
+            asyncio.run(_wait_until_up(f"http://127.0.0.1:{args.upstream_port}/docs"))
+            asyncio.run(_wait_until_up(f"{url}/health"))
+
+        result = asyncio.run(run_benchmark(url, args.requests, args.concurrency))
+        for key, value in result.items():
+            print(f"{key:>16}: {value:.2f}" if isinstance(value, float) else f"{key:>16}: {value}")
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Move per-group Pinecone indexes into the shared index used by
+pinecone_index_mode="shared".
+
+Every index named "{PINECONE_INDEX_NAME}-<group>" is copied namespace by
+namespace (the namespace already is the group id) into the shared index
+"{PINECONE_INDEX_NAME}", keeping vector ids, values and metadata.
+
+    python scripts/migrate_pinecone_to_shared_index.py --dry-run
+    python scripts/migrate_pinecone_to_shared_index.py --delete-source
+
+Run it before switching PINECONE_INDEX_MODE=shared on the API; it is safe to
+re-run (upserts are idempotent by id).
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+FETCH_BATCH = 100  # ids per fetch request
+UPSERT_BATCH = 100
+
+
+def _vector_records(source, namespace: str, ids):
+    fetched = source.fetch(ids=list(ids), namespace=namespace)
+    for vector_id, vector in fetched.vectors.items():
+        yield {"id": vector_id, "values": vector.values, "metadata": vector.metadata or {}}
+
+
+def migrate_index(pc, source_name: str, target, dry_run: bool) -> int:
+    source = pc.Index(source_name)
+    stats = source.describe_index_stats()
+    moved = 0
+    for namespace, summary in (stats.namespaces or {}).items():
+        print(f"  {source_name} / namespace '{namespace}': {summary.vector_count} vectors")
+        if dry_run:
+            moved += summary.vector_count
+            continue
+        batch = []
+        for ids in source.list(namespace=namespace, limit=FETCH_BATCH):
+            batch.extend(_vector_records(source, namespace, ids))
+            while len(batch) >= UPSERT_BATCH:
+                target.upsert(vectors=batch[:UPSERT_BATCH], namespace=namespace)
+                moved += UPSERT_BATCH
+                batch = batch[UPSERT_BATCH:]
+        if batch:
+            target.upsert(vectors=batch, namespace=namespace)
+            moved += len(batch)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be moved")
+    parser.add_argument("--delete-source", action="store_true", help="delete each per-group index once copied")
+    args = parser.parse_args()
+
+    load_dotenv(BACKEND_DIR / ".env")
+    from pinecone import Pinecone
+    from chatbot.services.vector_backends import PineconeBackend
+
+    api_key = os.getenv("PINECONE_API_KEY")
+    if not api_key:
+        sys.exit("PINECONE_API_KEY not found in environment variables")
+    pc = Pinecone(api_key=api_key)
+
+    shared_name = PineconeBackend.base_index_name()
+    index_names = [idx["name"] for idx in pc.list_indexes()]
+    sources = [name for name in index_names if name.startswith(f"{shared_name}-")]
+    if not sources:
+        print("No per-group indexes to migrate.")
+        return
+
+    if shared_name not in index_names and not args.dry_run:
+        # Creates the shared index with the same spec the API would use
+        import asyncio
+        backend = PineconeBackend(embeddings=None, api_key=api_key, index_mode="shared")
+        asyncio.run(backend.initialize())
+    target = None if args.dry_run else pc.Index(shared_name)
+
+    total = 0
+    for source_name in sources:
+        moved = migrate_index(pc, source_name, target, args.dry_run)
+        total += moved
+        if args.delete_source and not args.dry_run:
+            pc.delete_index(source_name)
+            print(f"  deleted {source_name}")
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"{verb} {total} vectors from {len(sources)} indexes into '{shared_name}'.")
+
+
+if __name__ == "__main__":
+    main()
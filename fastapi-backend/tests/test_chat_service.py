@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from chatbot.core.config import settings
+from chatbot.models.api_models import Message
+from chatbot.services import chat_service
+from chatbot.services.chat_service import ChatService
+from chatbot.utils import shared_cache
+
+
+class _Chain:
+    def __init__(self, llm):
+        self.llm = llm
+
+    async def ainvoke(self, inputs):
+        self.llm.prompts.append(inputs)
+        await asyncio.sleep(0.01)
+        return {"answer": f"answer {len(self.llm.prompts)}", "context": []}
+
+
+class _LLMService:
+    llm = None
+
+    def __init__(self):
+        self.prompts = []
+
+    async def create_rag_chain(self, retriever):
+        return _Chain(self)
+
+
+class _VectorService:
+    async def get_retriever(self, group_id):
+        return object()
+
+
+@pytest.fixture
+def llm_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "shared_cache_path", str(tmp_path / "shared.db"))
+    monkeypatch.setattr(settings, "history_backend", "memory")
+    monkeypatch.setattr(settings, "enable_caching", True)
+    monkeypatch.setattr(settings, "enable_semantic_cache", False)
+    monkeypatch.setattr(shared_cache, "_shared_cache", None)
+    service = _LLMService()
+
+    async def get_llm_service():
+        return service
+
+    async def get_vector_service():
+        return _VectorService()
+
+    monkeypatch.setattr(chat_service, "get_llm_service", get_llm_service)
+    monkeypatch.setattr(chat_service, "get_vector_service", get_vector_service)
+    return service
+
+
+def _message(text, user_id="u1"):
+    return Message(user_id=user_id, message=text, group_id="g")
+
+
+def test_standalone_question_is_answered_with_the_session_history(llm_service):
+    async def scenario():
+        service = ChatService()
+        await service.process_message(_message("What topics does the course cover?"))
+        await service.process_message(_message("When is the midterm exam?"))
+        shared = await service.process_message(_message("When is the midterm exam?", user_id="u2"))
+        await service.close()
+        return shared
+
+    shared = asyncio.run(scenario())
+
+    # The second question was generated with the first turn in its prompt...
+    assert len(llm_service.prompts) == 2
+    assert [message.content for message in llm_service.prompts[1]["chat_history"]] == [
+        "What topics does the course cover?", "answer 1"
+    ]
+    # ...and is still shared with other sessions through the response cache
+    assert shared["from_cache"] is True and shared["response"] == "answer 2"
+
+
+def test_follow_up_questions_are_not_cached(llm_service):
+    async def scenario():
+        service = ChatService()
+        await service.process_message(_message("What topics does the course cover?"))
+        await service.process_message(_message("And the second one?"))
+        await service.process_message(_message("And the second one?"))
+        await service.close()
+
+    asyncio.run(scenario())
+
+    assert len(llm_service.prompts) == 3
+
+
+def test_close_releases_the_shared_cache(llm_service):
+    async def scenario():
+        service = ChatService()
+        cache = service.response_cache
+        await service.process_message(_message("What topics does the course cover?"))
+        await service.close()
+        return cache
+
+    cache = asyncio.run(scenario())
+
+    assert cache.store._conn is None
+    assert shared_cache._shared_cache is None
+
+
+def test_identical_concurrent_questions_share_one_generation(llm_service):
+    async def scenario():
+        service = ChatService()
+        answers = await asyncio.gather(*(
+            service.process_message(_message("When is the midterm exam?", user_id=f"u{i}")) for i in range(5)
+        ))
+        stats = service.single_flight.get_stats()
+        await service.close()
+        return answers, stats
+
+    answers, stats = asyncio.run(scenario())
+
+    assert len(llm_service.prompts) == 1
+    assert {answer["response"] for answer in answers} == {"answer 1"}
+    assert stats["coalesced"] == 4
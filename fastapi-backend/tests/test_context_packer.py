@@ -0,0 +1,124 @@
+from langchain_core.documents import Document
+
+from chatbot.services.vector_service import chunk_digest
+from chatbot.utils import context_packer
+from chatbot.utils.context_packer import ContextPacker, count_tokens
+
+SHARED = "the shared overlap between neighbouring chunks "
+
+
+def _linked(texts, source="notes.pdf"):
+    """Chunks of one file with the content links set at ingestion"""
+    docs, previous = [], None
+    for index, text in enumerate(texts):
+        docs.append(Document(page_content=text, metadata={
+            "source_file": source,
+            "chunk_index": index,
+            "chunk_digest": chunk_digest(text),
+            "prev_chunk_digest": chunk_digest(previous) if previous is not None else "",
+        }))
+        previous = text
+    return docs
+
+
+def _chunks():
+    return [
+        "Alpha section opens the notes. " + SHARED,
+        SHARED + "Beta section follows with details. " + SHARED.upper(),
+        SHARED.upper() + "Gamma section closes the notes.",
+    ]
+
+
+def test_linked_chunks_are_stitched_in_document_order():
+    packer = ContextPacker(token_budget=10_000)
+    first, second, third = _linked(_chunks())
+
+    packed = packer.pack([third, first, second])
+
+    assert len(packed) == 1
+    text = packed[0].page_content
+    assert text.startswith("Alpha section")
+    assert text.endswith("Gamma section closes the notes.")
+    assert text.count(SHARED) == 1  # overlap kept once
+    assert packed[0].metadata["merged_chunks"] == 3
+    assert packer.stats["merged"] == 2
+
+
+def test_stale_chunk_index_does_not_break_links():
+    packer = ContextPacker(token_budget=10_000)
+    first, second, _ = _linked(_chunks())
+    # A paragraph was inserted before `second` in a later upload; its stored index is stale
+    second.metadata["chunk_index"] = 7
+
+    packed = packer.pack([second, first])
+
+    assert len(packed) == 1
+    assert packed[0].page_content.startswith("Alpha section")
+
+
+def test_float_chunk_index_merges_legacy_chunks():
+    packer = ContextPacker(token_budget=10_000)
+    first, second, _ = _chunks()
+    docs = [
+        Document(page_content=second, metadata={"source_file": "a.pdf", "chunk_index": 1.0}),
+        Document(page_content=first, metadata={"source_file": "a.pdf", "chunk_index": 0.0}),
+    ]
+
+    packed = packer.pack(docs)
+
+    assert len(packed) == 1
+    assert packed[0].metadata["chunk_index"] == 0
+    assert packed[0].metadata["merged_chunks"] == 2
+
+
+def test_near_duplicates_are_dropped():
+    packer = ContextPacker(token_budget=10_000)
+    text = "office hours are on tuesday at three in room b12 of the science building"
+    docs = [
+        Document(page_content=text, metadata={"source_file": "a.pdf"}),
+        Document(page_content=text + ".", metadata={"source_file": "b.pdf"}),
+    ]
+
+    packed = packer.pack(docs)
+
+    assert [doc.metadata["source_file"] for doc in packed] == ["a.pdf"]
+    assert packer.stats["deduped"] == 1
+
+
+def test_budget_truncates_only_the_best_match():
+    long_text = " ".join(f"word{i}" for i in range(400))
+    budget = count_tokens(long_text) // 4
+    packer = ContextPacker(token_budget=budget)
+    docs = [
+        Document(page_content=long_text, metadata={"source_file": "a.pdf"}),
+        Document(page_content="a short unrelated answer", metadata={"source_file": "b.pdf"}),
+    ]
+
+    packed = packer.pack(docs)
+
+    assert packed[0].metadata["source_file"] == "a.pdf"
+    assert count_tokens(packed[0].page_content) <= budget
+    assert packer.stats["truncated"] == 1
+
+
+def test_repeated_text_cannot_loop():
+    packer = ContextPacker(token_budget=10_000)
+    text = "Repeated paragraph that appears twice in the file, word for word. " * 3
+    # Same text twice in a row: the second chunk's predecessor digest is its own digest
+    docs = _linked([text, text])
+
+    packed = packer.pack(docs)
+
+    assert packed
+    assert packer.stats["docs_out"] == len(packed)
+
+
+def test_token_counts_are_estimated_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(context_packer, "tiktoken", None)
+    context_packer.get_encoder.cache_clear()
+    try:
+        assert count_tokens("abcdefghij") == 3
+        packed = ContextPacker(token_budget=5).pack([Document(page_content="x" * 100, metadata={})])
+        assert count_tokens(packed[0].page_content) <= 5
+    finally:
+        context_packer.get_encoder.cache_clear()
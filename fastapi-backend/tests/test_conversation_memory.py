@@ -0,0 +1,100 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import SystemMessage
+
+from chatbot.services.conversation_memory import ConversationMemory
+from chatbot.services.history_backend import InMemoryHistoryBackend, SQLiteHistoryBackend
+from chatbot.services.session_store import AI, HUMAN, ConversationHistory
+from chatbot.utils.context_packer import count_tokens
+
+KEY = ("group", "user", "session")
+
+
+class _SummaryModel(FakeListChatModel):
+    def bind(self, **kwargs):
+        return self
+
+
+def _turns(count):
+    records = []
+    for i in range(count):
+        records += [(HUMAN, f"question {i}"), (AI, f"answer {i}")]
+    return records
+
+
+def _memory(backend, max_tokens=2000, recent_turns=1, summarize_every_turns=1):
+    return ConversationMemory(backend, recent_turns=recent_turns, max_tokens=max_tokens, summary_max_tokens=100,
+                              summarize_every_turns=summarize_every_turns)
+
+
+def test_newest_messages_fill_the_token_budget():
+    records = _turns(10)
+    budget = sum(count_tokens(content) for _, content in records[-3:])
+    memory = _memory(InMemoryHistoryBackend(), max_tokens=budget)
+
+    messages = memory.prompt_messages(KEY, ConversationHistory(records))
+
+    assert [message.content for message in messages] == [content for _, content in records[-3:]]
+    assert memory.stats["trimmed_messages"] == len(records) - 3
+
+
+def test_oversized_latest_message_keeps_its_tail():
+    long_message = " ".join(f"token{i}" for i in range(200))
+    memory = _memory(InMemoryHistoryBackend(), max_tokens=20)
+
+    messages = memory.prompt_messages(KEY, ConversationHistory([(HUMAN, long_message)]))
+
+    assert len(messages) == 1
+    assert long_message.endswith(messages[0].content)
+    assert count_tokens(messages[0].content) <= 20
+
+
+def test_summary_is_shared_through_the_backend(tmp_path):
+    async def scenario():
+        db_path = str(tmp_path / "history.db")
+        writer_backend, reader_backend = SQLiteHistoryBackend(db_path), SQLiteHistoryBackend(db_path)
+        writer, reader = _memory(writer_backend), _memory(reader_backend)
+        await writer_backend.append(KEY, _turns(4))
+        await writer_backend.flush()
+
+        history = await writer_backend.load(KEY)
+        writer.maybe_summarize(KEY, history.records, history.summary, _SummaryModel(responses=["SUMMARY"]))
+        await asyncio.gather(*writer._tasks.values())
+
+        # Another worker sees the summary plus only what it doesn't cover
+        shared = await reader_backend.load(KEY)
+        messages = reader.prompt_messages(KEY, shared)
+        await writer_backend.close()
+        await reader_backend.close()
+        return shared, messages
+
+    shared, messages = asyncio.run(scenario())
+
+    assert shared.summary[0] == "SUMMARY"
+    assert isinstance(messages[0], SystemMessage) and "SUMMARY" in messages[0].content
+    assert [message.content for message in messages[1:]] == ["question 3", "answer 3"]
+
+
+def test_no_key_means_no_summary():
+    memory = _memory(InMemoryHistoryBackend())
+    history = ConversationHistory(_turns(2), summary=("SUMMARY", "unknown digest"))
+
+    assert "SUMMARY" in memory.prompt_messages(KEY, history)[0].content
+    assert all("SUMMARY" not in message.content for message in memory.prompt_messages(None, history))
+
+
+def test_summarizing_waits_for_enough_old_turns():
+    async def scenario():
+        backend = InMemoryHistoryBackend()
+        memory = _memory(backend, recent_turns=2, summarize_every_turns=2)
+        await backend.append(KEY, _turns(3))
+        history = await backend.load(KEY)
+        memory.maybe_summarize(KEY, history.records, history.summary, _SummaryModel(responses=["SUMMARY"]))
+        return memory
+
+    memory = asyncio.run(scenario())
+
+    # Only one turn fell out of the recent window
+    assert not memory._tasks
+    assert memory.stats["summaries"] == 0
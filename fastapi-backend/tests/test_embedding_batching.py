@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from chatbot.services.llm_service import BatchingEmbeddings
+
+
+class _CountingEmbeddings:
+    def __init__(self, inner, fail=False):
+        self.inner = inner
+        self.fail = fail
+        self.calls = []
+
+    async def aembed_documents(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("rate limited")
+        return await self.inner.aembed_documents(texts)
+
+
+def test_concurrent_queries_share_one_request(embeddings):
+    upstream = _CountingEmbeddings(embeddings)
+    batcher = BatchingEmbeddings(upstream, max_wait=0.01, max_batch=64)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.aembed_query(text) for text in ["a", "b", "a", "c"]))
+
+    vectors = asyncio.run(scenario())
+
+    assert upstream.calls == [["a", "b", "c"]]
+    assert vectors == [embeddings.embed_query(text) for text in ["a", "b", "a", "c"]]
+    assert batcher.get_stats()["mean_batch_size"] == 4
+
+
+def test_full_batch_is_sent_without_waiting(embeddings):
+    upstream = _CountingEmbeddings(embeddings)
+    batcher = BatchingEmbeddings(upstream, max_wait=60, max_batch=3)
+
+    async def scenario():
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.aembed_query(str(i)) for i in range(3))), timeout=1
+        )
+
+    asyncio.run(scenario())
+
+    assert upstream.calls == [["0", "1", "2"]]
+
+
+def test_failed_batch_reaches_every_caller(embeddings):
+    batcher = BatchingEmbeddings(_CountingEmbeddings(embeddings, fail=True), max_wait=0.01, max_batch=64)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.aembed_query(text) for text in "ab"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.stats["errors"] == 1
+
+
+def test_cancelled_caller_does_not_break_the_batch(embeddings):
+    batcher = BatchingEmbeddings(_CountingEmbeddings(embeddings), max_wait=0.01, max_batch=64)
+
+    async def scenario():
+        cancelled = asyncio.create_task(batcher.aembed_query("a"))
+        kept = asyncio.create_task(batcher.aembed_query("b"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await kept
+
+    assert asyncio.run(scenario()) == embeddings.embed_query("b")
@@ -0,0 +1,73 @@
+import numpy as np
+
+from chatbot.utils import embedding_cache
+from chatbot.utils.embedding_cache import EmbeddingCache, EmbeddingDiskStore
+
+DIM = 4
+ROW_BYTES = DIM * 4
+
+
+def _vector(i):
+    return np.full(DIM, i, dtype=np.float32)
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    first = EmbeddingCache(str(tmp_path), l1_size=2)
+    first.put("model", "what is a graph", [0.5] * DIM)
+    first.close()
+
+    second = EmbeddingCache(str(tmp_path), l1_size=2)
+    assert second.get("model", "what is a graph").tolist() == [0.5] * DIM
+    assert second.get("model", "what is a graph") is not None
+    assert second.get("model", "unknown") is None
+    assert (second.stats["l2_hits"], second.stats["l1_hits"], second.stats["misses"]) == (1, 1, 1)
+    second.close()
+
+
+def test_l1_is_a_bounded_lru():
+    cache = EmbeddingCache(None, l1_size=2)
+    for text in ("a", "b", "c"):
+        cache.put("model", text, [1.0] * DIM)
+
+    assert cache.get_local("model", "a") is None
+    assert cache.get_local("model", "c") is not None
+
+
+def test_compaction_keeps_the_newest_rows(tmp_path):
+    store = EmbeddingDiskStore(str(tmp_path), max_bytes=10 * ROW_BYTES)
+    for i in range(11):
+        store.put(f"k{i}", "model", _vector(i))
+
+    assert store.compactions == 1
+    assert store.get("k0") is None and store.get("k5") is None
+    assert [store.get(f"k{i}")[0] for i in range(6, 11)] == [6, 7, 8, 9, 10]
+    assert sorted(path.name for path in tmp_path.glob("*.f32")) == ["model.4.1.f32"]
+    store.close()
+
+
+def test_workers_never_write_to_a_retired_file(tmp_path):
+    first = EmbeddingDiskStore(str(tmp_path), max_bytes=10 * ROW_BYTES)
+    second = EmbeddingDiskStore(str(tmp_path), max_bytes=10 * ROW_BYTES)
+    first.put("first", "model", _vector(100))  # `first` now holds the generation-0 file open
+    for i in range(10):
+        second.put(f"k{i}", "model", _vector(i))  # ...which `second` compacts away
+
+    first.put("after", "model", _vector(200))
+
+    assert second.compactions == 1
+    assert not (tmp_path / "model.4.f32").exists()
+    assert second.get("after")[0] == 200
+    assert first.get("k9")[0] == 9
+    first.close()
+    second.close()
+
+
+def test_store_works_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "fcntl", None)
+    store = EmbeddingDiskStore(str(tmp_path), max_bytes=4 * ROW_BYTES)
+    for i in range(6):
+        store.put(f"k{i}", "model", _vector(i))
+
+    assert store.get("k5")[0] == 5
+    assert store.compactions == 1
+    store.close()
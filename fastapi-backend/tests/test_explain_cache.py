@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from chatbot.utils.performance_optimizations import ResponseCache
+
+PROMPT = main.BOT_KEYWORDS["@explain"]["system_prompt"]
+
+
+class _Completions:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs["messages"])
+        message = SimpleNamespace(content=f" explanation {len(self.calls)} ")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    completions = _Completions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    async def get_openai_client():
+        return client
+
+    monkeypatch.setattr(main, "get_openai_client", get_openai_client)
+    monkeypatch.setattr(main.settings, "enable_caching", True)
+    monkeypatch.setattr(main.app.state, "response_cache", ResponseCache(max_size=100, ttl=60))
+    return completions
+
+
+def _ask(query, context=None, cache_control=None):
+    return asyncio.run(main.get_openai_response(query, PROMPT, context, cache_control))
+
+
+def test_repeated_question_is_served_from_cache(completions):
+    assert _ask("what is recursion") == "explanation 1"
+    assert _ask("what is recursion") == "explanation 1"
+    assert len(completions.calls) == 1
+
+
+def test_context_window_is_part_of_the_key(completions):
+    _ask("explain it", [{"user_id": "u", "message": "we talked about graphs"}])
+    _ask("explain it", [{"user_id": "u", "message": "we talked about sorting"}])
+
+    assert len(completions.calls) == 2
+
+
+def test_cache_control_bypasses_the_cache(completions):
+    _ask("what is recursion")
+    assert _ask("what is recursion", cache_control=main.NO_CACHE) == "explanation 2"  # read skipped, stored
+    assert _ask("what is recursion") == "explanation 2"
+    assert _ask("what is a heap", cache_control=main.NO_STORE) == "explanation 3"
+    assert _ask("what is a heap") == "explanation 4"
+
+
+def test_context_is_trimmed_to_the_token_budget(monkeypatch):
+    monkeypatch.setattr(main.settings, "explain_context_max_tokens", 30)
+    context = [{"user_id": "u", "message": f"message {i} " + "word " * 8} for i in range(10)]
+
+    messages = main._build_explain_messages("q", PROMPT, context)
+
+    window = messages[1]["content"]
+    assert "message 9" in window and "message 0" not in window
+    assert messages[-1] == {"role": "user", "content": "q"}
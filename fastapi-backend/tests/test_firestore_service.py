@@ -0,0 +1,86 @@
+import asyncio
+
+from chatbot.services import firestore_service
+from chatbot.services.firestore_service import FIRESTORE_BATCH_LIMIT, FirestoreService
+
+
+class _Ref:
+    def __init__(self, path):
+        self.path = path
+
+    def collection(self, name):
+        return _Ref(f"{self.path}/{name}")
+
+    def document(self, doc_id=None):
+        return _Ref(f"{self.path}/{doc_id or 'auto'}")
+
+
+class _Batch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref.path, data, merge))
+
+    async def commit(self):
+        self.db.commits.append(self.writes)
+
+
+class _FakeDb:
+    def __init__(self):
+        self.commits = []
+
+    def collection(self, name):
+        return _Ref(name)
+
+    def batch(self):
+        return _Batch(self)
+
+
+def _service() -> FirestoreService:
+    service = FirestoreService()
+    service.db = _FakeDb()
+    return service
+
+
+def test_message_batches_respect_the_write_limit():
+    service = _service()
+    messages = [(f"g{i % 3}", {"text": str(i)}) for i in range(FIRESTORE_BATCH_LIMIT + 20)]
+
+    asyncio.run(service.batch_add_group_messages(messages))
+
+    assert [len(writes) for writes in service.db.commits] == [FIRESTORE_BATCH_LIMIT, 20]
+    path, data, merge = service.db.commits[1][-1]
+    assert path.startswith(f"groups/{messages[-1][0]}/messages/")
+    assert data == messages[-1][1] and merge is False
+
+
+def test_group_updates_are_merged():
+    service = _service()
+
+    asyncio.run(service.batch_merge_groups({"a": {"x": 1}, "b": {"y": 2}}))
+
+    assert service.db.commits == [[("groups/a", {"x": 1}, True), ("groups/b", {"y": 2}, True)]]
+
+
+def test_missing_credentials_are_checked_once(monkeypatch):
+    attempts = []
+
+    def client():
+        attempts.append(1)
+        raise ValueError("no credentials")
+
+    monkeypatch.setattr(firestore_service.firebase_admin, "_apps", {"[DEFAULT]": object()})
+    monkeypatch.setattr(firestore_service.firestore_async, "client", client)
+
+    async def scenario():
+        service = FirestoreService()
+        await asyncio.gather(*(service.initialize() for _ in range(5)))
+        await service.initialize()
+        return service
+
+    service = asyncio.run(scenario())
+
+    assert service.available is False
+    assert len(attempts) == 1
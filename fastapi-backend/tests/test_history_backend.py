@@ -0,0 +1,107 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from chatbot.core.config import settings
+from chatbot.services.history_backend import InMemoryHistoryBackend, SQLiteHistoryBackend
+from chatbot.services.session_store import AI, HUMAN
+
+KEY = ("g", "u", "s")
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "history_max_messages", 6)
+    monkeypatch.setattr(settings, "history_flush_interval", 0.01)
+    return str(tmp_path / "history.db")
+
+
+def _turns(count, start=0):
+    return [record for i in range(start, start + count) for record in ((HUMAN, f"q{i}"), (AI, f"a{i}"))]
+
+
+def test_appends_are_visible_before_and_after_the_write(db_path):
+    async def scenario():
+        writer = SQLiteHistoryBackend(db_path)
+        await writer.append(KEY, _turns(2))
+        unflushed = await writer.load(KEY)
+        await writer.close()
+        reader = SQLiteHistoryBackend(db_path)
+        persisted = await reader.load(KEY)
+        await reader.close()
+        return unflushed, persisted
+
+    unflushed, persisted = asyncio.run(scenario())
+
+    assert unflushed.records == _turns(2)
+    assert persisted.records == _turns(2)
+
+
+def test_concurrent_loads_share_one_query(db_path):
+    keys = [("g", "u", f"s{i}") for i in range(5)]
+
+    async def scenario():
+        backend = SQLiteHistoryBackend(db_path)
+        for i, key in enumerate(keys):
+            await backend.append(key, _turns(1, start=i))
+        await backend.flush()
+        histories = await asyncio.gather(*(backend.load(key) for key in keys))
+        stats = backend.get_stats()
+        await backend.close()
+        return histories, stats
+
+    histories, stats = asyncio.run(scenario())
+
+    assert [history.records for history in histories] == [_turns(1, start=i) for i in range(5)]
+    assert stats["reads"] == 5 and stats["read_batches"] == 1
+
+
+def test_flush_prunes_sessions_to_max_messages(db_path):
+    other = ("g", "u", "other")
+
+    async def scenario():
+        backend = SQLiteHistoryBackend(db_path)
+        await backend.append(other, _turns(1))
+        for turn in range(5):
+            await backend.append(KEY, _turns(1, start=turn))
+            await backend.flush()
+        history = await backend.load(KEY)
+        pruned = backend.stats["pruned"]
+        await backend.close()
+        return history, pruned
+
+    history, pruned = asyncio.run(scenario())
+
+    with sqlite3.connect(db_path) as conn:
+        counts = dict(conn.execute("SELECT session_id, COUNT(*) FROM chat_messages GROUP BY session_id"))
+    assert history.records == _turns(3, start=2)
+    assert counts == {"s": 6, "other": 2}
+    assert pruned == 4
+
+
+def test_clear_drops_written_and_pending_records(db_path):
+    async def scenario():
+        backend = SQLiteHistoryBackend(db_path)
+        await backend.append(KEY, _turns(1))
+        await backend.flush()
+        await backend.append(KEY, _turns(1, start=1))
+        await backend.clear(KEY)
+        await backend.close()
+        reader = SQLiteHistoryBackend(db_path)
+        history = await reader.load(KEY)
+        await reader.close()
+        return history
+
+    assert asyncio.run(scenario()).records == []
+
+
+def test_in_memory_load_returns_a_copy():
+    async def scenario():
+        backend = InMemoryHistoryBackend()
+        await backend.append(KEY, _turns(1))
+        loaded = await backend.load(KEY)
+        loaded.add_user_message("not appended")
+        return await backend.load(KEY)
+
+    assert asyncio.run(scenario()).records == _turns(1)
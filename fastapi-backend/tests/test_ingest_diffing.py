@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from chatbot.models.api_models import FileType
+from chatbot.services import vector_service
+from chatbot.services.vector_backends import LocalVectorBackend
+from chatbot.services.vector_service import VectorStoreService, chunk_id, chunk_id_prefix
+from chatbot.utils.shared_cache import SQLiteKVStore
+
+
+class _ResponseCache:
+    def __init__(self):
+        self.bumps = 0
+
+    async def bump_kb_version(self, group_id):
+        self.bumps += 1
+        return self.bumps
+
+
+@pytest.fixture
+def service(tmp_path, embeddings, monkeypatch):
+    response_cache = _ResponseCache()
+    monkeypatch.setattr(vector_service, "get_shared_response_cache", lambda: response_cache)
+    service = VectorStoreService()
+    service.manifest = SQLiteKVStore(str(tmp_path / "manifest.db"))
+    service.embeddings = embeddings
+    service.backend = LocalVectorBackend(embeddings, str(tmp_path / "vectors"), ann_min_vectors=1000, ann_nprobe=4)
+    service.response_cache = response_cache
+    return service
+
+
+def _paragraphs(count, tag="para"):
+    return [f"{tag} {i}: " + " ".join(f"{tag}{i}-word{j}" for j in range(60)) for i in range(count)]
+
+
+def _ingest(service, path, text):
+    path.write_text(text, encoding="utf-8")
+    return asyncio.run(service.add_document(str(path), "notes.txt", FileType.TXT, "g"))
+
+
+def test_chunk_ids_depend_on_content_and_predecessor():
+    assert chunk_id("g", "a.txt", "text") == chunk_id("g", "a.txt", "text")
+    assert chunk_id("g", "a.txt", "text").startswith(chunk_id_prefix("g", "a.txt"))
+    assert chunk_id("g", "a.txt", "text", "before") != chunk_id("g", "a.txt", "text", "other")
+    assert chunk_id("g", "a.txt", "text") != chunk_id("g", "b.txt", "text")
+
+
+def test_reingest_only_embeds_changed_chunks(service, tmp_path):
+    path = tmp_path / "notes.txt"
+    paragraphs = _paragraphs(8)
+    first = _ingest(service, path, "\n\n".join(paragraphs))
+
+    unchanged = _ingest(service, path, "\n\n".join(paragraphs))
+
+    edited = paragraphs[:4] + ["inserted: " + " ".join(f"new-word{j}" for j in range(60))] + paragraphs[4:]
+    second = _ingest(service, path, "\n\n".join(edited))
+    stored = asyncio.run(service.backend.list_ids("g", chunk_id_prefix("g", "notes.txt")))
+
+    assert first["status"] == "success" and first["chunks_added"] == first["chunk_count"]
+    assert unchanged["status"] == "unchanged"
+    assert 0 < second["chunks_added"] < second["chunk_count"]
+    assert second["chunks_removed"] >= 1
+    assert len(stored) == second["chunk_count"]
+    assert service.response_cache.bumps == 2
+
+
+def test_first_content_id_ingest_removes_legacy_vectors(service, tmp_path):
+    asyncio.run(service.backend.add_texts("g", ["legacy chunk"], [{"source_file": "notes.txt"}], ids=["random-id"]))
+
+    result = _ingest(service, tmp_path / "notes.txt", "\n\n".join(_paragraphs(3)))
+    ids = asyncio.run(service.backend.list_ids("g", ""))
+
+    assert "random-id" not in ids
+    assert len(ids) == result["chunk_count"]
+    assert result["warnings"] == []
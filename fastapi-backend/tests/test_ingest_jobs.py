@@ -0,0 +1,169 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from chatbot.models.api_models import FileType
+from chatbot.services import ingest_jobs
+from chatbot.services.ingest_jobs import CANCELLED, QUEUED, RUNNING, SUCCEEDED, IngestJobQueue, IngestQueueFull
+
+
+class _SlowVectorService:
+    def __init__(self, steps=20, delay=0.02):
+        self.steps = steps
+        self.delay = delay
+        self.ingested = []
+
+    async def add_document(self, file_path, filename, file_type, group_id, file_digest=None, progress=None):
+        self.ingested.append(filename)
+        for _ in range(self.steps):
+            progress["vectors_upserted"] += 1
+            await asyncio.sleep(self.delay)
+        return {"filename": filename, "group_id": group_id, "chunk_count": self.steps, "status": "success"}
+
+
+@pytest.fixture
+def vector_service(monkeypatch):
+    service = _SlowVectorService()
+
+    async def get_vector_service():
+        return service
+
+    monkeypatch.setattr(ingest_jobs, "get_vector_service", get_vector_service)
+    return service
+
+
+def _queue(tmp_path, **kwargs) -> IngestJobQueue:
+    options = dict(db_path=str(tmp_path / "jobs.db"), upload_dir=str(tmp_path), workers=1, max_pending=10,
+                   job_ttl=3600, heartbeat_interval=0.05, owner_timeout=0.5, poll_interval=0.05)
+    options.update(kwargs)
+    return IngestJobQueue(**options)
+
+
+async def _submit(queue, name="notes.txt"):
+    path = queue.new_upload_path(".txt")
+    with open(path, "w") as f:
+        f.write("content")
+    return await queue.submit("g", name, FileType.TXT, path)
+
+
+async def _wait_for(queue, job_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = await queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job {job_id} never reached {statuses}")
+
+
+def _rows(tmp_path):
+    with sqlite3.connect(str(tmp_path / "jobs.db")) as conn:
+        return conn.execute("SELECT filename, status, owner FROM jobs ORDER BY created_at").fetchall()
+
+
+def test_job_runs_to_completion(tmp_path, vector_service):
+    async def scenario():
+        queue = _queue(tmp_path)
+        await queue.start()
+        job = await _submit(queue)
+        done = await _wait_for(queue, job["job_id"], (SUCCEEDED,))
+        await queue.stop()
+        return job, done
+
+    job, done = asyncio.run(scenario())
+
+    assert job["status"] == QUEUED
+    assert done["vectors_upserted"] == vector_service.steps
+    assert done["result"]["chunk_count"] == vector_service.steps
+    assert list(tmp_path.glob("*.txt")) == []  # the spooled upload is removed
+
+
+def test_each_job_is_claimed_by_one_worker(tmp_path, vector_service):
+    async def scenario():
+        first, second = _queue(tmp_path), _queue(tmp_path)
+        jobs = [await _submit(first, f"file{i}.txt") for i in range(4)]
+        await first.start()
+        await second.start()
+        for job in jobs:
+            await _wait_for(first, job["job_id"], (SUCCEEDED,))
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(scenario())
+
+    assert sorted(vector_service.ingested) == [f"file{i}.txt" for i in range(4)]
+
+
+def test_cancel_reaches_a_job_running_in_another_worker(tmp_path, vector_service):
+    vector_service.steps = 200
+
+    async def scenario():
+        runner, api = _queue(tmp_path), _queue(tmp_path)
+        await runner.start()
+        job = await _submit(api)
+        await _wait_for(api, job["job_id"], (RUNNING,))
+        requested = await api.cancel(job["job_id"])
+        cancelled = await _wait_for(api, job["job_id"], (CANCELLED,))
+        await runner.stop()
+        return requested, cancelled
+
+    requested, cancelled = asyncio.run(scenario())
+
+    assert requested["cancel_requested"] is True
+    assert cancelled["vectors_upserted"] < vector_service.steps
+
+
+def test_cancel_of_a_queued_job_is_immediate(tmp_path, vector_service):
+    async def scenario():
+        queue = _queue(tmp_path)
+        job = await _submit(queue)
+        cancelled = await queue.cancel(job["job_id"])
+        await queue.stop()
+        return cancelled
+
+    assert asyncio.run(scenario())["status"] == CANCELLED
+    assert vector_service.ingested == []
+
+
+def test_only_jobs_of_silent_workers_are_recovered(tmp_path, vector_service):
+    vector_service.steps = 60
+
+    async def scenario():
+        live, crashed, rescuer = _queue(tmp_path), _queue(tmp_path), _queue(tmp_path)
+        await live.start()
+        await crashed.start()
+        await _submit(live, "a.txt")
+        await _submit(live, "b.txt")
+        await asyncio.sleep(0.2)
+        # `crashed` stops heartbeating without releasing its job
+        for task in crashed._workers + [crashed._heartbeat]:
+            task.cancel()
+        await rescuer.start()
+        await asyncio.sleep(0.2)
+        before_timeout = _rows(tmp_path)
+        await asyncio.sleep(2.0)
+        after_timeout = _rows(tmp_path)
+        await live.stop()
+        await rescuer.stop()
+        return live.owner, crashed.owner, before_timeout, after_timeout
+
+    live_owner, crashed_owner, before_timeout, after_timeout = asyncio.run(scenario())
+
+    assert {owner for _, status, owner in before_timeout if status == RUNNING} == {live_owner, crashed_owner}
+    assert [status for _, status, _ in after_timeout] == [SUCCEEDED, SUCCEEDED]
+    assert crashed_owner not in {owner for _, _, owner in after_timeout}
+
+
+def test_submit_is_refused_when_too_many_jobs_wait(tmp_path, vector_service):
+    async def scenario():
+        queue = _queue(tmp_path, max_pending=2)
+        await _submit(queue)
+        await _submit(queue)
+        with pytest.raises(IngestQueueFull):
+            await _submit(queue)
+        await queue.stop()
+        return queue.stats["rejected"]
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from chatbot.core.config import settings
+from chatbot.services.llm_service import LLMService
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+    monkeypatch.setattr(settings, "max_workers", 3)  # one key -> two pool slots
+    service = LLMService()
+    yield service
+    asyncio.run(service.cleanup())
+
+
+def test_chains_are_compiled_once_per_pool_slot(service):
+    async def scenario():
+        return [await service.create_rag_chain(f"retriever {i}") for i in range(6)]
+
+    chains = asyncio.run(scenario())
+
+    stats = service.get_chain_stats()
+    assert (stats["builds"], stats["hits"], stats["cached"]) == (2, 4, 2)
+    assert sorted(key[1] for key in service._rag_chains) == [0, 1]
+    # The retriever is bound per call, not baked into the cached chain
+    assert [chain.config["configurable"]["retriever"] for chain in chains] == [f"retriever {i}" for i in range(6)]
+    assert chains[0].bound is chains[2].bound
+
+
+def test_chain_cache_is_bounded(service, monkeypatch):
+    monkeypatch.setattr(settings, "rag_chain_cache_size", 1)
+
+    async def scenario():
+        for i in range(4):
+            await service.create_rag_chain("retriever")
+
+    asyncio.run(scenario())
+
+    stats = service.get_chain_stats()
+    assert (stats["builds"], stats["evictions"], stats["cached"]) == (4, 3, 1)
+
+
+def test_missing_retriever_is_rejected(service):
+    with pytest.raises(ValueError, match="upload documents"):
+        asyncio.run(service.create_rag_chain(None))
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from chatbot.services.vector_backends import LocalVectorBackend, _IVFIndex, _LocalGroup
+
+
+def _unit_rows(count, dim, seed=0):
+    matrix = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def test_ivf_candidates_contain_the_nearest_row():
+    matrix = _unit_rows(400, 16)
+    index = _IVFIndex(matrix)
+
+    assert index.rows == 400
+    assert sorted(np.concatenate(index.lists).tolist()) == list(range(400))
+    for row in (0, 123, 399):
+        assert row in index.candidates(matrix[row], nprobe=2)
+
+
+def test_group_upsert_overwrites_and_remove_compacts():
+    group = _LocalGroup()
+    rows = _unit_rows(3, 8)
+    for i, doc_id in enumerate("abc"):
+        group.upsert(doc_id, rows[i], f"text {doc_id}", {"i": i})
+    group.upsert("b", rows[0], "new b", {"i": 9})
+
+    group.remove(["a"])
+
+    assert group.count == 2
+    assert group.ids == ["b", "c"]
+    position = group.positions["b"]
+    assert group.texts[position] == "new b"
+    np.testing.assert_array_equal(group.vectors[position], rows[0])
+
+
+def test_group_rejects_a_new_dimension():
+    group = _LocalGroup()
+    group.upsert("a", np.ones(8, dtype=np.float32), "a", {})
+
+    with pytest.raises(ValueError, match="8-dimensional"):
+        group.upsert("b", np.ones(4, dtype=np.float32), "b", {})
+    assert group.count == 1
+
+    group.remove(["a"])
+    group.upsert("b", np.ones(4, dtype=np.float32), "b", {})
+    assert group.matrix.shape[1] == 4
+
+
+def test_search_returns_the_closest_text(tmp_path, embeddings):
+    async def scenario():
+        backend = LocalVectorBackend(embeddings, str(tmp_path), ann_min_vectors=1000, ann_nprobe=4)
+        await backend.add_texts("g", ["graphs", "sorting", "recursion"], [{"n": 1}, {"n": 2}, {"n": 3}])
+        return await backend.search("g", "sorting", k=2)
+
+    results = asyncio.run(scenario())
+
+    assert results[0][0].page_content == "sorting"
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert len(results) == 2
+
+
+def test_workers_sharing_a_directory_see_each_others_writes(tmp_path, embeddings):
+    async def scenario():
+        first = LocalVectorBackend(embeddings, str(tmp_path), ann_min_vectors=1000, ann_nprobe=4)
+        second = LocalVectorBackend(embeddings, str(tmp_path), ann_min_vectors=1000, ann_nprobe=4)
+        await first.add_texts("g", ["a", "b"], [{}, {}], ids=["1", "2"])
+        assert await second.count("g") == 2
+        await second.add_texts("g", ["c"], [{}], ids=["3"])
+        # `first` must not overwrite the row `second` just added
+        await first.add_texts("g", ["d"], [{}], ids=["4"])
+        ids = sorted(await second.list_ids("g", ""))
+        await first.clear("g")
+        return ids, await second.count("g")
+
+    ids, count_after_clear = asyncio.run(scenario())
+
+    assert ids == ["1", "2", "3", "4"]
+    assert count_after_clear is None
+
+
+def test_ivf_search_handles_empty_candidates_and_non_positive_k(tmp_path, embeddings):
+    async def scenario():
+        backend = LocalVectorBackend(embeddings, str(tmp_path), ann_min_vectors=1000, ann_nprobe=0)
+        await backend.add_texts("g", ["graphs", "sorting"], [{}, {}])
+        group = backend._groups["g"]
+        group.ivf = _IVFIndex(group.vectors.copy())
+        query = await embeddings.aembed_query("graphs")
+        return (
+            backend.search_vector("g", query, k=2),
+            backend.search_vector("g", query, k=0),
+            await backend.search("g", "graphs", k=-1),
+        )
+
+    assert asyncio.run(scenario()) == ([], [], [])
+
+
+def test_reads_load_groups_off_the_event_loop(tmp_path, embeddings, monkeypatch):
+    async def scenario():
+        writer = LocalVectorBackend(embeddings, str(tmp_path), ann_min_vectors=1000, ann_nprobe=4)
+        await writer.add_texts("g", ["graphs"], [{}], ids=["1"])
+        reader = LocalVectorBackend(embeddings, str(tmp_path), ann_min_vectors=1000, ann_nprobe=4)
+        loop_thread = threading.get_ident()
+        load_threads = []
+        load = reader._load
+
+        def recording_load(*args, **kwargs):
+            load_threads.append(threading.get_ident())
+            return load(*args, **kwargs)
+
+        monkeypatch.setattr(reader, "_load", recording_load)
+        await reader.count("g")
+        await reader.list_ids("g", "")
+        await reader.search("g", "graphs", k=1)
+        return loop_thread, load_threads
+
+    loop_thread, load_threads = asyncio.run(scenario())
+
+    assert load_threads and loop_thread not in load_threads
@@ -0,0 +1,108 @@
+import asyncio
+
+from firebase_admin import firestore as fa_firestore
+
+from chatbot.core.config import settings
+from chatbot.services.message_outbox import BotMessageOutbox
+
+
+class _FakeFirestore:
+    available = True
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.commits = []
+
+    async def batch_add_group_messages(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("unavailable")
+        self.commits.append(messages)
+
+
+def _outbox(db, monkeypatch, **overrides) -> BotMessageOutbox:
+    options = {"outbox_batch_size": 50, "outbox_max_wait": 0.05, "outbox_max_retries": 1, "outbox_max_queue": 1000}
+    options.update(overrides)
+    for name, value in options.items():
+        monkeypatch.setattr(settings, name, value)
+    return BotMessageOutbox(db)
+
+
+def test_concurrent_replies_share_one_commit(monkeypatch):
+    db = _FakeFirestore()
+    outbox = _outbox(db, monkeypatch)
+
+    async def scenario():
+        outbox.start()
+        for i in range(5):
+            await outbox.enqueue(f"g{i}", {"text": str(i)})
+        await outbox.stop()
+
+    asyncio.run(scenario())
+
+    assert len(db.commits) == 1
+    assert [group_id for group_id, _ in db.commits[0]] == ["g0", "g1", "g2", "g3", "g4"]
+    assert all(data["createAt"] is fa_firestore.SERVER_TIMESTAMP for _, data in db.commits[0])
+    assert outbox.get_stats()["persisted"] == 5
+
+
+def test_replies_for_one_group_get_separate_commits(monkeypatch):
+    db = _FakeFirestore()
+    outbox = _outbox(db, monkeypatch)
+
+    async def scenario():
+        outbox.start()
+        for group_id, text in (("a", "a1"), ("b", "b1"), ("a", "a2"), ("a", "a3"), ("b", "b2")):
+            await outbox.enqueue(group_id, {"text": text})
+        await outbox.stop()
+
+    asyncio.run(scenario())
+
+    assert [[data["text"] for _, data in messages] for messages in db.commits] == [["a1", "b1"], ["a2", "b2"], ["a3"]]
+
+
+def test_failed_commit_is_retried(monkeypatch):
+    db = _FakeFirestore(failures=1)
+    outbox = _outbox(db, monkeypatch)
+
+    async def scenario():
+        outbox.start()
+        await outbox.enqueue("g", {"text": "hi"})
+        await outbox.stop()
+
+    asyncio.run(scenario())
+
+    assert len(db.commits) == 1
+    assert outbox.stats["retries"] == 1 and outbox.stats["dropped"] == 0
+
+
+def test_batch_is_dropped_after_max_retries(monkeypatch):
+    db = _FakeFirestore(failures=10)
+    outbox = _outbox(db, monkeypatch)
+
+    async def scenario():
+        outbox.start()
+        await outbox.enqueue("g", {"text": "hi"})
+        await outbox.stop()
+
+    asyncio.run(scenario())
+
+    assert db.commits == []
+    assert outbox.stats["dropped"] == 1 and outbox.stats["persisted"] == 0
+
+
+def test_full_queue_writes_inline(monkeypatch):
+    db = _FakeFirestore()
+    outbox = _outbox(db, monkeypatch, outbox_max_queue=1)
+
+    async def scenario():
+        # No worker: the second reply finds the queue full
+        await outbox.enqueue("g", {"text": "queued"})
+        await outbox.enqueue("g", {"text": "inline"})
+        inline = [data["text"] for messages in db.commits for _, data in messages]
+        await outbox.stop()
+        return inline
+
+    assert asyncio.run(scenario()) == ["inline"]
+    assert outbox.stats["overflow_direct_writes"] == 1
+    assert [data["text"] for _, data in db.commits[-1]] == ["queued"]
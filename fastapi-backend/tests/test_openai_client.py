@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from chatbot.core.config import settings
+from chatbot.services import openai_client
+from chatbot.services.openai_client import AsyncOpenAIClientPool
+
+
+def test_clients_share_one_connection_pool(monkeypatch):
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+
+    async def scenario():
+        pool = AsyncOpenAIClientPool()
+        first = await pool.get_client()
+        second = await pool.get_client()
+        http_client = pool._http_client
+        await pool.close()
+        return first, second, http_client, pool
+
+    first, second, http_client, pool = asyncio.run(scenario())
+
+    assert first is second
+    assert first._client is http_client
+    assert http_client.is_closed
+    assert pool._clients == [] and pool._http_client is None
+
+
+def test_concurrent_first_calls_initialize_once(monkeypatch):
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+
+    async def scenario():
+        pool = AsyncOpenAIClientPool()
+        clients = await asyncio.gather(*(pool.get_client() for _ in range(10)))
+        await pool.close()
+        return clients
+
+    clients = asyncio.run(scenario())
+
+    assert len({id(client) for client in clients}) == 1
+
+
+def test_missing_key_is_reported(monkeypatch):
+    monkeypatch.setattr(settings, "openai_api_key", None)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+    with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+        asyncio.run(AsyncOpenAIClientPool().get_client())
+
+
+def test_global_pool_is_recreated_after_close():
+    async def scenario():
+        first = await openai_client.get_openai_client_pool()
+        await openai_client.close_openai_client_pool()
+        second = await openai_client.get_openai_client_pool()
+        await openai_client.close_openai_client_pool()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first is not second
@@ -0,0 +1,171 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from chatbot.services import vector_backends
+from chatbot.services.vector_backends import PineconeBackend
+
+
+class _Index:
+    def __init__(self, name):
+        self.name = name
+        self.namespaces = {}
+
+    def describe_index_stats(self):
+        return SimpleNamespace(namespaces={
+            namespace: SimpleNamespace(vector_count=len(vectors)) for namespace, vectors in self.namespaces.items()
+        })
+
+    def upsert(self, vectors, namespace):
+        self.namespaces.setdefault(namespace, {}).update({vector["id"]: vector for vector in vectors})
+
+    def list(self, namespace, prefix="", limit=100):
+        ids = [vector_id for vector_id in self.namespaces.get(namespace, {}) if vector_id.startswith(prefix)]
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def fetch(self, ids, namespace):
+        vectors = self.namespaces[namespace]
+        return SimpleNamespace(vectors={
+            vector_id: SimpleNamespace(values=vectors[vector_id]["values"], metadata=vectors[vector_id]["metadata"])
+            for vector_id in ids
+        })
+
+
+class _Pinecone:
+    def __init__(self, api_key):
+        self.indexes = {}
+        self.calls = []
+
+    def list_indexes(self):
+        self.calls.append("list_indexes")
+        return [{"name": name} for name in self.indexes]
+
+    def create_index(self, name, **kwargs):
+        self.calls.append(f"create_index {name}")
+        self.indexes[name] = _Index(name)
+
+    def describe_index(self, name):
+        return SimpleNamespace(status=SimpleNamespace(ready=True))
+
+    def Index(self, name):
+        self.calls.append(f"Index {name}")
+        return self.indexes[name]
+
+
+class _VectorStore:
+    def __init__(self, index, embedding, text_key, namespace):
+        self.index = index
+        self.namespace = namespace
+
+    def add_texts(self, texts, metadatas, ids, namespace):
+        self.index.upsert([{"id": i, "values": [0.0], "metadata": m} for i, m in zip(ids, metadatas)], namespace)
+
+
+@pytest.fixture
+def fake_pinecone(monkeypatch):
+    monkeypatch.setattr(vector_backends, "Pinecone", _Pinecone)
+    monkeypatch.setattr(vector_backends, "PineconeVectorStore", _VectorStore)
+    monkeypatch.setenv("PINECONE_INDEX_NAME", "kb")
+
+
+def _add(backend, group_id, doc_id):
+    return backend.add_texts(group_id, ["text"], [{"group": group_id}], ids=[doc_id])
+
+
+def test_shared_mode_needs_no_index_per_group(fake_pinecone):
+    async def scenario():
+        backend = PineconeBackend(embeddings=None, api_key="key", index_mode="shared")
+        await backend.initialize()
+        for group_id in ("cs101", "cs102", "Math 201"):
+            await _add(backend, group_id, f"{group_id}-1")
+        return backend, await backend.count("cs102"), await backend.count("unknown")
+
+    backend, count, unknown = asyncio.run(scenario())
+
+    assert list(backend.pc.indexes) == ["kb"]
+    assert [call for call in backend.pc.calls if call.startswith("create_index")] == ["create_index kb"]
+    assert sorted(backend.pc.indexes["kb"].namespaces) == ["Math 201", "cs101", "cs102"]
+    assert (count, unknown) == (1, 0)
+
+
+def test_per_group_mode_creates_an_index_per_group(fake_pinecone):
+    async def scenario():
+        backend = PineconeBackend(embeddings=None, api_key="key")
+        await _add(backend, "CS_101", "a")
+        await _add(backend, "cs102", "b")
+        return backend
+
+    backend = asyncio.run(scenario())
+
+    assert sorted(backend.pc.indexes) == ["kb-cs-101", "kb-cs102"]
+
+
+def test_unknown_index_mode_is_rejected(fake_pinecone):
+    with pytest.raises(ValueError, match="index mode"):
+        PineconeBackend(embeddings=None, api_key="key", index_mode="sharded")
+
+
+def test_migration_copies_every_namespace_into_the_shared_index():
+    path = Path(__file__).resolve().parent.parent / "scripts" / "migrate_pinecone_to_shared_index.py"
+    spec = importlib.util.spec_from_file_location("migrate_pinecone_to_shared_index", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    pc = _Pinecone(api_key="key")
+    pc.create_index("kb-cs101")
+    pc.indexes["kb-cs101"].upsert(
+        [{"id": f"v{i}", "values": [float(i)], "metadata": {"i": i}} for i in range(250)], "cs101"
+    )
+    pc.create_index("kb")
+    target = pc.indexes["kb"]
+
+    assert migration.migrate_index(pc, "kb-cs101", target, dry_run=True) == 250
+    assert not target.namespaces
+    assert migration.migrate_index(pc, "kb-cs101", target, dry_run=False) == 250
+    assert target.namespaces["cs101"]["v249"] == {"id": "v249", "values": [249.0], "metadata": {"i": 249}}
+
+
+def test_handles_and_the_index_list_are_reused(fake_pinecone):
+    async def scenario():
+        backend = PineconeBackend(embeddings=None, api_key="key")
+        await _add(backend, "cs101", "a")
+        backend.pc.calls.clear()
+        for _ in range(3):
+            await backend.count("cs101")
+            await backend.list_ids("cs101", "")
+        return backend
+
+    backend = asyncio.run(scenario())
+
+    # One refresh of the list invalidated by create_index, then everything is cached
+    assert backend.pc.calls == ["list_indexes"]
+    assert backend.get_stats()["handle_misses"] == 1
+
+
+def test_index_list_is_refreshed_after_creating_an_index(fake_pinecone, monkeypatch):
+    monkeypatch.setattr(vector_backends.settings, "pinecone_index_list_ttl", 3600)
+
+    async def scenario():
+        backend = PineconeBackend(embeddings=None, api_key="key")
+        before = await backend.count("cs101")
+        await _add(backend, "cs101", "a")
+        return before, await backend.count("cs101")
+
+    assert asyncio.run(scenario()) == (None, 1)
+
+
+def test_handle_cache_is_bounded(fake_pinecone, monkeypatch):
+    monkeypatch.setattr(vector_backends.settings, "pinecone_handle_cache_size", 2)
+
+    async def scenario():
+        backend = PineconeBackend(embeddings=None, api_key="key")
+        for group_id in ("a", "b", "c"):
+            await _add(backend, group_id, "1")
+        return backend.get_stats()
+
+    stats = asyncio.run(scenario())
+
+    assert (stats["cached_handles"], stats["cached_vector_stores"]) == (2, 2)
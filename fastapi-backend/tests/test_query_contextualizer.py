@@ -0,0 +1,95 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chatbot.services.query_contextualizer import (
+    CACHED, FAILED, NO_HISTORY, REWRITTEN, STANDALONE, QueryContextualizer,
+)
+
+HISTORY = [HumanMessage(content="What topics does the midterm cover?"),
+           AIMessage(content="Recursion, sorting and graphs.")]
+
+
+def _contextualizer(**kwargs) -> QueryContextualizer:
+    return QueryContextualizer(cache_size=16, cache_ttl=60, history_messages=4, **kwargs)
+
+
+def _rewrite(result="When is the graphs lecture?"):
+    calls = []
+
+    async def rewrite():
+        calls.append(1)
+        return result
+
+    return rewrite, calls
+
+
+def test_is_standalone():
+    assert QueryContextualizer.is_standalone("When is the final exam for algorithms?")
+    assert not QueryContextualizer.is_standalone("and the second one?")
+    assert not QueryContextualizer.is_standalone("why?")
+    assert not QueryContextualizer.is_standalone("Can you explain that proof again please?")
+
+
+def test_classify_skips_the_llm_when_it_can():
+    contextualizer = _contextualizer()
+    assert contextualizer.classify("what about graphs?", []) == (NO_HISTORY, "what about graphs?")
+    assert contextualizer.classify("When is the final exam for algorithms?", HISTORY)[0] == STANDALONE
+    assert contextualizer.classify("what about graphs?", HISTORY)[0] == REWRITTEN
+    assert _contextualizer(skip_standalone=False).classify(
+        "When is the final exam for algorithms?", HISTORY)[0] == REWRITTEN
+
+
+def test_rewrites_are_cached_by_history_and_query():
+    contextualizer = _contextualizer()
+    rewrite, calls = _rewrite()
+
+    first = asyncio.run(contextualizer.contextualize("and the lecture on it?", HISTORY, rewrite))
+    second = asyncio.run(contextualizer.contextualize("and the lecture on it?", HISTORY, rewrite))
+    other_history = asyncio.run(contextualizer.contextualize("and the lecture on it?", HISTORY[:1], rewrite))
+
+    assert first == ("When is the graphs lecture?", REWRITTEN)
+    assert second == ("When is the graphs lecture?", CACHED)
+    assert other_history[1] == REWRITTEN
+    assert len(calls) == 2
+
+
+def test_failed_rewrite_falls_back_to_the_raw_query():
+    contextualizer = _contextualizer()
+
+    async def rewrite():
+        raise RuntimeError("upstream timeout")
+
+    assert asyncio.run(contextualizer.contextualize("and that one?", HISTORY, rewrite)) == ("and that one?", FAILED)
+
+
+def test_speculative_retrieval_uses_the_guess_when_the_rewrite_matches():
+    contextualizer = _contextualizer()
+    retrieved = []
+
+    async def retrieve(query):
+        retrieved.append(query)
+        return [query]
+
+    rewrite, _ = _rewrite("more about the graphs lecture")
+    documents = asyncio.run(contextualizer.retrieve("more about the graphs lecture?", HISTORY, rewrite,
+                                                    retrieve, speculative=True))
+
+    assert documents == ["more about the graphs lecture?"]
+    assert retrieved == ["more about the graphs lecture?"]
+    assert contextualizer.speculation["hits"] == 1
+
+
+def test_speculative_retrieval_retries_when_the_rewrite_differs():
+    contextualizer = _contextualizer()
+    retrieved = []
+
+    async def retrieve(query):
+        retrieved.append(query)
+        return [query]
+
+    rewrite, _ = _rewrite("When is the graphs lecture?")
+    documents = asyncio.run(contextualizer.retrieve("and that one?", HISTORY, rewrite, retrieve, speculative=True))
+
+    assert documents == ["When is the graphs lecture?"]
+    assert contextualizer.speculation["misses"] == 1
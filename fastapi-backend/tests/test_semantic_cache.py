@@ -0,0 +1,80 @@
+import numpy as np
+
+from chatbot.utils.semantic_cache import SemanticCache
+
+DIM = 32
+
+
+def _vector(seed):
+    return np.random.default_rng(seed).normal(size=DIM)
+
+
+def _cache(**kwargs):
+    options = {"threshold": 0.95, "max_entries_per_group": 100, "max_bytes": 10_000_000}
+    options.update(kwargs)
+    return SemanticCache(**options)
+
+
+def test_similar_query_hits_and_different_query_misses():
+    cache = _cache()
+    query = _vector(1)
+    cache.store("g", 1, query, {"response": "room b12"})
+
+    paraphrase = query + 0.01 * _vector(2)
+    hit = cache.lookup("g", 1, paraphrase)
+
+    assert hit["response"] == "room b12"
+    assert hit["similarity"] >= 0.95
+    assert cache.lookup("g", 1, _vector(3)) is None
+    assert cache.lookup("other", 1, query) is None
+
+
+def test_kb_version_change_invalidates_the_group():
+    cache = _cache()
+    cache.store("g", 1, _vector(1), {"response": "old"})
+
+    assert cache.lookup("g", 2, _vector(1)) is None
+    assert cache.stats["invalidations"] == 1
+    assert cache.get_stats()["groups"] == 0
+
+
+def test_least_recently_used_entry_is_evicted_per_group():
+    cache = _cache(max_entries_per_group=2)
+    cache.store("g", 1, _vector(1), {"response": "one"})
+    cache.store("g", 1, _vector(2), {"response": "two"})
+    cache.lookup("g", 1, _vector(1))  # "one" is now the most recently used
+
+    cache.store("g", 1, _vector(3), {"response": "three"})
+
+    assert cache.lookup("g", 1, _vector(1))["response"] == "one"
+    assert cache.lookup("g", 1, _vector(2)) is None
+    assert cache.lookup("g", 1, _vector(3))["response"] == "three"
+
+
+def test_size_counts_allocated_capacity():
+    cache = _cache()
+    for seed in range(17):
+        cache.store("g", 1, _vector(seed), {"response": "x"})
+    group = cache._groups["g"]
+
+    assert len(group.matrix) > group.count
+    assert group.nbytes == group.matrix.nbytes + group.last_used.nbytes + sum(group.sizes)
+
+
+def test_byte_budget_evicts_across_groups():
+    cache = _cache(max_bytes=6_000)
+    for group in range(5):
+        cache.store(f"g{group}", 1, _vector(group), {"response": "y" * 200})
+
+    assert cache.nbytes <= 6_000
+    assert cache.lookup("g4", 1, _vector(4)) is not None  # newest group survives
+    assert cache.lookup("g0", 1, _vector(0)) is None
+
+
+def test_dimension_change_restarts_the_group():
+    cache = _cache()
+    cache.store("g", 1, _vector(1), {"response": "old model"})
+    cache.store("g", 1, np.ones(DIM * 2), {"response": "new model"})
+
+    assert cache.lookup("g", 1, np.ones(DIM * 2))["response"] == "new model"
+    assert cache.get_stats()["entries"] == 1
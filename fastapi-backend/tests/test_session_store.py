@@ -0,0 +1,79 @@
+from chatbot.services import session_store
+from chatbot.services.session_store import AI, HUMAN, ConversationHistory, SessionStore
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _store(monkeypatch, clock=None, **kwargs) -> SessionStore:
+    if clock is not None:
+        monkeypatch.setattr(session_store.time, "monotonic", clock)
+    options = dict(max_entries=100, idle_ttl=60.0, max_bytes=10_000, sizeof=lambda value: len(value))
+    options.update(kwargs)
+    return SessionStore(**options)
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    store = _store(monkeypatch, max_entries=2)
+    store.set("a", "1")
+    store.set("b", "2")
+    store.get("a")
+
+    store.set("c", "3")
+
+    assert "b" not in store
+    assert store.get("a") == "1" and store.get("c") == "3"
+    assert store.stats["evicted_lru"] == 1
+
+
+def test_idle_entries_expire(monkeypatch):
+    clock = _Clock()
+    store = _store(monkeypatch, clock)
+    store.set("old", "1")
+    clock.now += 30
+    store.set("recent", "2")
+    clock.now += 40
+
+    assert store.get("old") is None
+    assert store.get("recent") == "2"
+    assert store.stats["evicted_idle"] == 1
+
+
+def test_byte_budget_keeps_the_newest_entry(monkeypatch):
+    store = _store(monkeypatch, max_bytes=10)
+    store.set("a", "x" * 6)
+    store.set("b", "x" * 6)
+
+    assert len(store) == 1 and store.get("b") == "x" * 6
+    assert store.total_bytes == 6
+
+    store.set("c", "x" * 50)
+    assert len(store) == 1 and store.total_bytes == 50
+    assert store.stats["evicted_bytes"] == 2
+
+
+def test_touch_remeasures_a_growing_history(monkeypatch):
+    store = _store(monkeypatch, sizeof=session_store._default_sizeof, max_bytes=1_000)
+    small, growing = ConversationHistory(), ConversationHistory()
+    store.set("small", small)
+    store.set("growing", growing)
+
+    growing.add_user_message("x" * 2_000)
+    store.touch("growing")
+
+    assert "small" not in store
+    assert store.total_bytes == growing.size_bytes
+
+
+def test_history_builds_messages_from_records():
+    history = ConversationHistory([(HUMAN, "question"), (AI, "answer")], summary=("earlier", "digest"))
+
+    assert [type(message).__name__ for message in history.messages] == ["HumanMessage", "AIMessage"]
+    assert history.summary == ("earlier", "digest")
+    history.clear()
+    assert len(history) == 0
@@ -0,0 +1,33 @@
+import asyncio
+
+from chatbot.utils.shared_cache import SharedResponseCache, normalize_query
+
+
+def test_queries_are_normalized():
+    assert normalize_query("  When is the MIDTERM?! ") == "when is the midterm"
+
+
+def test_workers_share_answers_until_the_knowledge_base_changes(tmp_path):
+    db_path = str(tmp_path / "shared.db")
+
+    async def scenario():
+        first = SharedResponseCache(db_path, ttl=60, l1_size=10, version_ttl=0)
+        second = SharedResponseCache(db_path, ttl=60, l1_size=10, version_ttl=0)
+        key = await first.make_key("g", "When is the midterm?")
+        await first.set(key, {"response": "Friday"})
+
+        same_key = await second.make_key("g", "when is the midterm")
+        shared = await second.get(same_key)
+        await first.bump_kb_version("g")
+        stale = await second.get(await second.make_key("g", "when is the midterm"))
+        stats = second.get_stats()
+        first.close()
+        second.close()
+        return key == same_key, shared, stale, stats
+
+    same_key, shared, stale, stats = asyncio.run(scenario())
+
+    assert same_key
+    assert shared == {"response": "Friday"}
+    assert stale is None
+    assert stats["l2_hits"] == 1 and stats["misses"] == 1
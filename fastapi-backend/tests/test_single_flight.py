@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from chatbot.utils.single_flight import FlightAbandoned, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats == {"calls": 5, "executions": 1, "coalesced": 4}
+    assert flight.get_stats()["inflight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("answer", True)
+
+
+def test_errors_reach_every_caller_and_the_key_is_released():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        retry = await flight.do("key", _value("recovered"))
+        return results, retry
+
+    results, retry = asyncio.run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retry == "recovered"
+
+
+def test_leader_resolves_the_flight_for_followers():
+    async def scenario():
+        flight = SingleFlight()
+        future = flight.lead("key")
+        assert flight.lead("key") is None
+        follower = asyncio.ensure_future(flight.do("key", _value("unused")))
+        await asyncio.sleep(0)
+        future.set_result("streamed answer")
+        return await follower, flight.inflight("key")
+
+    assert asyncio.run(scenario()) == ("streamed answer", None)
+
+
+def test_abandoned_leader_releases_followers():
+    async def scenario():
+        flight = SingleFlight()
+        future = flight.lead("key")
+        follower = asyncio.ensure_future(flight.do("key", _value("unused")))
+        await asyncio.sleep(0)
+        future.set_exception(FlightAbandoned())
+        with pytest.raises(FlightAbandoned):
+            await follower
+        return flight.lead("key")
+
+    assert asyncio.run(scenario()) is not None
+
+
+def _value(value):
+    async def fn():
+        return value
+
+    return fn
@@ -0,0 +1,89 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from chatbot.api import documents
+from chatbot.core.config import settings
+
+LIMIT = 4096
+
+
+class _Queue:
+    def __init__(self, upload_dir):
+        self.upload_dir = upload_dir
+        self.paths = []
+        self.submitted = []
+
+    def new_upload_path(self, suffix):
+        path = os.path.join(self.upload_dir, f"{len(self.paths)}{suffix}")
+        self.paths.append(path)
+        return path
+
+    async def submit(self, group_id, filename, file_type, file_path, file_size=None, file_digest=None):
+        self.submitted.append((file_path, file_size, file_digest))
+        return {"job_id": "j", "group_id": group_id, "filename": filename, "file_type": file_type.value,
+                "status": "queued", "file_size": file_size}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "max_file_size", LIMIT)
+    queue = _Queue(str(tmp_path))
+
+    async def get_ingest_queue():
+        return queue
+
+    monkeypatch.setattr(documents, "get_ingest_queue", get_ingest_queue)
+    app = FastAPI()
+    app.include_router(documents.router, prefix="/rag")
+    with TestClient(app) as client:
+        client.queue = queue
+        yield client
+
+
+def test_upload_within_the_limit_is_spooled_and_queued(client):
+    data = b"x" * LIMIT
+
+    response = client.post("/rag/knowledge-base/upload", files={"file": ("notes.txt", data)})
+
+    assert response.status_code == 202
+    (path, size, digest), = client.queue.submitted
+    assert (size, digest) == (LIMIT, hashlib.sha256(data).hexdigest())
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+def test_oversized_content_length_is_rejected_before_parsing(client):
+    body = b"x" * (LIMIT + documents.UPLOAD_FORM_OVERHEAD + 1)
+
+    response = client.post(
+        "/rag/knowledge-base/upload", content=body,
+        headers={"content-type": "multipart/form-data; boundary=b"},
+    )
+
+    assert response.status_code == 413
+    assert client.queue.paths == []
+
+
+def test_oversized_chunked_body_is_rejected_while_reading(client):
+    def chunks():
+        for _ in range(100):
+            yield b"x" * documents.UPLOAD_FORM_OVERHEAD
+
+    response = client.post(
+        "/rag/knowledge-base/upload", content=chunks(),
+        headers={"content-type": "multipart/form-data; boundary=b"},
+    )
+
+    assert response.status_code == 413
+    assert client.queue.paths == []
+
+
+def test_file_just_over_the_limit_is_rejected_by_the_spooler(client):
+    response = client.post("/rag/knowledge-base/upload", files={"file": ("notes.txt", b"x" * (LIMIT + 1))})
+
+    assert response.status_code == 413
+    assert client.queue.submitted == [] and not any(os.path.exists(path) for path in client.queue.paths)
@@ -0,0 +1,128 @@
+import asyncio
+
+from chatbot.services import usage_service
+from chatbot.services.usage_service import UsageCounterService
+
+TODAY = "2026-03-02"
+
+
+class _FakeFirestore:
+    """One group document with the same merge/transaction semantics the service relies on"""
+
+    available = True
+
+    def __init__(self, ai_usage=None):
+        self.doc = {"aiUsage": dict(ai_usage or {})}
+        self.fail = False
+        self.batches = 0
+        self.transactions = 0
+        self._lock = asyncio.Lock()
+
+    async def get_group(self, group_id):
+        return {"aiUsage": dict(self.doc["aiUsage"])}
+
+    async def batch_merge_groups(self, updates):
+        if self.fail:
+            raise RuntimeError("unavailable")
+        self.batches += 1
+        for data in updates.values():
+            for field, value in data["aiUsage"].items():
+                increment = getattr(value, "value", None)
+                stored = self.doc["aiUsage"]
+                stored[field] = stored.get(field, 0) + increment if increment is not None else value
+
+    async def add_group_usage(self, group_id, date_key, deltas):
+        if self.fail:
+            raise RuntimeError("unavailable")
+        async with self._lock:
+            self.transactions += 1
+            current = self.doc["aiUsage"] if self.doc["aiUsage"].get("dateKey") == date_key else {}
+            stored = {"dateKey": date_key}
+            for field, delta in deltas.items():
+                stored[field] = current.get(field, 0) + delta
+            await asyncio.sleep(0)
+            self.doc["aiUsage"] = stored
+            return stored
+
+
+def _service(db, monkeypatch, limit=100):
+    monkeypatch.setattr(usage_service, "_today_str", lambda: TODAY)
+    return UsageCounterService(db, limit)
+
+
+def test_same_day_deltas_are_flushed_as_increments(monkeypatch):
+    db = _FakeFirestore({"dateKey": TODAY, "explainCallsToday": 5, "notesCallsToday": 1})
+    service = _service(db, monkeypatch)
+
+    async def scenario():
+        for _ in range(3):
+            await service.try_consume("g", "@explain")
+        await service.try_consume("g", "@notes")
+        await service.flush()
+
+    asyncio.run(scenario())
+
+    assert db.doc["aiUsage"] == {"dateKey": TODAY, "explainCallsToday": 8, "notesCallsToday": 2}
+    assert db.batches == 1 and db.transactions == 0
+    assert service.get_stats()["pending_calls"] == 0
+
+
+def test_workers_rolling_over_the_day_keep_each_others_counts(monkeypatch):
+    db = _FakeFirestore({"dateKey": "2026-03-01", "explainCallsToday": 9, "notesCallsToday": 3})
+    first, second = _service(db, monkeypatch), _service(db, monkeypatch)
+
+    async def scenario():
+        for _ in range(3):
+            await first.try_consume("g", "@explain")
+        for _ in range(2):
+            await second.try_consume("g", "@notes")
+        await asyncio.gather(first.flush(), second.flush())
+
+    asyncio.run(scenario())
+
+    assert db.doc["aiUsage"] == {"dateKey": TODAY, "explainCallsToday": 3, "notesCallsToday": 2}
+    assert db.transactions == 2
+
+
+def test_failed_flush_keeps_the_deltas_for_the_next_one(monkeypatch):
+    db = _FakeFirestore({"dateKey": TODAY, "explainCallsToday": 0})
+    service = _service(db, monkeypatch)
+
+    async def scenario():
+        await service.try_consume("g", "@explain")
+        db.fail = True
+        await service.flush()
+        pending = service.get_stats()["pending_calls"]
+        db.fail = False
+        await service.flush()
+        return pending
+
+    assert asyncio.run(scenario()) == 1
+    assert db.doc["aiUsage"]["explainCallsToday"] == 1
+    assert service.stats["flush_errors"] == 1
+
+
+def test_daily_limit_is_enforced_locally(monkeypatch):
+    db = _FakeFirestore({"dateKey": TODAY, "explainCallsToday": 1, "notesCallsToday": 0})
+    service = _service(db, monkeypatch, limit=3)
+
+    async def scenario():
+        return [await service.try_consume("g", "@explain") for _ in range(4)]
+
+    assert asyncio.run(scenario()) == [True, True, False, False]
+
+
+def test_rollover_counts_calls_other_workers_made_today(monkeypatch):
+    db = _FakeFirestore({"dateKey": "2026-03-01", "explainCallsToday": 0})
+    day = ["2026-03-01"]
+    monkeypatch.setattr(usage_service, "_today_str", lambda: day[0])
+    service = UsageCounterService(db, 3)
+
+    async def scenario():
+        await service.try_consume("g", "@explain")
+        day[0] = TODAY
+        db.doc["aiUsage"] = {"dateKey": TODAY, "explainCallsToday": 2, "notesCallsToday": 0}
+        return [await service.try_consume("g", "@explain") for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [True, False]
+    assert service.stats["remote_reads"] == 2
@@ -15,6 +15,7 @@ import {
 const ChatRoom = ({ scroll }) => {
   const [messages, setMessages] = useState([]);
   const [botTyping, setBotTyping] = useState(false); // ⬅️ moved here
+  const [botDraft, setBotDraft] = useState(null); // { name, text } of a bot reply still streaming in
   const { chatType, selectedUserId } = useUser();
 
   useEffect(() => {
@@ -67,7 +68,7 @@ const ChatRoom = ({ scroll }) => {
     if (scroll.current) {
       scroll.current.scrollIntoView({ behavior: "smooth" });
     }
-  }, [messages]);
+  }, [messages, botDraft]);
 
   return (
     <>
@@ -87,10 +88,14 @@ const ChatRoom = ({ scroll }) => {
                 </div>
                 <div className="dark:bg-gray-700 bg-gray-800 text-white p-3 rounded-lg max-w-[70%]">
                   <div className="flex items-center gap-2 text-xs text-gray-300 mb-1">
-                    <span className="font-bold text-teal-300">ExplainBot</span>
+                    <span className="font-bold text-teal-300">{botDraft?.name || "ExplainBot"}</span>
                     <span>AI</span>
                   </div>
-                  <div className="text-sm opacity-80">typing…</div>
+                  {botDraft?.text ? (
+                    <div className="text-sm whitespace-pre-wrap">{botDraft.text}</div>
+                  ) : (
+                    <div className="text-sm opacity-80">typing…</div>
+                  )}
                 </div>
               </div>
             )}
@@ -99,7 +104,7 @@ const ChatRoom = ({ scroll }) => {
           </div>
           {/* Input */}
           <div className="w-full">
-            <SendMessage scroll={scroll} setBotTyping={setBotTyping} />
+            <SendMessage scroll={scroll} setBotTyping={setBotTyping} setBotDraft={setBotDraft} />
           </div>
         </div>
       ) : (
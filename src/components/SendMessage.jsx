@@ -7,9 +7,9 @@ import { useUser } from "../context/UserContext";
 import createConversationId from "../lib/SortingUserId";
 import { FileUploader } from "@/Cloudinary/FileUploader";
 import { useUserVisibility } from "../context/userVisibilityContext";
-import { callExplainBot, callHelpBot } from "../services/botService";
+import { askBot } from "../services/botService";
 
-const SendMessage = ({ scroll, setBotTyping }) => {
+const SendMessage = ({ scroll, setBotTyping, setBotDraft }) => {
   const [message, setMessage] = useState("");
   const [selectedFile, setSelectedFile] = useState(null);
   const [FileDownloadUrl, setFileDownloadUrl] = useState(null);
@@ -108,6 +108,7 @@ const SendMessage = ({ scroll, setBotTyping }) => {
         const hasHelp = message.toLowerCase().includes("@help");
         if (hasExplain || hasHelp) {
           setBotTyping(true);
+          setBotDraft(null);
 
           // Prepare timeout id BEFORE callbacks use it
           let timeoutId;
@@ -127,6 +128,7 @@ const SendMessage = ({ scroll, setBotTyping }) => {
             const ts = data?.createAt?.seconds ? data.createAt.seconds * 1000 : 0;
             if (isBot && ts >= startedAt - 2000) {
               setBotTyping(false);
+              setBotDraft(null);
               unsubscribe();
               if (timeoutId) clearTimeout(timeoutId);
             }
@@ -135,20 +137,32 @@ const SendMessage = ({ scroll, setBotTyping }) => {
           // ⏳ Fallback: stop typing after 20s if no bot reply
           timeoutId = setTimeout(() => {
             setBotTyping(false);
+            setBotDraft(null);
             unsubscribe();
           }, 20000);
 
           try {
             const apiUrl = import.meta.env.VITE_BOT_API_URL || 'http://localhost:8000';
             console.log("Calling bot API…", { url: apiUrl, groupId, userId: uid });
-            if (hasExplain) {
-              await callExplainBot({ message, groupId, userId: uid, username: displayName || "User", context: [] });
-            } else if (hasHelp) {
-              await callHelpBot({ message, groupId, userId: uid, username: displayName || "User", context: [] });
-            }
+            // Show the reply as it streams in; the bubble goes away once the stored bot message arrives
+            const name = hasExplain ? "ExplainBot" : "HelpBot";
+            let text = "";
+            await askBot({
+              message,
+              groupId,
+              userId: uid,
+              username: displayName || "User",
+              context: [],
+              onToken: (token) => {
+                text += token;
+                setBotDraft({ name, text });
+              },
+            });
           } catch (err) {
             console.error("Bot error:", err);
             setBotTyping(false);
+            setBotDraft(null);
+            unsubscribe();
             if (timeoutId) clearTimeout(timeoutId);
           }
         }
@@ -162,6 +176,7 @@ const SendMessage = ({ scroll, setBotTyping }) => {
     } catch (error) {
       console.error("Error sending message:", error);
       setBotTyping(false);
+      setBotDraft(null);
     }
   };
 
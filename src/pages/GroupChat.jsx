@@ -157,8 +157,21 @@ const GroupChat = () => {
         }
         throw new Error(errorMsg);
       }
-      const json = await res.json();
-      setUploadMsg(`Uploaded: ${json.filename} (${json.chunk_count} chunks)`);
+      // The backend queues the document and returns a job; poll it until ingestion finishes
+      let job = await res.json();
+      while (job.status === "queued" || job.status === "running") {
+        setUploadMsg(job.status === "queued"
+          ? "Queued for processing..."
+          : `Processing: ${job.pages_parsed} pages parsed, ${job.vectors_upserted} chunks indexed`);
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobRes = await fetch(`${api}/rag/knowledge-base/jobs/${job.job_id}`);
+        if (!jobRes.ok) throw new Error(`Checking upload status failed: ${jobRes.status}`);
+        job = await jobRes.json();
+      }
+      if (job.status !== "succeeded") {
+        throw new Error(`Upload ${job.status}${job.error ? ` - ${job.error}` : ""}`);
+      }
+      setUploadMsg(`Uploaded: ${job.filename} (${job.result.chunk_count} chunks)`);
       setTimeout(() => { setUploadOpen(false); }, 2000);
     } catch (e) {
       console.error("Upload error:", e);
@@ -24,4 +24,182 @@ export async function callExplainBot({ message, groupId, userId, username, conte
 export async function callHelpBot({ message, groupId, userId, username, context = [] }) {
     // Uses same /chat, but expects the message to contain @help which backend routes to RAG
     return callExplainBot({ message, groupId, userId, username, context });
-}
\ No newline at end of file
+}
+
+// Streams a bot reply from /chat/stream (Server-Sent Events over a POST).
+// onToken is called with each text chunk as it arrives; resolves with the final bot response.
+// Pass an AbortSignal to stop reading the stream.
+export async function streamBot({ message, groupId, userId, username, context = [], onToken, signal }) {
+    const res = await fetch(`${BOT_API_URL}/chat/stream`, {
+        method: 'POST',
+        signal,
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify({
+            message,
+            group_id: groupId,
+            user_id: userId,
+            username,
+            context: Array.isArray(context) ? context.slice(-10) : []
+        })
+    });
+
+    if (!res.ok || !res.body) {
+        const detail = await res.text().catch(() => '');
+        throw new Error(`Bot API error: ${res.status} ${detail}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let final = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            const payload = data ? JSON.parse(data) : {};
+
+            if (event === 'token') onToken?.(payload.text);
+            else if (event === 'done') final = payload;
+            else if (event === 'error') throw new Error(payload.detail || 'Bot stream error');
+        }
+    }
+
+    return final; // { response, bot_name, timestamp, group_id, user_id, username }
+}
+
+
+const abortError = () => new DOMException('Bot request cancelled', 'AbortError');
+// The socket could not carry a request (connect failed or it closed); askBot() falls back to HTTP
+const socketError = (message) => Object.assign(new Error(message), { name: 'BotSocketError' });
+
+// Persistent bot channel over /ws. One socket per client session; concurrent
+// bot requests are multiplexed by request_id. Pass an AbortSignal to ask() to
+// cancel a request; its promise then rejects with an AbortError.
+export class BotSocket {
+    constructor() {
+        this.ws = null;
+        this.pending = new Map(); // request_id -> { resolve, reject, onToken, onEvent }
+        this.counter = 0;
+    }
+
+    connect() {
+        if (this.ws && this.ws.readyState <= WebSocket.OPEN) return this.ready;
+        const ws = new WebSocket(BOT_API_URL.replace(/^http/, 'ws') + '/ws');
+        this.ws = ws;
+        this.ready = new Promise((resolve, reject) => {
+            ws.onopen = () => resolve();
+            ws.onerror = () => reject(socketError('Bot socket connection failed'));
+            ws.onclose = () => {
+                reject(socketError('Bot socket closed'));
+                for (const { reject: rejectRequest } of this.pending.values()) rejectRequest(socketError('Bot socket closed'));
+                this.pending.clear();
+                if (this.ws === ws) this.ws = null;
+            };
+        });
+        ws.onmessage = (msg) => this._dispatch(JSON.parse(msg.data));
+        return this.ready;
+    }
+
+    _send(type, data) {
+        this.ws.send(JSON.stringify({ type, data, timestamp: new Date().toISOString() }));
+    }
+
+    _dispatch({ type, data }) {
+        const entry = this.pending.get(data.request_id);
+        if (!entry) return;
+        if (type === 'token') entry.onToken?.(data.text);
+        else if (type === 'done') {
+            this.pending.delete(data.request_id);
+            entry.resolve(data);
+        } else if (type === 'error') {
+            this.pending.delete(data.request_id);
+            entry.reject(new Error(`Bot API error: ${data.status_code} ${data.detail}`));
+        } else if (type === 'progress' && data.stage === 'cancelled') {
+            this.pending.delete(data.request_id);
+            entry.reject(abortError());
+        } else entry.onEvent?.(type, data); // typing / progress
+    }
+
+    async ask({ message, groupId, userId, username, context = [], onToken, onEvent, signal }) {
+        if (signal?.aborted) throw abortError();
+        await this.connect();
+        const requestId = `${Date.now()}-${++this.counter}`;
+        const result = new Promise((resolve, reject) => {
+            this.pending.set(requestId, { resolve, reject, onToken, onEvent });
+        });
+        if (signal) {
+            const onAbort = () => this.cancel(requestId);
+            signal.addEventListener('abort', onAbort, { once: true });
+            result.then(
+                () => signal.removeEventListener('abort', onAbort),
+                () => signal.removeEventListener('abort', onAbort)
+            );
+        }
+        this._send('message', {
+            request_id: requestId,
+            message,
+            group_id: groupId,
+            user_id: userId,
+            username,
+            context: Array.isArray(context) ? context.slice(-10) : []
+        });
+        return result;
+    }
+
+    // Settles the request right away; the server's "cancelled" progress event then finds nothing pending.
+    cancel(requestId) {
+        const entry = this.pending.get(requestId);
+        if (!entry) return;
+        this.pending.delete(requestId);
+        entry.reject(abortError());
+        if (this.ws?.readyState === WebSocket.OPEN) this._send('cancel', { request_id: requestId });
+    }
+
+    close() {
+        this.ws?.close();
+    }
+}
+
+const SOCKET_RETRY_MS = 30000;
+let sharedSocket = null;
+let socketRetryAt = 0;
+
+// Sends a bot mention over the page's shared BotSocket, streaming tokens to onToken.
+// Falls back to POST /chat/stream when the socket can't be opened or drops before the
+// first token, and skips the socket for SOCKET_RETRY_MS after such a failure.
+export async function askBot({ onToken, onEvent, signal, ...request }) {
+    if (typeof WebSocket !== 'undefined' && Date.now() >= socketRetryAt) {
+        sharedSocket ??= new BotSocket();
+        let streamed = false;
+        try {
+            return await sharedSocket.ask({
+                ...request,
+                onEvent,
+                signal,
+                onToken: (text) => {
+                    streamed = true;
+                    onToken?.(text);
+                }
+            });
+        } catch (err) {
+            // After the first token, retrying over HTTP would repeat the reply
+            if (err.name !== 'BotSocketError' || streamed) throw err;
+            console.warn('Bot socket unavailable, falling back to HTTP:', err.message);
+            socketRetryAt = Date.now() + SOCKET_RETRY_MS;
+        }
+    }
+    return streamBot({ ...request, onToken, signal });
+}